@@ -23,9 +23,16 @@ from synchronous_unshared import *
 def BIT(m, p): # Returns the p+1'th least significant bit of 'm', p>=0
 	return (m >> p) & 1
 
-def COMPLEMENTA(m, p):
-	if BIT(m, p) == 0: return m + 2**p
-	else:              return m - 2**p
+def MIN(a, b): # Minimum of 'a' and 'b', elementwise on arrays (batches of instances)
+	if getattr(a, 'ndim', 0) or getattr(b, 'ndim', 0): return np.minimum(a, b)
+	return min(a, b)
+
+def MAX(a, b): # Maximum of 'a' and 'b', elementwise on arrays (batches of instances)
+	if getattr(a, 'ndim', 0) or getattr(b, 'ndim', 0): return np.maximum(a, b)
+	return max(a, b)
+
+def COMPLEMENTA(m, p): # Returns 'm' with its p+1'th least significant bit complemented
+	return m ^ 2**p
 
 
 class MyHypercube(Hypercube):
@@ -34,8 +41,8 @@ class MyHypercube(Hypercube):
 	## SUMMATION ON HYPERCUBE
 	########################################################################
 	#;; SUM_HYPERCUBE
-	def SUM_HYPERCUBE(self, propagate=False):
-		k = self.k
+	def SUM_HYPERCUBE(self, propagate=False, k=None):
+		k = self.k if k is None else k   # Dimension of the subcube of processor 0
 		
 		# Summation
 		for d in reversed(range(k)):
@@ -69,11 +76,11 @@ class MyHypercube(Hypercube):
 					if h % (2*d) < d:
 						t = P.getfrom('a', h + d)
 						if h % 2**(i+2) < 2**(i+1):
-							P['b'] = max(P['a'], t)
-							P['a'] = min(P['a'], t)
+							P['b'] = MAX(P['a'], t)
+							P['a'] = MIN(P['a'], t)
 						else:
-							P['b'] = min(P['a'], t)
-							P['a'] = max(P['a'], t)
+							P['b'] = MIN(P['a'], t)
+							P['a'] = MAX(P['a'], t)
 					else:
 						P['a'] = P.getfrom('b', h - d, getnew=True)
 	#;;
@@ -159,6 +166,181 @@ if __name__ == '__main__':
 	# h.M.sort(key=lambda p: p.a)   # <-- Python's sorting is far faster!!
 	print ('Resulting', h.str_variable('a'))
 	assert([ h.M[i]['a'] for i in range(len(h.M)) ] == correctorder)
+	
+	# Compiled bodies access variables by slot, other code still by name
+	assert slotnames[SLOT_a] == 'a'
+	assert h.M[3][SLOT_a] == h.M[3]['a']
+	h.forall_do_in_parallel(range(len(h.M)), lambda P, i: P.__setitem__('parity' + str(i % 2), P[SLOT_a] + P.getfrom('a', i ^ 1)))
+	assert h.M[4]['parity0'] == h.M[5]['parity1'] == correctorder[4] + correctorder[5]
+	# ... also on NumPy arrays, indexed by slot, widened when a value doesn't fit
+	h2 = MyHypercube(4, backend='numpy')
+	h2.store.fill('a', correctorder)
+	h2.forall_do_in_parallel(range(len(h2.M)), lambda P, i: P.__setitem__(SLOT_a, P[SLOT_a] + P.getfrom(SLOT_a, i ^ 1) / 2.0))
+	assert [ h2.M[i]['a'] for i in range(len(h2.M)) ] == [ correctorder[i] + correctorder[i ^ 1] / 2.0 for i in range(len(h2.M)) ]
+	h2.forall_do_in_parallel(range(len(h2.M)), lambda P, i: P.__setitem__(SLOT_a, i * 2**70))
+	assert h2.M[3]['a'] == 3 * 2**70
+
+
+	########################################################################
+	## Testing WORKER PROCESSES ON HYPERCUBE
+	########################################################################
+	h = MyHypercube(5)
+	h.workers = 3
+	h.randomfeed(-20,20)
+	correctsum = sum([ h.M[i]['a'] for i in range(len(h.M)) ])
+	correctorder = sorted([ h.M[i]['a'] for i in range(len(h.M)) ])
+	print ("\nTesting worker processes on", h.str_variable('a'))
+	print ('Executing SUM_HYPERCUBE...')
+	h.SUM_HYPERCUBE(True)
+	print ('Resulting', h.str_variable('a'))
+	assert([ h.M[i]['a'] for i in range(len(h.M)) ] == [ correctsum ] * len(h.M))
+	for i, v in enumerate(random.sample(correctorder, len(h.M))):
+		h.M[i]['a'] = v
+	print ('Executing BITONIC_MERGESORT_HYPERCUBE...')
+	h.BITONIC_MERGESORT_HYPERCUBE()
+	print ('Resulting', h.str_variable('a'))
+	assert([ h.M[i]['a'] for i in range(len(h.M)) ] == correctorder)
+
+
+	########################################################################
+	## Testing NUMPY STATE STORE ON HYPERCUBE
+	########################################################################
+	h = MyHypercube(10, backend='numpy')
+	h.randomfeed(-1000, 1000)
+	values = h.variable('a')
+	print ('\nTesting the numpy state store on a hypercube of', len(h.M), 'processors')
+	print ('Executing SUM_HYPERCUBE...')
+	h.SUM_HYPERCUBE(True)
+	assert h.variable('a') == [ sum(values) ] * len(h.M)
+	for i, v in enumerate(values):
+		h.M[i]['a'] = v
+	print ('Executing BITONIC_MERGESORT_HYPERCUBE...')
+	h.BITONIC_MERGESORT_HYPERCUBE()
+	assert h.variable('a') == sorted(values)
+	assert h.store.data['a'].dtype.kind == 'i'
+	
+	
+	# Vectorized steps give the same results
+	for k in (4, 10):
+		h1, h2 = MyHypercube(k, backend='numpy'), MyHypercube(k, backend='numpy')
+		h2.vectorize = True
+		h1.randomfeed(-1000, 1000)
+		values = h1.variable('a')
+		h2.store.fill('a', values)
+		print ('Executing BITONIC_MERGESORT_HYPERCUBE and SUM_HYPERCUBE with vectorized steps on', len(h2.M), 'processors...')
+		for h in (h1, h2):
+			h.BITONIC_MERGESORT_HYPERCUBE()
+		assert h1.variable('a') == h2.variable('a') == sorted(values)
+		for h in (h1, h2):
+			h.SUM_HYPERCUBE(True)
+		assert h1.variable('a') == h2.variable('a') == [ sum(values) ] * len(h1.M)
+		assert h1.steps == h2.steps
+		assert len(h2.unvectorizable) == 1   # Only the branching body of the mergesort
+	
+	# With 'processors' set, steps run in chunks of that many processors
+	for vectorize in (False, True):
+		h1, h2 = MyHypercube(6, backend='numpy'), MyHypercube(6, backend='numpy', processors=16)
+		h2.vectorize = vectorize
+		h1.randomfeed(-1000, 1000)
+		values = h1.variable('a')
+		h2.store.fill('a', values)
+		chunks = []
+		def count(P, h):
+			chunks.append(len(np.atleast_1d(h)))
+		print ('Executing BITONIC_MERGESORT_HYPERCUBE in chunks of 16 processors (vectorize=%s)...' % vectorize)
+		for h in (h1, h2):
+			h.BITONIC_MERGESORT_HYPERCUBE()
+		assert h1.variable('a') == h2.variable('a') == sorted(values)
+		assert h1.steps == h2.steps and h2.time == 4 * h2.steps    # <-- Steps of 64 processors
+		for h in (h1, h2):
+			h.SUM_HYPERCUBE(True)
+		assert h1.variable('a') == h2.variable('a') == [ sum(values) ] * len(h1.M)
+		h2.forall_do_in_parallel(range(40), count)
+		assert chunks == ([ 16, 16, 8 ] if vectorize else [ 1 ] * 40)
+	
+	# A body reading values written in its own step raises NotVectorizable,
+	# and runs one processor at a time as without 'vectorize'
+	h1, h2 = MyHypercube(4, backend='numpy'), MyHypercube(4, backend='numpy')
+	h2.vectorize = True
+	h1.randomfeed(-1000, 1000)
+	values = h1.variable('a')
+	h2.store.fill('a', values)
+	def exchange(P, h):
+		P['b'] = P['a']
+		P['a'] = P.getfrom('b', h ^ 1, getnew=True)
+	try:
+		h2.procids(0, 0)
+		assert False, 'a hypercube has no processors with two indices'
+	except NotVectorizable:
+		pass
+	print ('Executing BITONIC_MERGESORT_HYPERCUBE and a step that falls back to serial with vectorized steps...')
+	for h in (h1, h2):
+		h.BITONIC_MERGESORT_HYPERCUBE()
+		h.store.fill('b', [ 0 ] * len(h.M))
+		h.forall_do_in_parallel(range(len(h.M)), exchange)
+	assert h1.variable('a') == h2.variable('a')
+	assert h1.variable('b') == h2.variable('b') == sorted(values)
+	assert exchange.__code__ in h2.unvectorizable and len(h2.unvectorizable) == 2
+	
+	# Other errors of a vectorized body are raised, not run again serially
+	def unset(P, h):
+		P['b'] = P['nothing']
+	try:
+		h2.forall_do_in_parallel(range(len(h2.M)), unset)
+		assert False, 'a body reading an unset variable ran'
+	except NotVectorizable:
+		assert False, 'a real error was taken for a body that needs a serial run'
+	except Exception as e:
+		assert 'nothing' in str(e) and unset.__code__ not in h2.unvectorizable
+	
+	# Batches of instances: every processor holds a value per instance
+	h = MyHypercube(6, backend='numpy', batch=200)
+	h.randomfeed(-1000, 1000)
+	values = h.instances('a')
+	print ('Executing BITONIC_MERGESORT_HYPERCUBE and SUM_HYPERCUBE on a batch of', h.batch, 'instances...')
+	h.BITONIC_MERGESORT_HYPERCUBE()
+	assert (h.instances('a') == np.sort(values, axis=1)).all()
+	h.SUM_HYPERCUBE(True)
+	assert (h.instances('a') == values.sum(axis=1)[:, None]).all()
+	h = MyHypercube(6, backend='numpy', batch=200)
+	h.vectorize = True
+	h.store.fill('a', values)
+	h.SUM_HYPERCUBE(True)
+	assert (h.instances('a') == values.sum(axis=1)[:, None]).all()
+	assert h.unvectorizable == set()
+	
+	# Sharded runs: subcubes of 16 processors on 4 worker processes
+	h = MyHypercube(6, backend='numpy')
+	h.randomfeed(-1000, 1000)
+	values = h.variable('a')
+	print ('Executing BITONIC_MERGESORT_HYPERCUBE and SUM_HYPERCUBE on 4 shards...')
+	h.run_sharded(4, h.BITONIC_MERGESORT_HYPERCUBE)
+	assert h.variable('a') == sorted(values)
+	# Only the 3 steps along dimensions 4 and 5 (across subcubes) read new values from other shards
+	assert all(stats['gathers'] == 3 for stats in h.shardstats)
+	h.run_sharded(4, h.SUM_HYPERCUBE, True)
+	assert h.variable('a') == [ sum(values) ] * len(h.M)
+	assert all(stats['gathers'] == 0 for stats in h.shardstats)
+	h = MyHypercube(6, backend='numpy')
+	h.randomfeed(-100, 100)
+	values = h.variable('a')
+	print ("Executing BITONIC_MERGESORT_HYPERCUBE on 4 workers over TCP...")
+	h.run_distributed(4, h.BITONIC_MERGESORT_HYPERCUBE)
+	assert h.variable('a') == sorted(values)
+	assert all(stats['gathers'] == 3 for stats in h.shardstats)
+	
+	# Links are computed, not stored: even huge hypercubes are built at once
+	h = MyHypercube(40, backend='numpy')
+	assert h.adjacent(0, 2**39) and h.adjacent(2**40-1, 2**40-2) and not h.adjacent(1, 2)
+	assert sorted(h.neighbors(5)) == sorted(5 ^ 2**d for d in range(40))
+	
+	# Processors cost nothing until used, on the sparse backend
+	h = MyHypercube(40, backend='sparse')
+	for i in range(2**4):
+		h.M[i]['a'] = i
+	h.SUM_HYPERCUBE(True, 4)
+	assert [ h.M[i]['a'] for i in range(2**4) ] == [ sum(range(2**4)) ] * 2**4
+	assert len(h.store.data['a']) == len(h.store.data['b']) == 2**4
 
 
 	########################################################################
@@ -222,5 +404,51 @@ if __name__ == '__main__':
 	h.MATRIX_MULTIPLICATION_HYPERCUBE()
 	print ('Resulting', h.str_variable('C'))
 	assert([ h.M[i]['C'] for i in range(n*n) ] == correctproduct)
+	
+	# With vectorized steps, every step is run over arrays of processors
+	h = MyHypercube(3*int(log(n,2)), backend='numpy')
+	h.vectorize = True
+	for i in range(n):
+		for j in range(n):
+			h.M[n*i+j]['A'] = a[i][j]
+			h.M[n*i+j]['B'] = b[i][j]
+	print ('Executing MATRIX_MULTIPLICATION_HYPERCUBE with vectorized steps...')
+	h.MATRIX_MULTIPLICATION_HYPERCUBE()
+	assert([ h.M[i]['C'] for i in range(n*n) ] == correctproduct)
+	assert h.unvectorizable == set()
+
+	# Brent's scheduling on 4 physical processors
+	h = MyHypercube(4)
+	h.randomfeed(0, 100)
+	h.processors = 4
+	s = sum(h.variable('a'))
+	h.SUM_HYPERCUBE()
+	print ('\nSUM_HYPERCUBE on 4 processors, steps:', h.steps, 'work:', h.work, 'time:', h.time)
+	assert h.M[0]['a'] == s
+	assert (h.steps, h.work, h.time) == (4, 8+4+2+1, 2+1+1+1)
+
+	# Overlapping steps of two hypercubes in two threads, the first one ends first
+	import threading
+	h1, h2 = MyHypercube(3), MyHypercube(3)
+	for h in (h1, h2):
+		for P in h.M:
+			P['a'] = P.i
+	events = dict((e, threading.Event()) for e in ('h1 inside', 'h2 inside', 'h1 done'))
+	def swap(P, i, inside, wait):
+		if i == 0:
+			events[inside].set()
+			events[wait].wait()
+		P['a'] = P.getfrom('a', i ^ 1)
+	def other():
+		events['h1 inside'].wait()
+		h2.forall_do_in_parallel(range(8), lambda P, i: swap(P, i, 'h2 inside', 'h1 done'))
+	thread = threading.Thread(target=other)
+	thread.start()
+	print ('\nExecuting overlapping steps of two hypercubes in two threads...')
+	h1.forall_do_in_parallel(range(8), lambda P, i: swap(P, i, 'h1 inside', 'h2 inside'))
+	events['h1 done'].set()
+	thread.join()
+	assert h1.variable('a') == [ i ^ 1 for i in range(8) ]
+	assert h2.variable('a') == [ i ^ 1 for i in range(8) ]
 
 	print ("\nAll tests passed successfully!")
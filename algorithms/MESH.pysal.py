@@ -115,4 +115,98 @@ if __name__ == '__main__':
 	print ("Resulting", m)
 	assert([ m.M[i]['c'] for i in range(len(m.M)) ] == correctproduct)
 
+
+	########################################################################
+	## Testing VECTORIZED STEPS ON MESH
+	########################################################################
+	m = MyMesh(64, backend='numpy')
+	m.vectorize = True
+	m.randomfeed(-5, 5, ['a'])
+	correctsum = sum(m.variable('a'))
+	print ("\nExecuting SUM_MESH with vectorized steps on", len(m.M), "processors...")
+	m.SUM_MESH(True)
+	assert m.variable('a') == [ correctsum ] * len(m.M)
+	assert m.unvectorizable == set()
+	
+	m = MyMesh(8, backend='numpy', batch=100)
+	m.randomfeed(-5, 5, ['a'])
+	values = m.instances('a')
+	print ("Executing SUM_MESH on a batch of", m.batch, "instances...")
+	m.SUM_MESH(True)
+	assert (m.instances('a') == values.sum(axis=1)[:, None]).all()
+	
+	m = MyMesh(3, cyclic=True, backend='numpy')
+	m.vectorize = True
+	m.store.fill('a', a)
+	m.store.fill('b', b)
+	print ("Executing MATRIX_MULTIPLICATION_CYCLIC_MESH with vectorized steps...")
+	m.MATRIX_MULTIPLICATION_CYCLIC_MESH()
+	assert m.variable('c') == correctproduct
+
+
+
+	########################################################################
+	## Testing SHARDED RUNS ON MESH
+	########################################################################
+	for backend in ('list', 'numpy'):
+		m = MyMesh(16, backend=backend)
+		m.randomfeed(-5, 5, ['a'])
+		correctsum = sum(m.variable('a'))
+		print ("\nExecuting SUM_MESH on 3 shards of rows,", backend, "backend...")
+		m.run_sharded(3, m.SUM_MESH, True)
+		assert m.variable('a') == [ correctsum ] * len(m.M)
+		assert m.steps == 30
+		
+		m = MyMesh(3, cyclic=True, backend=backend)
+		m.store.fill('a', a)
+		m.store.fill('b', b)
+		print ("Executing MATRIX_MULTIPLICATION_CYCLIC_MESH on 3 shards of rows,", backend, "backend...")
+		m.run_sharded(3, m.MATRIX_MULTIPLICATION_CYCLIC_MESH)
+		assert m.variable('c') == correctproduct
+		assert all(stats['gathers'] == 0 for stats in m.shardstats)
+		
+		m = MyMesh(3, cyclic=True, backend=backend)
+		m.store.fill('a', a)
+		m.store.fill('b', b)
+		print ("Executing MATRIX_MULTIPLICATION_CYCLIC_MESH on 3 workers over TCP,", backend, "backend...")
+		m.run_distributed(3, m.MATRIX_MULTIPLICATION_CYCLIC_MESH)
+		assert m.variable('c') == correctproduct
+		assert all(len(stats['log']) == stats['supersteps'] for stats in m.shardstats)
+		assert all(sent > 0 for stats in m.shardstats for halo, sent, received, seconds in stats['log'])
+	
+	message = [ None, True, 3, -2**40, 0.5, 'abc', [ 1, 2 ], (1, [ 'a', 2.5 ]), { 'a': ([ 4 ], UNSET) } ]
+	assert synchronous_sockets.unpack(synchronous_sockets.pack(message)) == message
+	
+	# Frames not signed with the key of the run are refused, before unpickling
+	import socket, struct
+	a, b = socket.socketpair()
+	synchronous_sockets.send_frame(a, b'x' * 32, 0, synchronous_sockets.pack(message))
+	try:
+		synchronous_sockets.recv_frame(b, b'y' * 32)
+		assert False, 'a frame with a wrong key was accepted'
+	except synchronous_sockets.AuthenticationError:
+		pass
+	a.close()
+	b.close()
+	# ... and so are their headers, before reading the data they announce
+	a, b = socket.socketpair()
+	a.sendall(struct.pack('<II', 0, 2**32-1) + b'x' * 32)
+	try:
+		synchronous_sockets.recv_frame(b, b'y' * 32)
+		assert False, 'a frame header with a wrong key was accepted'
+	except synchronous_sockets.AuthenticationError:
+		pass
+	a.close()
+	b.close()
+	
+	# Without workers, the coordinator gives up after its timeout
+	coordinator = synchronous_sockets.Coordinator(timeout=0.1)
+	try:
+		coordinator.run(2, m, m.MATRIX_MULTIPLICATION_CYCLIC_MESH, ())
+		assert False, 'the coordinator waited for workers that never came'
+	except Exception as e:
+		assert str(e).startswith('Only 0 of 2 workers connected')
+	finally:
+		coordinator.close()
+
 	print ("\nAll tests passed successfully!")
@@ -60,6 +60,50 @@ Quindi, tutti gli eventuali output conterranno un primo elemento `None'.
 """
 
 
+def COIN(i): # Random bit of processor 'i' (one for each processor, if 'i' is an array)
+	if isinstance(i, int): return random.randint(0, 1)
+	else:                  return np.random.randint(0, 2, size=len(i))
+
+def EULER_ARCS(n, edges):
+	"""
+	Vectors of the arcs (from 1) of a tree on nodes 1..n, given its edges
+	as pairs (u,v): each edge gives arcs u->v and v->u. The arcs leaving a
+	node are contiguous, and 'nxt[e]' is the one after 'e' around its tail
+	(circularly). Return (tail, head, twin, nxt), with unused element 0.
+	"""
+	adj = [ [] for v in range(n+1) ]
+	for u, v in edges:
+		adj[u].append(v)
+		adj[v].append(u)
+	tail, head, nxt, arc = [ 0 ], [ 0 ], [ 0 ], {}
+	for u in range(1, n+1):
+		first = len(tail)
+		for v in adj[u]:
+			arc[(u, v)] = len(tail)
+			tail.append(u)
+			head.append(v)
+			nxt.append(len(tail))
+		if adj[u]:
+			nxt[-1] = first
+	twin = [ 0 ] + [ arc[(head[e], tail[e])] for e in range(1, len(tail)) ]
+	return tail, head, twin, nxt
+
+def CSR(n, edges):
+	"""
+	Compressed sparse rows of an undirected graph on nodes 1..n, given its
+	edges as pairs (u,v): the arcs of node v (from 1) go from off[v] to
+	off[v+1]-1, and adj[e] is the head of arc e. Return (off, adj).
+	"""
+	adj = [ [] for v in range(n+1) ]
+	for u, v in edges:
+		adj[u].append(v)
+		adj[v].append(u)
+	off = [ 0, 1 ]
+	for v in range(1, n+1):
+		off.append(off[-1] + len(adj[v]))
+	return off, [ 0 ] + [ w for v in range(1, n+1) for w in adj[v] ]
+
+
 class MyPRAM(PRAM):
 	########################################################################
 	## SUMMATION ON PRAM - O(n) processors
@@ -125,7 +169,24 @@ class MyPRAM(PRAM):
 	#;;
 	
 	
-	## TODO: ASSOCIATIVE OPERATION ON PRAM - OPTIMUM - O(n/logn) processors
+	########################################################################
+	## ASSOCIATIVE OPERATION ON PRAM - OPTIMAL - O(n/logn) processors
+	## IMPORTANT!: It's assumed that both n and n/logn are powers of 2!
+	########################################################################
+	#;; ASSOCIATIVE_OP_PRAM_OPT
+	def ASSOCIATIVE_OP_PRAM_OPT(self, a, n, op):
+		logn = int(math.log(n,2))
+		
+		# Sequential operations: n/logn groups of logn elements each go in parallel
+		forall i where i in range(n, 2*n, logn) do in parallel using a,logn,op:
+			t = a[i]
+			for j in range(i+1, i+logn):
+				t = op(t, a[j])
+			a[i//logn] = t
+		
+		# Now it's like we have n/logn elements to operate on!
+		return self.ASSOCIATIVE_OP_PRAM(a, n//logn, op)
+	#;;
 
 
 	########################################################################
@@ -148,40 +209,105 @@ class MyPRAM(PRAM):
 	#;;
 	
 	
-	## TODO: PREXIX SUM ON PRAM - OPTIMUM - O(n/logn) processors
+	########################################################################
+	## SCAN (PREFIX OPERATION) ON PRAM - Blelloch - O(n) work
+	## Exclusive (or inclusive) scan of a[1..n], in place, with any
+	## associative operation 'op' whose identity is 'identity'. The up-sweep
+	## builds partial results in place, the down-sweep pushes prefixes down.
+	## Unlike PREFIX_SUM_PRAM, it doesn't need an inverse of 'op'.
+	## Note: Assuming n power of 2.
+	########################################################################
+	#;; SCAN_PRAM
+	def SCAN_PRAM(self, a, n, op, identity, inclusive=False):
+		logn = int(math.log(n,2))
+		
+		# Up-sweep: a[k] gets the result of its subtree, in O(logn)
+		for d in range(logn):
+			forall k where k in range(2**(d+1), n+1, 2**(d+1)) do in parallel using a,d,op:
+				a[k] = op(a[k - 2**d], a[k])
+		
+		total = a[n]
+		a[n] = identity
+		
+		# Down-sweep: left children get the prefix of their parent, right
+		# children the prefix of their parent followed by the left subtree
+		for d in reversed(range(logn)):
+			forall k where k in range(2**(d+1), n+1, 2**(d+1)) do in parallel using a,d,op:
+				l, r = a[k - 2**d], a[k]
+				a[k - 2**d] = r
+				a[k] = op(r, l)
+		
+		# Inclusive scan: shift everything left by one
+		if inclusive:
+			forall k where k in range(1, n) do in parallel using a:
+				a[k] = a[k+1]
+			a[n] = total
+		
+		return total
+	#;;
+	
+	
+	########################################################################
+	## SCAN (PREFIX OPERATION) ON PRAM - OPTIMAL - O(n/logn) processors
+	## The groups have g elements, g the largest power of 2 not greater
+	## than logn (g == logn if n/logn is a power of 2).
+	## Note: Assuming n power of 2.
+	########################################################################
+	#;; SCAN_PRAM_OPT
+	def SCAN_PRAM_OPT(self, a, n, op, identity, inclusive=False):
+		g = 1
+		while 2*g <= math.log(n, 2):
+			g *= 2
+		self['B'] = [ identity for i in range(0, n//g+1) ] # Vector for the results of the groups
+		B = self['B'] # Renaming, just for syntactic simplicity
+		
+		# Sequential operations: n/g groups of g elements each go in parallel
+		forall i where i in range(1, n//g+1) do in parallel using a,B,g,op:
+			t = a[(i-1)*g+1]
+			for o in range(1, g):
+				t = op(t, a[(i-1)*g+1 + o])
+			B[i] = t
+		
+		# Now it's like we have n/g elements to scan!
+		total = self.SCAN_PRAM(B, n//g, op, identity)
+		
+		# Sequential scans: every group starts from the result of the previous ones
+		# (loops go over offsets, so that they work on arrays of indices too)
+		forall i where i in range(1, n//g+1) do in parallel using a,B,g,op,inclusive:
+			t = B[i]
+			x = [ a[(i-1)*g+1 + o] for o in range(g) ]
+			for o in range(g):
+				if inclusive:
+					t = op(t, x[o])
+					a[(i-1)*g+1 + o] = t
+				else:
+					a[(i-1)*g+1 + o] = t
+					t = op(t, x[o])
+		
+		return total
+	#;;
 
 
 	########################################################################
 	## TOURNAMENT SORTING - CREW - O(n^2) processors
-	## Note: Assuming n power of 2. It's possible to make a small change
-	## to get rid of this assumption: we should pass to 'proc_tournament_sum'
-	## longer columns of 'V', padded with extra zero's at the end.
+	## Note: n needs not be a power of 2: the segmented reduction pads the
+	## columns of 'V' with extra zero's at the end.
 	########################################################################
 	#;; TOURNAMENT_SORT_CREW
 	def TOURNAMENT_SORT_CREW(self, a, n):
-		self['V'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for 1s and 0s
-		self['S'] = [ None for i in range(0, n+1) ]                            # Vector for column summations
+		self['V'] = [ [ 0 for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for 1s and 0s
 		V = self['V'] # Renaming, just for syntactic simplicity
-		S = self['S'] # Renaming, just for syntactic simplicity
 		
 		# Perform the tournament in O(1)
 		forall (i,j) where i in range(1, n+1) where j in range(1, n+1) do in parallel using a,V:
 			V[i][j] = 1 if a[i] <= a[j] else 0
 		
-		# Perform summations over columns in O(logn)
-		forall i where i in range(1, n+1) do in parallel using V,n,S:
-			# Prepare PRAM for summation
-			csum = [ None for k in range(0, 2*n) ]
-			for k in range(1, n):   csum[k] = 0
-			for k in range(n, 2*n): csum[k] = V[k-n+1][i] # <-- copy i'th column of V
-			self['subsum'] = csum
-			
-			# Execute summation of column
-			S[i] = self.SUM_PRAM(self['subsum'], n)
+		# Perform summations over all columns at once, in O(logn)
+		S = self.segmented_reduce([ V[:,j][1:] for j in range(1, n+1) ], identity=0)
 		
 		# Place every number in the right position in O(1)
 		forall i where i in range(1, n+1) do in parallel using a,S:
-			a[S[i]] = a[i]
+			a[S[i-1]] = a[i]
 		
 		return a
 	#;;
@@ -201,7 +327,27 @@ class MyPRAM(PRAM):
 	#;;
 	
 	
-	## TODO: REPLICATE_OPT - P=O(n/logn)
+	########################################################################
+	## REPLICATE - OPTIMAL - P=O(n/logn)
+	## IMPORTANT!: It's assumed that both n and n/logn are powers of 2!
+	########################################################################
+	#;; REPLICATE_OPT
+	def REPLICATE_OPT(self, cpy, d, n):
+		logn = int(math.log(n,2))
+		
+		# Replicate 'd' in the first cell of each group of logn cells, with
+		# n/logn processors: no cell is both read and written in a step
+		cpy[1] = d
+		for k in range(0, int(math.log(n//logn,2))):
+			forall i where i in range(1, 2**k+1) do in parallel using k,cpy,logn:
+				cpy[(i+2**k-1)*logn+1] = cpy[(i-1)*logn+1]
+		
+		# Sequential copies: every processor fills its own group of logn cells
+		forall i where i in range(1, n//logn+1) do in parallel using cpy,logn:
+			t = cpy[(i-1)*logn+1]
+			for j in range((i-1)*logn+2, i*logn+1):
+				cpy[j] = t
+	#;;
 	
 	
 	########################################################################
@@ -213,11 +359,9 @@ class MyPRAM(PRAM):
 		self['V'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for 1s and 0s
 		self['R'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for row-wise replicas
 		self['C'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for column-wise replicas
-		self['S'] = [ None for i in range(0, n+1) ]                            # Vector for columns summations
 		V = self['V'] # Renaming, just for syntactic similicity
 		R = self['R'] # Renaming, just for syntactic similicity
 		C = self['C'] # Renaming, just for syntactic similicity
-		S = self['S'] # Renaming, just for syntactic similicity
 		
 		# Replication phase: copy each element of 'a' into a row of the matrix R and C
 		forall i where i in range(1, n+1) do in parallel using a,n,R,C:
@@ -228,26 +372,482 @@ class MyPRAM(PRAM):
 		forall (i,j) where i in range(1, n+1) where j in range(1, n+1) do in parallel using a,V,R,C:
 			V[i][j] = 1 if R[i][j] <= C[j][i] else 0
 		
-		# Perform summations over columns in O(logn)
-		forall i where i in range(1, n+1) do in parallel using V,n,S:
-			# Prepare PRAM for summation
-			csum = [ None for k in range(0, 2*n) ]
-			for k in range(1, n):   csum[k] = 0
-			for k in range(n, 2*n): csum[k] = V[k-n+1][i] # <-- copy i'th column of V
-			self['subsum'] = csum
-			
-			# Execute summation of column
-			S[i] = self.SUM_PRAM(self['subsum'], n)
+		# Perform summations over all columns at once, in O(logn)
+		S = self.segmented_reduce([ V[:,j][1:] for j in range(1, n+1) ])
 		
 		# Place every number in the right position in O(1)
 		forall i where i in range(1, n+1) do in parallel using a,S:
-			a[S[i]] = a[i]
+			a[S[i-1]] = a[i]
 		
 		return a
 	#;;
 	
 	
-	## TODO: TOURNAMENT_SORT_OPT - P=O(n**2/logn) with REPLICATE_OPT
+	########################################################################
+	## TOURNAMENT SORTING - OPTIMAL - EREW (with REPLICATE_OPT) - O(n^2/logn) processors
+	## IMPORTANT!: It's assumed that both n and n/logn are powers of 2!
+	########################################################################
+	#;; TOURNAMENT_SORT_OPT
+	def TOURNAMENT_SORT_OPT(self, a, n):
+		logn = int(math.log(n,2))
+		self['V'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for 1s and 0s
+		self['R'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for row-wise replicas
+		self['C'] = [ [ None for i in range(0, n+1) ] for i in range(0, n+1) ] # Matrix for column-wise replicas
+		self['P'] = [ [ 0 for i in range(0, n//logn) ] for i in range(0, n+1) ] # Matrix for partial column summations
+		V = self['V'] # Renaming, just for syntactic similicity
+		R = self['R'] # Renaming, just for syntactic similicity
+		C = self['C'] # Renaming, just for syntactic similicity
+		P = self['P'] # Renaming, just for syntactic similicity
+		
+		# Replication phase: copy each element of 'a' into a row of the matrix R and C
+		forall i where i in range(1, n+1) do in parallel using a,n,R,C:
+			self.REPLICATE_OPT(R[i], a[i], n)
+			self.REPLICATE_OPT(C[i], a[i], n)
+		
+		# Perform the tournament in O(logn): every processor plays logn matches
+		forall (i,g) where i in range(1, n+1) where g in range(1, n+1, logn) do in parallel using logn,V,R,C:
+			for j in range(g, g+logn):
+				V[i][j] = 1 if R[i][j] <= C[j][i] else 0
+		
+		# Sequential sums: every column of V is split in n/logn groups of logn elements
+		forall (j,g) where j in range(1, n+1) where g in range(0, n//logn) do in parallel using logn,V,P:
+			t = 0
+			for i in range(g*logn+1, (g+1)*logn+1):
+				t += V[i][j]
+			P[j][g] = t
+		
+		# Perform summations over all columns at once, in O(logn)
+		S = self.segmented_reduce([ P[j] for j in range(1, n+1) ], identity=0)
+		
+		# Place every number in the right position in O(1)
+		forall i where i in range(1, n+1) do in parallel using a,S:
+			a[S[i-1]] = a[i]
+		
+		return a
+	#;;
+	
+	
+	########################################################################
+	## MERGE SORT - CREW - O(n/logn) processors, O(logn^2) time
+	## Runs of width w = 1, 2, 4, ... are merged in pairs, one level per
+	## iteration. Every processor writes a piece of c output cells (c is the
+	## largest power of 2 not greater than logn, so there are at most 2n/logn
+	## processors at every level): it finds by binary search how many cells
+	## of each run come before its piece (merge path), then merges them
+	## sequentially; while 2w < c its piece holds c/2w whole pairs, merged one
+	## after the other. So every level does O(n) work, and the whole sort
+	## O(nlogn). Any n is allowed.
+	########################################################################
+	#;; MERGE_SORT_CREW
+	def MERGE_SORT_CREW(self, a, n):
+		self['T'] = [ None for i in range(0, n+1) ] # Vector for the merged runs
+		src = a         # Runs to merge
+		dst = self['T'] # Merged runs
+		
+		# Length of the pieces, a power of 2 not greater than logn
+		c = 1
+		while 2*c <= math.log(max(n, 1), 2):
+			c *= 2
+		
+		w = 1
+		while w < n:
+			forall k where k in range(0, n, c) do in parallel using src,dst,n,w,c:
+				# The pairs of runs in the piece: several ones while 2w < c
+				for lo in range(k - k % (2*w), min(k+c, n), 2*w):
+					la = min(w, n - lo)   # Lengths of the two runs
+					lb = min(w, n - lo - la)
+					d = max(k - lo, 0)    # Cells of the pair before the piece
+					
+					# Merge path: 'i' cells of the first run, 'd-i' of the second
+					i, hi = max(0, d - lb), min(d, la)
+					while i < hi:
+						mid = (i + hi) // 2
+						if src[lo+1 + mid] <= src[lo+la+1 + d-1-mid]:
+							i = mid + 1
+						else:
+							hi = mid
+					j = d - i
+					
+					# Sequential merge of the pair, within the piece
+					for o in range(lo + d, min(k+c, lo+la+lb)):
+						if j >= lb or (i < la and src[lo+1 + i] <= src[lo+la+1 + j]):
+							dst[o+1] = src[lo+1 + i]
+							i += 1
+						else:
+							dst[o+1] = src[lo+la+1 + j]
+							j += 1
+			
+			src, dst = dst, src
+			w *= 2
+		
+		# Copy the sorted vector back in 'a', if it ended up in 'T'
+		if src is not a:
+			forall k where k in range(1, n+1, c) do in parallel using a,src,n,c:
+				for o in range(k, min(k+c, n+1)):
+					a[o] = src[o]
+		
+		return a
+	#;;
+	
+	
+	########################################################################
+	## MAXIMUM - CRCW - O(1) time, O(n^2) processors
+	## Processor (i,j) writes in M[i] whether a[i] wins against a[j]: the
+	## concurrent writes in M[i] are combined with 'min', so that M[i] stays
+	## 1 only if a[i] is the maximum. All the maxima write the same value
+	## in the result, with the 'common' policy.
+	########################################################################
+	#;; MAX_CRCW
+	def MAX_CRCW(self, a, n):
+		self['M'] = [ 1 for i in range(0, n+1) ] # M[i] == 1 iff a[i] is a maximum
+		self['r'] = [ 0 ]                        # Result
+		self.set_policy('M', 'min')
+		self.set_policy('r', 'common')
+		M = self['M'] # Renaming, just for syntactic simplicity
+		r = self['r'] # Renaming, just for syntactic simplicity
+		
+		# Play all matches in O(1)
+		forall (i,j) where i in range(1, n+1) where j in range(1, n+1) do in parallel using a,M:
+			M[i] = a[i] >= a[j]
+		
+		# Write the maximum in O(1)
+		forall i where i in range(1, n+1) do in parallel using a,M,r:
+			if M[i] == 1:
+				r[0] = a[i]
+		
+		return r[0]
+	#;;
+
+
+	########################################################################
+	## LIST RANKING (Wyllie) - CREW - O(n) processors, O(logn) time
+	## The list is in the successors vector 'succ' (nodes from 1, 0 is nil,
+	## the successor of the tail). rank[i] becomes the distance of node i
+	## from the tail. Pointer jumping: at each step every node adds the rank
+	## of its successor, then jumps to the successor of its successor. The
+	## jumps have no branches, so each of them is one vectorized step.
+	########################################################################
+	#;; LIST_RANKING_PRAM
+	def LIST_RANKING_PRAM(self, succ, rank, n):
+		self['S'] = [ 0 for i in range(0, n+1) ] # Successors, jumping (S[0] == 0)
+		S = self['S'] # Renaming, just for syntactic simplicity
+		rank[0] = 0
+		
+		forall i where i in range(1, n+1) do in parallel using succ,rank,S:
+			S[i] = succ[i]
+			rank[i] = (succ[i] != 0) * 1
+		
+		for k in range(int(math.ceil(math.log(max(n, 1), 2)))):
+			forall i where i in range(1, n+1) do in parallel using rank,S:
+				rank[i] = rank[i] + rank[S[i]]
+				S[i] = S[S[i]]
+		
+		return rank
+	#;;
+
+
+	########################################################################
+	## LIST RANKING - OPTIMAL - CREW - O(n) expected work, O(logn loglogn) expected time
+	## Random mate: at every round each remaining node flips a coin, and the
+	## nodes with tails whose predecessor has heads are spliced out (never
+	## two adjacent ones): their predecessors add their rank and jump over
+	## them. The rounds go on until n/logn nodes remain, ranked by pointer
+	## jumping; then the spliced nodes are put back, from the last round to
+	## the first one. The remaining nodes are kept at the start of a vector,
+	## and the ones spliced out by a round right after them: a scan
+	## (SCAN_PRAM_OPT) of the flags of the remaining nodes gives every node
+	## its new position. A round does about 3.5m work on m nodes and spares
+	## (m/4)logm of pointer jumping, so rounds are run only while logm >
+	## minlog (14): shorter lists are ranked by LIST_RANKING_PRAM. A round has a processor per node left (n in the
+	## first one): with processors=n/logn (Brent) it takes O(logn) time.
+	########################################################################
+	#;; LIST_RANKING_PRAM_OPT
+	def LIST_RANKING_PRAM_OPT(self, succ, rank, n, minlog=14):
+		# Splice out nodes until n/logn of them remain, while logm > minlog
+		def splicing(m):
+			return m > max(n / math.log(max(n, 2), 2), 1) and math.log(m, 2) > minlog
+		if not splicing(n):
+			return self.LIST_RANKING_PRAM(succ, rank, n)
+		
+		N = 1
+		while N < n:
+			N *= 2
+		self['S'] = [ 0 for i in range(0, n+1) ] # Successors (S[0] == 0)
+		self['P'] = [ 0 for i in range(0, n+1) ] # Predecessors (0 for the head)
+		self['C'] = [ 0 for i in range(0, n+1) ] # Coins (C[0] == 0, the head stays)
+		self['A'] = [ 0 for i in range(0, N+1) ] # Remaining nodes, then the spliced ones
+		self['Y'] = [ 0 for i in range(0, N+1) ] # The same, for every other round
+		self['K'] = [ 0 for i in range(0, N+1) ] # 1 for the nodes that remain, then their positions
+		S = self['S'] # Renaming, just for syntactic simplicity
+		P = self['P'] # Renaming, just for syntactic simplicity
+		C = self['C'] # Renaming, just for syntactic simplicity
+		A = self['A'] # Renaming, just for syntactic simplicity
+		Y = self['Y'] # Renaming, just for syntactic simplicity
+		K = self['K'] # Renaming, just for syntactic simplicity
+		rank[0] = 0
+		
+		forall i where i in range(1, n+1) do in parallel using succ,rank,S,A:
+			S[i] = succ[i]
+			rank[i] = (succ[i] != 0) * 1
+			A[i] = i
+		
+		forall i where i in range(1, n+1) do in parallel using S,P:
+			P[S[i]] = i       # <-- The tail writes the predecessor of nil
+		
+		# The m nodes left are in A
+		m = n
+		rounds = []
+		while splicing(m):
+			forall j where j in range(1, m+1) do in parallel using A,C:
+				C[A[j]] = COIN(A[j])
+			
+			forall j where j in range(1, m+1) do in parallel using A,P,C,K:
+				i = A[j]
+				K[j] = 1 - (1 - C[i]) * C[P[i]]
+			
+			# Positions of the remaining nodes: the cells of K after m don't
+			# change them, so the scan (on a power of 2) needs no padding
+			M = 1
+			while M < m:
+				M *= 2
+			last = K[m]
+			self.SCAN_PRAM_OPT(K, M, add, 0)
+			kept = K[m] + last
+			
+			# The remaining nodes go in Y[1..kept], the spliced ones after them.
+			# Every node computes whether it, its successor and its predecessor
+			# are spliced, and jumps over them: the spliced ones keep S and rank
+			forall j where j in range(1, m+1) do in parallel using A,Y,S,P,C,K,rank,kept:
+				i = A[j]
+				s = S[i]
+				p = P[i]
+				x = (1 - C[i]) * C[p]
+				y = (s != 0) * (1 - C[s]) * C[i]
+				z = (p != 0) * (1 - C[p]) * C[P[p]]
+				Y[K[j] + 1 + x * (kept + j - 2*K[j] - 1)] = i
+				rank[i] = rank[i] + y * rank[s]
+				S[i] = s + y * (S[s] - s)
+				P[i] = p + z * (P[p] - p)
+			
+			# Later rounds only write Y[1..kept] again: the spliced nodes stay
+			rounds.append((Y, kept, m))
+			A, Y = Y, A
+			m = kept
+		
+		# Pointer jumping on the remaining nodes
+		for k in range(int(math.ceil(math.log(m, 2)))):
+			forall j where j in range(1, m+1) do in parallel using A,rank,S:
+				i = A[j]
+				rank[i] = rank[i] + rank[S[i]]
+				S[i] = S[S[i]]
+		
+		# Put back the spliced nodes, their successors are already ranked
+		for Y, kept, m in reversed(rounds):
+			forall j where j in range(kept+1, m+1) do in parallel using Y,rank,S:
+				i = Y[j]
+				rank[i] = rank[i] + rank[S[i]]
+		
+		return rank
+	#;;
+
+
+	########################################################################
+	## EULER TOUR ROOTING - CRCW - O(n) processors, O(logn) time
+	## The tree is given by its m arcs (see EULER_ARCS): the arc after e=u->v
+	## in the Euler tour is the one after v->u around v. The tour is cut
+	## before the first arc leaving the root r, then it is list ranked: an
+	## arc u->v comes before its twin in the tour iff u is the parent of v.
+	## The first arc leaving r is found with a 'min' concurrent write.
+	########################################################################
+	#;; EULER_TOUR_ROOTING
+	def EULER_TOUR_ROOTING(self, tail, head, twin, nxt, m, r, parent):
+		self['E'] = [ 0 for i in range(0, m+1) ]   # Successors in the Euler tour
+		self['D'] = [ 0 for i in range(0, m+1) ]   # Ranks in the Euler tour
+		self['F'] = [ m+1 ]                        # First arc leaving r
+		self.set_policy('F', 'min')
+		E = self['E'] # Renaming, just for syntactic simplicity
+		D = self['D'] # Renaming, just for syntactic simplicity
+		F = self['F'] # Renaming, just for syntactic simplicity
+		parent[r] = 0
+		
+		forall e where e in range(1, m+1) do in parallel using tail,twin,nxt,r,m,E,F:
+			E[e] = nxt[twin[e]]
+			F[0] = e + (tail[e] != r) * m
+		
+		f = F[0]
+		forall e where e in range(1, m+1) do in parallel using f,E:
+			E[e] = E[e] * (E[e] != f)
+		
+		self.LIST_RANKING_PRAM(E, D, m)
+		
+		forall e where e in range(1, m+1) do in parallel using tail,head,twin,D,parent:
+			if D[e] > D[twin[e]]:
+				parent[head[e]] = tail[e]
+		
+		return parent
+	#;;
+
+
+	########################################################################
+	## TREE CONTRACTION - CREW - O(n) processors, O(logn) time
+	## Evaluation of an expression tree: every internal node v has children
+	## left[v] and right[v] and operation op[v] ('+' or '*'), every leaf v
+	## has value val[v]; parent[v] is 0 for the root. 'leaves' holds the L
+	## leaves from left to right (e.g. in the order of an Euler tour).
+	## Each node v has a label (A,B): it passes A*x+B to its parent, if x is
+	## its value. A rake removes a leaf and its parent, composing the label
+	## of the parent into the one of the sibling. Every round rakes the odd
+	## leaves: first the left children, then the right ones (no two of them
+	## are adjacent), then the even leaves are renumbered, so that L halves.
+	########################################################################
+	#;; TREE_CONTRACTION_PRAM
+	def TREE_CONTRACTION_PRAM(self, left, right, parent, op, val, leaves, L):
+		n = len(parent) - 1
+		self['TL'] = [ 0 for v in range(0, n+1) ] # Left children, contracting
+		self['TR'] = [ 0 for v in range(0, n+1) ] # Right children, contracting
+		self['TP'] = [ 0 for v in range(0, n+1) ] # Parents, contracting
+		self['A']  = [ 1 for v in range(0, n+1) ] # Labels
+		self['B']  = [ 0 for v in range(0, n+1) ] # Labels
+		self['W']  = [ 0 for k in range(0, L+1) ] # Remaining leaves, from left to right
+		TL = self['TL'] # Renaming, just for syntactic simplicity
+		TR = self['TR'] # Renaming, just for syntactic simplicity
+		TP = self['TP'] # Renaming, just for syntactic simplicity
+		A  = self['A']  # Renaming, just for syntactic simplicity
+		B  = self['B']  # Renaming, just for syntactic simplicity
+		W  = self['W']  # Renaming, just for syntactic simplicity
+		
+		forall v where v in range(1, n+1) do in parallel using left,right,parent,TL,TR,TP:
+			TL[v] = left[v]
+			TR[v] = right[v]
+			TP[v] = parent[v]
+		
+		forall k where k in range(1, L+1) do in parallel using leaves,W:
+			W[k] = leaves[k]
+		
+		while L > 1:
+			for side in ('left', 'right'):
+				forall k where k in range(1, L+1, 2) do in parallel using side,op,val,TL,TR,TP,A,B,W:
+					l = W[k]
+					p = TP[l]
+					if (TL[p] == l) == (side == 'left'):
+						s = TR[p] if side == 'left' else TL[p]  # Sibling
+						c = A[l]*val[l] + B[l]
+						if op[p] == '+':
+							A[s], B[s] = A[p]*A[s], A[p]*(c + B[s]) + B[p]
+						else:
+							A[s], B[s] = A[p]*c*A[s], A[p]*c*B[s] + B[p]
+						g = TP[p]
+						TP[s] = g
+						if TL[g] == p:  # <-- g == 0 for the root: cell 0 is never read
+							TL[g] = s
+						else:
+							TR[g] = s
+		
+			forall k where k in range(1, L//2 + 1) do in parallel using W:
+				W[k] = W[2*k]
+			L = L//2
+		
+		r = W[1]
+		return A[r]*val[r] + B[r]
+	#;;
+
+
+	########################################################################
+	## CONNECTED COMPONENTS (Shiloach-Vishkin) - CRCW - O(n+m) processors, O(logn) time
+	## The graph is in CSR form (see CSR): the arcs of node v are the cells
+	## off[v]..off[v+1]-1 of 'adj', each edge is there in both directions.
+	## D[v] becomes the root of the component of v. At every iteration the
+	## star trees hook onto trees with a smaller label (conditional hooking,
+	## with the 'min' policy), the stars that didn't hook onto any tree do
+	## it now (unconditional hooking, with 'max'), then all trees are halved
+	## by pointer jumping. Processors with nothing to hook write the old
+	## value back, so the steps have no branches and can be vectorized.
+	## It ends after an iteration that changes nothing, O(logn) of them.
+	########################################################################
+	#;; CONNECTED_COMPONENTS_CRCW
+	def CONNECTED_COMPONENTS_CRCW(self, off, adj, n, m, D):
+		self['U']  = [ 0 for e in range(0, m+1) ]   # Source of every arc (from 1)
+		self['UH'] = [ n+1 for e in range(0, m+1) ] # Upper bounds of the sources
+		self['ST'] = [ 1 for v in range(0, n+1) ]   # ST[v] == 1 iff v is in a star
+		self['O']  = [ 0 for v in range(0, n+1) ]   # D at the start of the iteration
+		self['H']  = [ 0 ]                          # H[0] == 1 iff D changed
+		self.set_policy('ST', 'min')
+		self.set_policy('H', 'max')
+		U  = self['U']  # Renaming, just for syntactic simplicity
+		UH = self['UH'] # Renaming, just for syntactic simplicity
+		ST = self['ST'] # Renaming, just for syntactic simplicity
+		O  = self['O']  # Renaming, just for syntactic simplicity
+		H  = self['H']  # Renaming, just for syntactic simplicity
+		
+		# Binary search of the source of every arc: off[U[e]] <= e < off[UH[e]]
+		forall e where e in range(1, m+1) do in parallel using U:
+			U[e] = 1
+		for k in range(int(math.ceil(math.log(max(n, 1), 2)))):
+			forall e where e in range(1, m+1) do in parallel using off,U,UH:
+				l = U[e]
+				h = UH[e]
+				mid = (l + h) // 2
+				c = (off[mid] <= e) * 1
+				U[e]  = c*mid + (1-c)*l
+				UH[e] = c*h + (1-c)*mid
+		
+		forall v where v in range(1, n+1) do in parallel using D:
+			D[v] = v
+		
+		# D belongs to the caller: its CRCW policy is restored at the end
+		policy = D.policy
+		try:
+			while True:
+				# Stars: a node at depth 2 takes its grandparent out, with itself
+				forall v where v in range(1, n+1) do in parallel using D,ST,O:
+					d = D[v]
+					O[v] = d
+					c = (d != D[d]) * 1
+					ST[v] = 1 - c
+					ST[D[d]] = 1 - c
+				forall v where v in range(1, n+1) do in parallel using D,ST:
+					ST[v] = ST[v] * ST[D[v]]
+			
+				# Conditional hooking of the stars, onto smaller labels
+				self.set_policy(D.name, 'min')
+				forall e where e in range(1, m+1) do in parallel using adj,D,U,ST:
+					u = U[e]
+					du = D[u]
+					dv = D[adj[e]]
+					c = ST[u] * (dv < du)
+					D[du] = c*dv + (1-c)*D[du]
+			
+				forall v where v in range(1, n+1) do in parallel using D,ST:
+					d = D[v]
+					c = (d != D[d]) * 1
+					ST[v] = 1 - c
+					ST[D[d]] = 1 - c
+				forall v where v in range(1, n+1) do in parallel using D,ST:
+					ST[v] = ST[v] * ST[D[v]]
+			
+				# Unconditional hooking of the stars that are left, onto any tree
+				self.set_policy(D.name, 'max')
+				forall e where e in range(1, m+1) do in parallel using adj,D,U,ST:
+					u = U[e]
+					du = D[u]
+					dv = D[adj[e]]
+					c = ST[u] * (dv != du)
+					D[du] = c*dv + (1-c)*D[du]
+			
+				# Pointer jumping
+				self.set_policy(D.name, None)
+				forall v where v in range(1, n+1) do in parallel using D,O,H:
+					d = D[D[v]]
+					D[v] = d
+					H[0] = (d != O[v]) * 1
+			
+				if H[0] == 0:
+					break
+		finally:
+			self.set_policy(D.name, policy)
+		
+		return D
+	#;;
 
 
 
@@ -268,6 +868,20 @@ if __name__ == '__main__':
 	print (cpy)
 	assert ([ d for i in range(2**5 +1) ][1:] == cpy[1:])
 
+	pram = MyPRAM({'cpy': [ None for i in range(2**4 +1) ]}, model='EREW', strict=True)
+	# No cell is read by a processor and written by another in the same step
+	overlaps = []
+	def check_step(func, nprocs, check_step=pram.check_step):
+		vec = pram.vectors['cpy']
+		overlaps.extend(concurrent_cells(vec.reads + vec.writes, nprocs))
+		check_step(func, nprocs)
+	pram.check_step = check_step
+	print ('Executing REPLICATE_OPT on datum %s, replicating %d times.' % (d, 2**4))
+	pram.REPLICATE_OPT(pram['cpy'], d, 2**4)
+	print (pram['cpy'])
+	assert ([ d for i in range(2**4 +1) ][1:] == pram['cpy'][1:])
+	assert overlaps == [] and pram.conflicts == []
+
 	########################################################################
 	## Testing TOURNAMENT SORTING
 	########################################################################
@@ -287,6 +901,11 @@ if __name__ == '__main__':
 	print (b)
 	assert(b[1:] == sorted(vector_to_sort[1:]))
 
+	pram = MyPRAM({'a': vector_to_sort[:n-10]})
+	print ('Executing TOURNAMENT_SORT_CREW on ' + str(n-11) + ' elements...')
+	b = pram.TOURNAMENT_SORT_CREW(pram['a'], n-11)
+	assert(b[1:] == sorted(vector_to_sort[1:n-10]))
+
 	# Create PRAM for tournement sorting EREW
 	pram = MyPRAM({'a': vector_to_sort})
 	print ('Executing TOURNAMENT_SORT_EREW on ' + str(n) + ' elements...')
@@ -294,6 +913,83 @@ if __name__ == '__main__':
 	print (b)
 	assert(b[1:] == sorted(vector_to_sort[1:]))
 
+	# Create PRAM for merge sorting (any n)
+	for m in (1, 2, 3, 2**6 - 5, 2**6):
+		pram = MyPRAM({'a': vector_to_sort[:m+1]}, model='CREW', strict=True)
+		print ('Executing MERGE_SORT_CREW on ' + str(m) + ' elements...')
+		b = pram.MERGE_SORT_CREW(pram['a'], m)
+		assert(b[1:] == sorted(vector_to_sort[1:m+1]))
+	print (b)
+
+	repeated = [ None ] + [ random.randint(0, 9) for i in range(100) ]
+	pram = MyPRAM({'a': repeated}, backend='numpy')
+	print ('Executing MERGE_SORT_CREW on ' + str(len(repeated)-1) + ' elements with repetitions...')
+	b = pram.MERGE_SORT_CREW(pram['a'], len(repeated)-1)
+	assert(b.tolist()[1:] == sorted(repeated[1:]))
+	assert pram.steps == 7 + 1    # <-- One step per level, then the copy back in 'a'
+	assert pram.work == pram.steps * 25    # <-- Pieces of 4 cells at every step
+
+	# Create PRAM for optimal tournement sorting (n and n/logn powers of 2)
+	for m in (2**2, 2**4):
+		pram = MyPRAM({'a': vector_to_sort[:m+1]}, model='EREW', strict=True)
+		print ('Executing TOURNAMENT_SORT_OPT on ' + str(m) + ' elements...')
+		b = pram.TOURNAMENT_SORT_OPT(pram['a'], m)
+		print (b)
+		assert(b[1:] == sorted(vector_to_sort[1:m+1]))
+
+	########################################################################
+	## Testing PRAM MATRICES
+	########################################################################
+	print ("\nTesting PRAM matrices")
+	m = 2**4
+	matrix = [ [ random.randint(0,100) for j in range(m) ] for i in range(m) ]
+	transposed = [ [ matrix[j][i] for j in range(m) ] for i in range(m) ]
+	for backend, vectorize in (('list', False), ('numpy', False), ('numpy', True)):
+		print ('Transposing a matrix in place, on the %s backend (vectorize=%s)...' % (backend, vectorize))
+		pram = MyPRAM({'M': matrix}, backend=backend, vectorize=vectorize)
+		M = pram['M']
+		assert (len(M), M.cols) == (m, m)
+		assert M[2][3] == M[2,3] == matrix[2][3]
+		def transpose(i, j):
+			M[i,j] = M[j][i]     # <-- Every cell is double buffered
+		pram.forall_do_in_parallel([ (i,j) for i in range(m) for j in range(m) ], transpose)
+		assert M.tolist() == transposed
+		assert M[:,1].tolist() == matrix[1] and M[1].tolist() == transposed[1]
+		assert pram.unvectorizable == set()
+
+	# Row views: replicas are written directly in the rows of the matrix
+	pram = MyPRAM({'R': [ [ None for j in range(m+1) ] for i in range(m+1) ]})
+	R = pram['R']
+	print ('Replicating in the rows of a matrix...')
+	pram.forall_do_in_parallel(range(1, m+1), lambda i: pram.REPLICATE(R[i], i, m))
+	assert [ R[i].tolist()[1:] for i in range(1, m+1) ] == [ [ i ] * m for i in range(1, m+1) ]
+
+	########################################################################
+	## Testing SEGMENTED REDUCTIONS and SCANS
+	########################################################################
+	print ("\nTesting segmented reductions and scans")
+	rows = [ [ random.randint(0,100) for j in range(12) ] for i in range(5) ]
+	for backend, vectorize in (('list', False), ('numpy', False), ('numpy', True)):
+		print ('Reducing and scanning all rows and columns at once, on the %s backend (vectorize=%s)...' % (backend, vectorize))
+		pram = MyPRAM({'M': rows}, backend=backend, vectorize=vectorize)
+		M = pram['M']
+		steps = pram.steps
+		assert pram.segmented_reduce([ M[i] for i in range(5) ], identity=0).tolist() == [ sum(r) for r in rows ]
+		assert pram.steps - steps == 1 + 4      # <-- Copy, then log(16) levels
+		assert pram.segmented_reduce([ M[:,j][1:] for j in range(12) ], max).tolist() == \
+			[ max(r[j] for r in rows[1:]) for j in range(12) ]
+		scans = [ [ sum(r[:k+1]) for k in range(12) ] for r in rows ]
+		assert pram.segmented_scan([ M[i] for i in range(5) ]).tolist() == scans
+		assert pram.segmented_scan([ M[i] for i in range(5) ], identity=0, inclusive=False).tolist() == \
+			[ [ 0 ] + s[:-1] for s in scans ]
+		if vectorize:
+			assert len(pram.unvectorizable) == 1   # <-- Only max() can't work on arrays
+
+	pram = MyPRAM({})
+	words = [ [ 'a', 'b', 'c' ], [ 'x', 'y', 'z' ] ]
+	assert pram.segmented_scan(words, add, '', inclusive=False).tolist() == [ [ '', 'a', 'ab' ], [ '', 'x', 'xy' ] ]
+	assert pram.segmented_reduce(words, add, '').tolist() == [ 'abc', 'xyz' ]
+
 	########################################################################
 	## Testing SUMMATIONS and PREFIX SUMS
 	########################################################################
@@ -324,10 +1020,441 @@ if __name__ == '__main__':
 	print (s)
 	assert s == functools.reduce(add, a[1:])
 
+	for op in (add, max, lambda x, y: x*y % 1000003):
+		pram = MyPRAM({'a': a}) # We need 2n-1 nodes for the heap-structure PRAM
+		print ('Executing ASSOCIATIVE_OP_PRAM_OPT(%s)...' % getattr(op, '__name__', op))
+		s = pram.ASSOCIATIVE_OP_PRAM_OPT(pram['a'], n, op)
+		print (s)
+		assert s == functools.reduce(op, a[n:])
+
 	pram = MyPRAM({'a': a, 'b': [ None for i in range(0, 2*n) ]}) # We need 2n-1 nodes for the heap-structure PRAM
 	print ('Executing PREFIX_SUM_PRAM...')
 	pram.PREFIX_SUM_PRAM(pram['a'], pram['b'], n)
 	print (pram['b'])
 	assert pram['b'][n:] == [ sum(a[n:k]) for k in range(n+1, 2*n+1) ]
 
+	########################################################################
+	## Testing SCANS with any associative operation
+	########################################################################
+	print ("\nTesting Scans")
+	v = [ None ] + [ random.randint(0,100) for i in range(n) ]
+	letters = [ None ] + [ chr(ord('a') + i%26) for i in range(n) ]
+	for name in ('SCAN_PRAM', 'SCAN_PRAM_OPT'):
+		for vector, op, identity in ((v, add, 0), (v, max, 0), (letters, add, '')):
+			for inclusive in (False, True):
+				pram = MyPRAM({'a': vector}, model='EREW', strict=True)
+				print ('Executing %s(%s, inclusive=%s)...' % (name, op.__name__, inclusive))
+				total = getattr(pram, name)(pram['a'], n, op, identity, inclusive)
+				prefixes = [ functools.reduce(op, vector[1:k+1], identity) for k in range(n+1) ]
+				assert total == prefixes[n]
+				assert pram['a'][1:] == (prefixes[1:] if inclusive else prefixes[:n])
+
+	########################################################################
+	## Testing SUMMATIONS and PREFIX SUMS on the NumPy backend
+	########################################################################
+	n = 2**12
+	a = [ 0 for i in range(0, 2*n) ]    # <-- All integers, to get an integer NumPy array
+	for i in range(n, 2*n): a[i] = random.randint(1,2)
+	print ("\nTesting Summations on the NumPy backend, on %d elements" % n)
+
+	pram = MyPRAM({'a': a}, backend='numpy')
+	print ('Executing SUM_PRAM...')
+	s = pram.SUM_PRAM(pram['a'], n)
+	print (s)
+	assert s == sum(a[1:])
+
+	pram = MyPRAM({'a': a, 'b': [ 0 for i in range(0, 2*n) ]}, backend='numpy')
+	print ('Executing PREFIX_SUM_PRAM...')
+	pram.PREFIX_SUM_PRAM(pram['a'], pram['b'], n)
+	assert pram['b'].tolist()[n:] == [ sum(a[n:k]) for k in range(n+1, 2*n+1) ]
+
+	# Values that don't fit the integer array widen it, as on the list backend
+	for backend in ('list', 'numpy'):
+		pram = MyPRAM({'a': [ 0, 0, 0, 0, 1, 2, 3, 4 ]}, backend=backend)
+		pram.forall_do_in_parallel(range(4, 8), lambda i: pram['a'].__setitem__(i, pram['a'][i] / 4.0))
+		s = pram.SUM_PRAM(pram['a'], 4)
+		assert s == 2.5
+		pram = MyPRAM({'a': [ 0, 0, 0, 0, 2**62, 2**62, 2**62, 2**62 ]}, backend=backend)
+		s = pram.SUM_PRAM(pram['a'], 4)
+		assert s == 2**64 and type(s) is type(2**64)
+
+	# Vectorized steps whose int64 arithmetic would overflow run serially
+	v = [ 0 ] + [ 2**61 + k for k in range(16) ]
+	for backend, vectorize in (('list', False), ('numpy', False), ('numpy', True)):
+		pram = MyPRAM({'a': list(v)}, backend=backend, vectorize=vectorize)
+		s = pram.SCAN_PRAM_OPT(pram['a'], 16, add, 0, inclusive=True)
+		assert s == sum(v) and list(pram['a']) == [ sum(v[:k+1]) for k in range(17) ]
+		pram = MyPRAM({'a': [ 0 ] * 16 + [ 2**8 + k for k in range(16) ]}, backend=backend, vectorize=vectorize)
+		s = pram.ASSOCIATIVE_OP_PRAM_OPT(pram['a'], 16, mul)
+		assert s == functools.reduce(mul, [ 2**8 + k for k in range(16) ])
+
+	########################################################################
+	## Testing VECTORIZED steps on the NumPy backend
+	########################################################################
+	print ("\nTesting vectorized steps on the NumPy backend, on %d elements" % n)
+
+	pram = MyPRAM({'a': a}, backend='numpy', vectorize=True)
+	print ('Executing SUM_PRAM...')
+	s = pram.SUM_PRAM(pram['a'], n)
+	print (s)
+	assert s == sum(a[1:])
+
+	pram = MyPRAM({'a': a}, backend='numpy', vectorize=True)
+	print ('Executing ASSOCIATIVE_OP_PRAM(max)...')
+	s = pram.ASSOCIATIVE_OP_PRAM(pram['a'], n, np.maximum)
+	print (s)
+	assert s == max(a[1:])
+
+	m = 2**9    # <-- Groups of 8 elements, in SCAN_PRAM_OPT
+	v = [ 0 ] + a[n:n+m]
+	for name in ('SCAN_PRAM', 'SCAN_PRAM_OPT'):
+		pram = MyPRAM({'a': v}, backend='numpy', vectorize=True)
+		print ('Executing %s(max)...' % name)
+		s = getattr(pram, name)(pram['a'], m, np.maximum, 0, inclusive=True)
+		print (s)
+		assert pram['a'].tolist()[1:] == [ max(v[1:k+1]) for k in range(1, m+1) ]
+		assert pram.unvectorizable == set()
+
+	# Cells written by two statements of a body: the last processor wins, not
+	# the last statement, so these steps run one processor at a time too
+	results = []
+	for backend, vectorize in (('list', False), ('numpy', True)):
+		pram = MyPRAM({'c': [ 0 ] * 9}, backend=backend, vectorize=vectorize)
+		c = pram['c']
+		def two_writes(i):
+			c[i] = i
+			c[i+1] = -i
+		pram.forall_do_in_parallel(range(8), two_writes)
+		results.append(list(c))
+	assert results[0] == results[1] == [ 0, 1, 2, 3, 4, 5, 6, 7, -7 ]
+	assert two_writes.__code__ in pram.unvectorizable
+
+	# Other errors of a vectorized body are raised, not run again serially
+	pram = MyPRAM({'c': [ 0 ] * 9}, backend='numpy', vectorize=True)
+	c = pram['c']
+	def wrong(i):
+		c[i] = c[i] + undefined_name
+	try:
+		pram.forall_do_in_parallel(range(8), wrong)
+		assert False, 'a body using an undefined name ran'
+	except NameError:
+		assert wrong.__code__ not in pram.unvectorizable
+
+	# Branching bodies fall back to one processor at a time
+	pram = MyPRAM({'a': a, 'b': [ 0 for i in range(0, 2*n) ]}, backend='numpy', vectorize=True)
+	print ('Executing PREFIX_SUM_PRAM...')
+	pram.PREFIX_SUM_PRAM(pram['a'], pram['b'], n)
+	assert pram['b'].tolist()[n:] == [ sum(a[n:k]) for k in range(n+1, 2*n+1) ]
+
+	m = 2**4
+	pram = MyPRAM({'a': [ 0 for i in range(0, m) ] + a[n:n+m]}, backend='numpy', vectorize=True)
+	print ('Executing SUM_PRAM_OPT...')
+	s = pram.SUM_PRAM_OPT(pram['a'], m)
+	print (s)
+	assert s == sum(a[n:n+m])
+
+	########################################################################
+	## Testing POINTER JUMPING
+	########################################################################
+	print ("\nTesting pointer jumping")
+	for m in (1, 2, 1000):
+		order = random.sample(range(1, m+1), m)   # <-- Nodes from the head to the tail
+		succ = [ 0 for i in range(m+1) ]
+		for k in range(m-1):
+			succ[order[k]] = order[k+1]
+		ranks = [ 0 for i in range(m+1) ]
+		for k in range(m):
+			ranks[order[k]] = m-1 - k
+		for name in ('LIST_RANKING_PRAM', 'LIST_RANKING_PRAM_OPT'):
+			for backend, vectorize in (('list', False), ('numpy', True)):
+				print ('Executing %s on %d nodes, on the %s backend (vectorize=%s)...' % (name, m, backend, vectorize))
+				pram = MyPRAM({'succ': succ, 'rank': [ 0 for i in range(m+1) ]}, backend=backend, vectorize=vectorize, model='CREW', strict=True)
+				r = getattr(pram, name)(pram['succ'], pram['rank'], m)
+				assert list(r) == ranks and list(pram['succ']) == succ
+				if vectorize:
+					assert pram.unvectorizable == set()
+		for minlog in (0, 5):   # <-- Rounds of splicing even on short lists
+			for backend, vectorize in (('list', False), ('numpy', True)):
+				print ('Executing LIST_RANKING_PRAM_OPT on %d nodes, splicing while logm > %d, on the %s backend...' % (m, minlog, backend))
+				pram = MyPRAM({'succ': succ, 'rank': [ 0 for i in range(m+1) ]}, backend=backend, vectorize=vectorize, model='CREW', strict=True)
+				r = pram.LIST_RANKING_PRAM_OPT(pram['succ'], pram['rank'], m, minlog)
+				assert list(r) == ranks and list(pram['succ']) == succ
+				if vectorize:
+					assert pram.unvectorizable == set()
+		pram = MyPRAM({'succ': succ, 'rank': [ 0 for i in range(m+1) ]})
+		pram.LIST_RANKING_PRAM(pram['succ'], pram['rank'], m)
+		assert pram.steps == 1 + int(math.ceil(math.log(m, 2)))
+
+	# Rooting of a random tree, at every node
+	m = 50
+	edges = [ (v, random.randint(1, v-1)) for v in range(2, m+1) ]
+	tail, head, twin, nxt = EULER_ARCS(m, edges)
+	for r in range(1, m+1):
+		pram = MyPRAM({'tail': tail, 'head': head, 'twin': twin, 'nxt': nxt, 'parent': [ None for v in range(m+1) ]}, model='CRCW')
+		parent = pram.EULER_TOUR_ROOTING(pram['tail'], pram['head'], pram['twin'], pram['nxt'], 2*(m-1), r, pram['parent'])
+		assert parent[r] == 0
+		for v in range(1, m+1):     # <-- Following the parents, every node gets to r
+			u, hops = v, 0
+			while u != r and hops < m:
+				u, hops = parent[u], hops + 1
+			assert u == r and (v == r or (v, parent[v]) in edges or (parent[v], v) in edges)
+	print ('Rooted the tree at every node')
+
+	# Evaluation of random expression trees
+	def expression(nodes, depth):
+		v = len(nodes)
+		nodes.append(None)
+		if depth == 0 or random.random() < 0.2:
+			nodes[v] = (None, None, None, random.randint(0, 3))
+		else:
+			l = expression(nodes, depth-1)
+			r = expression(nodes, depth-1)
+			nodes[v] = (l, r, random.choice('+*'), None)
+		return v
+	def evaluate(nodes, v):
+		l, r, o, x = nodes[v]
+		if l is None: return x
+		return evaluate(nodes, l) + evaluate(nodes, r) if o == '+' else evaluate(nodes, l) * evaluate(nodes, r)
+	def inorder_leaves(nodes, v):
+		l, r, o, x = nodes[v]
+		return [ v ] if l is None else inorder_leaves(nodes, l) + inorder_leaves(nodes, r)
+	for t in range(20):
+		nodes = [ None ]
+		root = expression(nodes, 8)
+		N = len(nodes) - 1
+		parent = [ 0 for v in range(N+1) ]
+		for v in range(1, N+1):
+			for c in nodes[v][:2]:
+				if c is not None: parent[c] = v
+		leaves = [ 0 ] + inorder_leaves(nodes, root)
+		pram = MyPRAM({
+			'left':   [ 0 ] + [ nodes[v][0] or 0 for v in range(1, N+1) ],
+			'right':  [ 0 ] + [ nodes[v][1] or 0 for v in range(1, N+1) ],
+			'parent': parent,
+			'op':     [ None ] + [ nodes[v][2] for v in range(1, N+1) ],
+			'val':    [ None ] + [ nodes[v][3] for v in range(1, N+1) ],
+			'leaves': leaves }, model='CREW', strict=True)
+		value = pram.TREE_CONTRACTION_PRAM(pram['left'], pram['right'], pram['parent'], pram['op'], pram['val'], pram['leaves'], len(leaves)-1)
+		assert value == evaluate(nodes, root)
+	print ('Evaluated 20 expression trees, the last one is', value)
+
+	########################################################################
+	## Testing CONNECTED COMPONENTS
+	########################################################################
+	print ("\nTesting connected components")
+	def components(n, edges):   # <-- Sequential union-find, as a reference
+		root = list(range(n+1))
+		def find(v):
+			while root[v] != v:
+				v = root[v]
+			return v
+		for u, v in edges:
+			root[find(u)] = find(v)
+		return [ find(v) for v in range(n+1) ]
+	def same_partition(a, b):
+		return len(set(a)) == len(set(b)) == len(set(zip(a, b)))
+	for m, k in ((1, 0), (2, 1), (200, 150), (200, 400), (1000, 999)):
+		edges = [ tuple(random.sample(range(1, m+1), 2)) for e in range(k) ] if m > 1 else []
+		if (m, k) == (1000, 999):
+			edges = [ (v, v+1) for v in range(1, m) ]   # <-- A path, the longest tree
+		off, adj = CSR(m, edges)
+		for backend, vectorize in (('list', False), ('numpy', True)):
+			print ('Executing CONNECTED_COMPONENTS_CRCW on %d nodes and %d edges, on the %s backend (vectorize=%s)...' % (m, k, backend, vectorize))
+			pram = MyPRAM({'off': off, 'adj': adj, 'D': [ 0 for v in range(m+1) ]}, backend=backend, vectorize=vectorize, model='CRCW', strict=True)
+			pram.set_policy('D', 'priority')
+			D = pram.CONNECTED_COMPONENTS_CRCW(pram['off'], pram['adj'], m, 2*k, pram['D'])
+			assert same_partition(list(D)[1:], components(m, edges)[1:])
+			assert pram['D'].policy == 'priority'   # The policy of the caller is kept
+			if vectorize:
+				assert pram.unvectorizable == set()
+		print ('steps:', pram.steps, 'work:', pram.work)
+
+	########################################################################
+	## Testing the ACCESS CONFLICT detector
+	########################################################################
+	print ("\nTesting the access conflict detector")
+
+	pram = MyPRAM({'a': a}, model='EREW')
+	print ('Executing SUM_PRAM on an EREW PRAM...')
+	pram.SUM_PRAM(pram['a'], n)
+	assert pram.conflicts == []
+
+	pram = MyPRAM({'a': a}, backend='numpy', vectorize=True, model='EREW')
+	print ('Executing vectorized SUM_PRAM on an EREW PRAM...')
+	pram.SUM_PRAM(pram['a'], n)
+	assert pram.conflicts == []
+
+	# Both children read their parent: PREFIX_SUM_PRAM is CREW
+	m = 2**4
+	pram = MyPRAM({'a': [ 0 for i in range(0, m) ] + a[n:n+m], 'b': [ 0 for i in range(0, 2*m) ]}, model='EREW')
+	print ('Executing PREFIX_SUM_PRAM on an EREW PRAM...')
+	pram.PREFIX_SUM_PRAM(pram['a'], pram['b'], m)
+	print (pram.conflicts[0])
+	assert [ c[1:3] for c in pram.conflicts ] == [ ('b', 'read') ] * int(math.log(m,2))
+	assert pram.conflicts[0][3] == [1]
+
+	pram = MyPRAM({'a': [ 0 for i in range(0, m) ] + a[n:n+m], 'b': [ 0 for i in range(0, 2*m) ]}, backend='numpy', vectorize=True, model='EREW')
+	print ('Executing vectorized PREFIX_SUM_PRAM on an EREW PRAM...')
+	pram.PREFIX_SUM_PRAM(pram['a'], pram['b'], m)
+	assert [ c[1:3] for c in pram.conflicts ] == [ ('b', 'read') ] * int(math.log(m,2))
+	assert pram.conflicts[0][3] == [1]
+
+	pram = MyPRAM({'a': [ 0 for i in range(0, m) ] + a[n:n+m], 'b': [ 0 for i in range(0, 2*m) ]}, model='CREW')
+	print ('Executing PREFIX_SUM_PRAM on a CREW PRAM...')
+	pram.PREFIX_SUM_PRAM(pram['a'], pram['b'], m)
+	assert pram.conflicts == []
+
+	vector_to_sort = [ None ] + random.sample(range(10000), m)
+	pram = MyPRAM({'a': vector_to_sort}, model='EREW', strict=True)
+	print ('Executing TOURNAMENT_SORT_CREW on an EREW PRAM...')
+	try:
+		pram.TOURNAMENT_SORT_CREW(pram['a'], m)
+		assert False
+	except AccessConflict as e:
+		print (e)
+
+	pram = MyPRAM({'a': vector_to_sort}, model='CREW', strict=True)
+	print ('Executing TOURNAMENT_SORT_CREW on a CREW PRAM...')
+	pram.TOURNAMENT_SORT_CREW(pram['a'], m)
+
+	########################################################################
+	## Testing CRCW write-resolution POLICIES
+	########################################################################
+	print ("\nTesting CRCW policies")
+
+	m = 2**5
+	vector = [ 0 ] + [ random.randint(0,100) for i in range(m) ]
+	pram = MyPRAM({'a': vector}, model='CRCW')
+	print ('Executing MAX_CRCW on ' + str(m) + ' elements...')
+	s = pram.MAX_CRCW(pram['a'], m)
+	print (s)
+	assert s == max(vector[1:])
+
+	m = 2**9
+	vector = [ 0 ] + [ random.randint(0,10**6) for i in range(m) ]
+	pram = MyPRAM({'a': vector}, backend='numpy', vectorize=True)
+	print ('Executing vectorized MAX_CRCW on ' + str(m) + ' elements...')
+	s = pram.MAX_CRCW(pram['a'], m)
+	print (s)
+	assert s == max(vector[1:])
+	assert len(pram.unvectorizable) == 1   # <-- Only the second step has an if
+
+	for backend, vectorize in (('list', False), ('numpy', False), ('numpy', True)):
+		print ('Writing concurrently with each policy, on the %s backend (vectorize=%s)...' % (backend, vectorize))
+		pram = MyPRAM({'a': vector}, backend=backend, vectorize=vectorize)
+		for policy, expected in (('priority', vector[1]), ('sum', sum(vector[1:])), ('max', max(vector[1:])), ('common', None)):
+			pram['r'] = [ 0 ]
+			pram.set_policy('r', policy)
+			r, v = pram['r'], pram['a']
+			def write_r(i):
+				r[0] = v[i]
+			try:
+				pram.forall_do_in_parallel(range(1, m+1), write_r)
+				assert r[0] == expected
+			except AccessConflict as e:
+				assert policy == 'common'
+		assert pram.unvectorizable == set()
+
+	print ("\nTesting CRCW policies with worker processes")
+	pram = MyPRAM({'a': vector}, backend='numpy', workers=2)
+	s = pram.MAX_CRCW(pram['a'], 2**5)
+	print (s)
+	assert s == max(vector[1:2**5+1])
+
+	########################################################################
+	## Testing WORKER PROCESSES on the NumPy backend
+	########################################################################
+	print ("\nTesting worker processes on the NumPy backend")
+
+	pram = MyPRAM({'a': a}, backend='numpy', workers=2)
+	print ('Executing SUM_PRAM...')
+	s = pram.SUM_PRAM(pram['a'], n)
+	print (s)
+	assert s == sum(a[1:])
+
+	m = 2**5
+	vector_to_sort = [ 0 ] + random.sample(range(10000), m)  # <-- No None values, to be shared
+	pram = MyPRAM({'a': vector_to_sort}, backend='numpy', workers=2)
+	print ('Executing TOURNAMENT_SORT_CREW on ' + str(m) + ' elements...')
+	b = pram.TOURNAMENT_SORT_CREW(pram['a'], m)
+	print (b)
+	assert(b.tolist()[1:] == sorted(vector_to_sort[1:]))
+
+	########################################################################
+	## Testing BRENT's SCHEDULING on p physical processors
+	########################################################################
+	print ("\nTesting Brent's scheduling")
+
+	n = 2**8
+	a = [ 0 for i in range(0, 2*n) ]
+	for i in range(n, 2*n): a[i] = random.randint(0, 100)
+	for backend, vectorize in (('list', False), ('numpy', True)):
+		print ('Executing SUM_PRAM on 16 processors, on the %s backend (vectorize=%s)...' % (backend, vectorize))
+		pram = MyPRAM({'a': a}, backend=backend, vectorize=vectorize, processors=16)
+		s = pram.SUM_PRAM(pram['a'], n)
+		print (s, 'steps:', pram.steps, 'work:', pram.work, 'time:', pram.time)
+		assert s == sum(a[n:])
+		assert (pram.steps, pram.work, pram.time) == (8, n-1, 1+1+1+1+1+2+4+8)
+		assert pram.unvectorizable == set()
+
+	m = 2**5
+	vector = [ 0 ] + [ random.randint(0,10**6) for i in range(m) ]
+	pram = MyPRAM({'a': vector}, backend='numpy', vectorize=True, processors=7)
+	print ('Executing vectorized MAX_CRCW in chunks of 7 processors...')
+	s = pram.MAX_CRCW(pram['a'], m)
+	print (s)
+	assert s == max(vector[1:])
+
+	# Every processor reads the same cell, each in its own chunk
+	pram = MyPRAM({'a': [ 1, 2 ], 'b': [ 0, 0 ]}, backend='numpy', vectorize=True, model='EREW', processors=1)
+	a, b = pram['a'], pram['b']
+	def read_a0(i):
+		b[i] = a[0]
+	pram.forall_do_in_parallel(range(2), read_a0)
+	assert pram['b'].tolist() == [ 1, 1 ] and pram.unvectorizable == set()
+	assert [ (kind, cells) for where, name, kind, cells in pram.conflicts ] == [ ('read', [ 0 ]) ]
+
+	########################################################################
+	## Testing CONCURRENT simulations in threads
+	########################################################################
+	print ("\nTesting concurrent PRAMs in threads")
+	import threading
+
+	# The steps of 'p1' and 'p2' overlap, and the one of 'p1' ends first
+	n = 8
+	p1 = MyPRAM({'a': list(range(n))})
+	p2 = MyPRAM({'a': list(range(n))})
+	events = dict((e, threading.Event()) for e in ('p1 inside', 'p2 inside', 'p1 done'))
+	def shift(pram, i, inside, wait):
+		if i == 1:
+			events[inside].set()
+			events[wait].wait()
+		pram['a'][i] = pram['a'][i-1]
+	def other():
+		events['p1 inside'].wait()
+		p2.forall_do_in_parallel(range(1, n), lambda i: shift(p2, i, 'p2 inside', 'p1 done'))
+	thread = threading.Thread(target=other)
+	thread.start()
+	print ('Executing overlapping steps of two PRAMs in two threads...')
+	p1.forall_do_in_parallel(range(1, n), lambda i: shift(p1, i, 'p1 inside', 'p2 inside'))
+	events['p1 done'].set()
+	thread.join()
+	assert list(p1['a']) == [ 0 ] + list(range(n-1))
+	assert list(p2['a']) == [ 0 ] + list(range(n-1))
+
+	m = 2**4
+	vectors = [ [ None ] + random.sample(range(10000), m) for t in range(4) ]
+	results = {}
+	def run(t):
+		pram = MyPRAM({'a': vectors[t]})
+		results[t] = pram.TOURNAMENT_SORT_EREW(pram['a'], m)   # <-- Nested forall, in REPLICATE
+	threads = [ threading.Thread(target=run, args=(t, )) for t in range(len(vectors)) ]
+	print ('Executing TOURNAMENT_SORT_EREW in ' + str(len(threads)) + ' threads...')
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	for t in range(len(vectors)):
+		assert(results[t][1:] == sorted(vectors[t][1:]))
+
 	print ("\nAll tests passed successfully!")
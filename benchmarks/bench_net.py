@@ -0,0 +1,254 @@
+#coding=utf-8
+"""
+PySAL - Python Synchronous Algorithms Library
+------------------------------------------------------------------------
+Copyright (C) 2012  Matteo Brucato  <mattfeel@gmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Benchmarks for the bounded-degree network simulator. Some of them use the
+compiled algorithms in out_HYPERCUBE.py and out_MESH.py, so run "make"
+first (or simply "make bench").
+
+Usage: python benchmarks/bench_net.py [BENCHMARK ...]
+"""
+from __future__ import print_function
+import os, sys, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from synchronous_unshared import *
+from out_HYPERCUBE import MyHypercube
+from out_MESH import MyMesh
+import numpy as np
+
+
+def bench_getfrom():
+	"""
+	Throughput of Processor.getfrom: in one step every processor reads
+	variable 'a' from each of its neighbors.
+	"""
+	print ('\ngetfrom throughput, reads per second (one step, every processor reads all its neighbors)')
+	nets = [
+		('Mesh(256)',      lambda backend: Mesh(256, cyclic=True, backend=backend)),
+		('Hypercube(16)',  lambda backend: Hypercube(16, backend=backend)),
+		('Shuffle(16)',    lambda backend: Shuffle(16, backend=backend)),
+		('Butterfly(12)',  lambda backend: Butterfly(12, backend=backend)),
+	]
+	for name, make in nets:
+		for backend in ('list', 'numpy'):
+			net = make(backend)
+			net.randomfeed(0, 100)
+			nb = [ [ net.indices(q) for q in net.neighbors(p) ] for p in range(net.size) ]
+			reads = sum(len(l) for l in nb)
+			def body(P, *ind):
+				for q in nb[P.id]:
+					P['b'] = P.getfrom('a', *q)
+			t = time.time()
+			net.forall_do_in_parallel([ net.indices(p) for p in range(net.size) ], body)
+			t = time.time() - t
+			print ('%-14s %-6s %8d processors  %9d reads  %12.0f reads/s' % (name, backend, net.size, reads, reads / t))
+
+
+def bench_matrix():
+	"""
+	MATRIX_MULTIPLICATION_HYPERCUBE of two random nxn matrices, on n**3
+	processors.
+	"""
+	print ('\nMATRIX_MULTIPLICATION_HYPERCUBE, wall time of a whole run (seconds)')
+	for h in (2, 3, 4):
+		n = 2**h
+		a = np.random.randint(-9, 10, size=(n, n))
+		b = np.random.randint(-9, 10, size=(n, n))
+		for backend in ('list', 'numpy'):
+			net = MyHypercube(3*h, backend=backend)
+			net.store.fill('A', a.flatten().tolist() + [ 0 ] * (net.size - n*n))
+			net.store.fill('B', b.flatten().tolist() + [ 0 ] * (net.size - n*n))
+			t = time.time()
+			net.MATRIX_MULTIPLICATION_HYPERCUBE()
+			t = time.time() - t
+			assert net.variable('C')[:n*n] == a.dot(b).flatten().tolist()
+			print ('n=%-3d %-6s %6d processors  steps: %3d  work: %7d  wall: %8.4f' % (n, backend, net.size, net.steps, net.work, t))
+
+
+def bench_vectorized():
+	"""
+	Hypercube algorithms with and without vectorized steps, on the 'numpy'
+	backend.
+	"""
+	print ('\nVectorized hypercube steps, wall time of a whole run (seconds)')
+	for k in (12, 16, 20):
+		values = np.random.randint(-1000, 1000, size=2**k)
+		times = []
+		for vectorize in (False, True):
+			net = MyHypercube(k, backend='numpy')
+			net.vectorize = vectorize
+			net.store.fill('a', values)
+			t = time.time()
+			net.SUM_HYPERCUBE(True)
+			times.append(time.time() - t)
+			assert net.M[0]['a'] == values.sum()
+		print ('SUM_HYPERCUBE                   k=%-3d  loop: %8.4f  vectorized: %8.4f  speedup: %6.1fx' % (k, times[0], times[1], times[0]/times[1]))
+	for h in (3, 4, 5):
+		n = 2**h
+		a = np.random.randint(-9, 10, size=(n, n))
+		b = np.random.randint(-9, 10, size=(n, n))
+		times = []
+		for vectorize in (False, True):
+			net = MyHypercube(3*h, backend='numpy')
+			net.vectorize = vectorize
+			net.store.fill('A', a.flatten().tolist() + [ 0 ] * (net.size - n*n))
+			net.store.fill('B', b.flatten().tolist() + [ 0 ] * (net.size - n*n))
+			t = time.time()
+			net.MATRIX_MULTIPLICATION_HYPERCUBE()
+			times.append(time.time() - t)
+			assert net.variable('C')[:n*n] == a.dot(b).flatten().tolist()
+		print ('MATRIX_MULTIPLICATION_HYPERCUBE k=%-3d  loop: %8.4f  vectorized: %8.4f  speedup: %6.1fx' % (3*h, times[0], times[1], times[0]/times[1]))
+
+
+def bench_batch():
+	"""
+	BITONIC_MERGESORT_HYPERCUBE on B random inputs: B runs one after the
+	other, against one run of a batch of B instances.
+	"""
+	print ('\nBITONIC_MERGESORT_HYPERCUBE on B inputs, wall time (seconds)')
+	for k, B in ((6, 1000), (10, 20)):
+		values = np.random.randint(-1000, 1000, size=(B, 2**k))
+		t = time.time()
+		for b in range(B):
+			net = MyHypercube(k)
+			net.store.fill('a', values[b].tolist())
+			net.BITONIC_MERGESORT_HYPERCUBE()
+		single = time.time() - t
+		net = MyHypercube(k, backend='numpy', batch=B)
+		net.store.fill('a', values)
+		t = time.time()
+		net.BITONIC_MERGESORT_HYPERCUBE()
+		batch = time.time() - t
+		assert (net.instances('a') == np.sort(values, axis=1)).all()
+		print ('k=%-3d B=%-5d  one at a time: %8.4f  batch: %8.4f  speedup: %6.1fx' % (k, B, single, batch, single/batch))
+
+
+def bench_sharded():
+	"""
+	MATRIX_MULTIPLICATION_CYCLIC_MESH (every step runs on all processors)
+	in a single process, and sharded by blocks of rows among worker
+	processes.
+	"""
+	print ('\nSharded MATRIX_MULTIPLICATION_CYCLIC_MESH, wall time of a whole run (seconds)')
+	n = 64
+	a = [ random.randint(-9, 9) for p in range(n*n) ]
+	b = [ random.randint(-9, 9) for p in range(n*n) ]
+	for shards in (1, 2, 4, 8):
+		net = MyMesh(n, cyclic=True)
+		net.store.fill('a', a)
+		net.store.fill('b', b)
+		t = time.time()
+		if shards == 1:
+			net.MATRIX_MULTIPLICATION_CYCLIC_MESH()
+		else:
+			net.run_sharded(shards, net.MATRIX_MULTIPLICATION_CYCLIC_MESH)
+		t = time.time() - t
+		assert net.variable('c') == np.dot(np.reshape(a, (n, n)), np.reshape(b, (n, n))).flatten().tolist()
+		halo = sum(stats['halo'] for stats in net.shardstats) if shards > 1 else 0
+		print ('n=%-4d shards: %d  halo values: %8d  wall: %8.4f' % (n, shards, halo, t))
+
+
+def bench_distributed():
+	"""
+	MATRIX_MULTIPLICATION_CYCLIC_MESH sharded among worker processes over
+	TCP sockets on 127.0.0.1, with the traffic of each superstep.
+	"""
+	print ('\nDistributed MATRIX_MULTIPLICATION_CYCLIC_MESH on 127.0.0.1, per superstep of worker 0')
+	n = 64
+	a = [ random.randint(-9, 9) for p in range(n*n) ]
+	b = [ random.randint(-9, 9) for p in range(n*n) ]
+	for backend in ('list', 'numpy'):
+		for shards in (2, 4):
+			net = MyMesh(n, cyclic=True, backend=backend)
+			net.store.fill('a', a)
+			net.store.fill('b', b)
+			t = time.time()
+			net.run_distributed(shards, net.MATRIX_MULTIPLICATION_CYCLIC_MESH)
+			t = time.time() - t
+			assert net.variable('c') == np.dot(np.reshape(a, (n, n)), np.reshape(b, (n, n))).flatten().tolist()
+			log = net.shardstats[0]['log']
+			print ('n=%-4d %-5s workers: %d  supersteps: %4d  halo/step: %6.1f  bytes sent/step: %8.1f  latency: %8.6f  wall: %8.4f' % (n, backend, shards, len(log),
+				sum(x[0] for x in log) / float(len(log)), sum(x[1] for x in log) / float(len(log)), sum(x[3] for x in log) / len(log), t))
+
+
+def bench_slots():
+	"""
+	The same body on the variables of the processors named by string, and
+	by slot, as compiled by pysal.py, on each backend. Slots must not be
+	slower than strings.
+	"""
+	print ('\nProcessor variables by name and by slot, ns per access')
+	a, b = slot('a'), slot('b')
+	def by_name(P, i):
+		for k in range(10):
+			P['b'] = P['a'] + P['b']
+			P['a'] = P.getfrom('b', i ^ 1)
+	def by_slot(P, i):
+		for k in range(10):
+			P[b] = P[a] + P[b]
+			P[a] = P.getfrom(b, i ^ 1)
+	for backend in ('list', 'numpy'):
+		times = []
+		for body in (by_name, by_slot):
+			net = Hypercube(14, backend=backend)
+			net.randomfeed(0, 100, ['a', 'b'])
+			t = time.time()
+			net.forall_do_in_parallel(range(net.size), body)
+			times.append((time.time() - t) / (net.size * 10 * 5) * 1e9)
+		print ('%-6s  by name: %6.1f ns  by slot: %6.1f ns  (%.2fx)' % (backend, times[0], times[1], times[0] / times[1]))
+		assert times[1] <= times[0] * 1.05, 'slots are slower than names on the %s backend' % backend
+
+
+def bench_sparse():
+	"""
+	SUM_HYPERCUBE over a subcube of 64 processors of a big hypercube, on
+	each backend: construction, run, and peak memory.
+	"""
+	import tracemalloc
+	print ('\nSUM_HYPERCUBE on a subcube of 64 processors of Hypercube(20)')
+	for backend in ('list', 'numpy', 'sparse'):
+		tracemalloc.start()
+		t = time.time()
+		net = MyHypercube(20, backend=backend)
+		built = time.time() - t
+		for i in range(64):
+			net.M[i]['a'] = i
+		net.SUM_HYPERCUBE(True, 6)
+		t = time.time() - t
+		assert net.M[63]['a'] == sum(range(64))
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		print ('%-6s  construction: %8.6f  total: %8.4f  peak memory: %10d bytes' % (backend, built, t, peak))
+
+
+benchmarks = {
+	'batch': bench_batch,
+	'distributed': bench_distributed,
+	'getfrom': bench_getfrom,
+	'matrix': bench_matrix,
+	'sharded': bench_sharded,
+	'slots': bench_slots,
+	'sparse': bench_sparse,
+	'vectorized': bench_vectorized,
+}
+
+if __name__ == '__main__':
+	names = sys.argv[1:] or sorted(benchmarks)
+	for name in names:
+		benchmarks[name]()
@@ -0,0 +1,284 @@
+#coding=utf-8
+"""
+PySAL - Python Synchronous Algorithms Library
+------------------------------------------------------------------------
+Copyright (C) 2012  Matteo Brucato  <mattfeel@gmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Benchmarks for the PRAM simulator. They use the compiled algorithms in
+out_PRAM.py, so run "make" first (or simply "make bench").
+
+Usage: python benchmarks/bench_pram.py [BENCHMARK ...]
+"""
+from __future__ import print_function
+import os, sys, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from out_PRAM import *
+import numpy as np
+
+
+class StepTimedPRAM(MyPRAM):
+	"""
+	A PRAM recording, for every parallel step, the number of active
+	processors and the wall time spent (nested steps are not recorded).
+	"""
+	
+	def __init__(self, *args, **kwargs):
+		MyPRAM.__init__(self, *args, **kwargs)
+		self.steptimes = []
+	
+	def forall_do_in_parallel(self, indices, func):
+		if self.state.parallel:
+			return MyPRAM.forall_do_in_parallel(self, indices, func)
+		if not isinstance(indices, (list, tuple, range_type)):
+			indices = list(indices)
+		t = time.time()
+		MyPRAM.forall_do_in_parallel(self, indices, func)
+		self.steptimes.append((len(indices), time.time() - t))
+
+
+def heap_vector(n):
+	a = [ 0 for i in range(0, 2*n) ]
+	for i in range(n, 2*n): a[i] = random.randint(1,2)
+	return a
+
+
+def bench_sum_steps():
+	"""
+	Time of every step of SUM_PRAM: with write-set tracking the cost of a
+	step depends on its active processors, not on the size of the memory.
+	"""
+	print ('\nSUM_PRAM, wall time per step (microseconds)')
+	for backend in ('list', 'numpy'):
+		for logn in (10, 14, 18):
+			n = 2**logn
+			pram = StepTimedPRAM({'a': heap_vector(n)}, backend=backend)
+			pram.SUM_PRAM(pram['a'], n)
+			# Last steps are the ones with few active processors
+			print ('%-6s n=2**%-3d' % (backend, logn), end='')
+			for procs, t in pram.steptimes[-1:-5:-1] + pram.steptimes[:1]:
+				print ('  %7d procs: %9.1f' % (procs, t*1e6), end='')
+			print ()
+
+
+def bench_vectorized():
+	"""
+	Whole SUM_PRAM and ASSOCIATIVE_OP_PRAM runs, executing every step one
+	processor at a time or as a single vectorized NumPy step.
+	"""
+	print ('\nVectorized steps, wall time of a whole run (seconds)')
+	for logn in (12, 16, 20):
+		n = 2**logn
+		a = heap_vector(n)
+		for name, run in (
+				('SUM_PRAM', lambda p: p.SUM_PRAM(p['a'], n)),
+				('ASSOCIATIVE_OP_PRAM(max)', lambda p: p.ASSOCIATIVE_OP_PRAM(p['a'], n, np.maximum))):
+			times = []
+			for vectorize in (False, True):
+				pram = MyPRAM({'a': a}, backend='numpy', vectorize=vectorize)
+				t = time.time()
+				run(pram)
+				times.append(time.time() - t)
+			print ('%-26s n=2**%-3d  loop: %8.4f  vectorized: %8.4f  speedup: %6.1fx' % \
+				(name, logn, times[0], times[1], times[0]/times[1]))
+
+
+def bench_detector():
+	"""
+	Overhead of the access conflict detector on whole SUM_PRAM runs (the
+	best of 5 runs): it must stay cheap enough to be left on.
+	"""
+	print ('\nAccess conflict detector, wall time of a whole SUM_PRAM run (seconds, best of 5)')
+	for backend, vectorize, logn in (('list', False, 16), ('numpy', False, 16), ('numpy', True, 16), ('numpy', True, 20)):
+		n = 2**logn
+		a = heap_vector(n)
+		times = []
+		for model in (None, 'CREW', 'EREW'):
+			best = None
+			for run in range(5):
+				pram = MyPRAM({'a': a}, backend=backend, vectorize=vectorize, model=model)
+				t = time.time()
+				pram.SUM_PRAM(pram['a'], n)
+				t = time.time() - t
+				best = t if best is None else min(best, t)
+			assert pram.conflicts == []
+			times.append(best)
+		print ('%-6s vectorize=%-5s n=2**%-3d off: %8.4f  CREW: %8.4f (%.2fx)  EREW: %8.4f (%.2fx)' % \
+			(backend, vectorize, logn, times[0], times[1], times[1]/times[0], times[2], times[2]/times[0]))
+		assert max(times) <= 2 * times[0], 'the detector more than doubles the time of SUM_PRAM'
+
+
+def bench_crcw_max():
+	"""
+	Constant-time CRCW maximum on n^2 processors, resolving the concurrent
+	writes one processor at a time or with vectorized NumPy scatters.
+	"""
+	print ('\nMAX_CRCW, wall time of a whole run (seconds)')
+	for logn in (6, 8, 10):
+		n = 2**logn
+		a = [ 0 ] + [ random.randint(0, 10**9) for i in range(n) ]
+		times = []
+		for backend, vectorize in (('list', False), ('numpy', True)):
+			if backend == 'list' and logn > 8:
+				times.append(float('nan'))
+				continue
+			pram = MyPRAM({'a': a}, backend=backend, vectorize=vectorize)
+			t = time.time()
+			assert pram.MAX_CRCW(pram['a'], n) == max(a)
+			times.append(time.time() - t)
+		print ('n=2**%-3d (%8d processors)  list: %8.4f  numpy vectorized: %8.4f' % (logn, n*n, times[0], times[1]))
+
+
+def bench_tournament():
+	"""
+	Whole tournament sorts, whose n x n matrices are PRAM matrices.
+	"""
+	print ('\nTournament sorts, wall time of a whole run (seconds)')
+	for logn in (6, 8, 10):
+		n = 2**logn
+		a = [ 0 ] + random.sample(range(10**6), n)
+		times = []
+		for name in ('TOURNAMENT_SORT_CREW', 'TOURNAMENT_SORT_EREW'):
+			pram = MyPRAM({'a': a})
+			t = time.time()
+			b = getattr(pram, name)(pram['a'], n)
+			times.append(time.time() - t)
+			assert b[1:] == sorted(a[1:])
+		print ('n=2**%-3d (%8d matrix cells)  CREW: %8.4f  EREW: %8.4f' % (logn, (n+1)**2, times[0], times[1]))
+
+
+def bench_optimal():
+	"""
+	Each algorithm next to its optimal version, on O(n/logn) processors
+	(O(n^2/logn) for the tournament): parallel steps, peak processors of a
+	step, total work (processors of all steps) and wall time.
+	"""
+	print ('\nOptimal algorithms: steps, peak processors, work and wall time (seconds)')
+	def replicate(name, n):
+		pram = StepTimedPRAM({'c': [ None for i in range(n+1) ]})
+		return pram, lambda: getattr(pram, name)(pram['c'], 7, n)
+	def associative(name, n):
+		pram = StepTimedPRAM({'a': heap_vector(n)})
+		return pram, lambda: getattr(pram, name)(pram['a'], n, max)
+	def scan(name, n):
+		pram = StepTimedPRAM({'a': [ 0 ] + heap_vector(n)[n:]})
+		return pram, lambda: getattr(pram, name)(pram['a'], n, max, 0)
+	def tournament(name, n):
+		pram = StepTimedPRAM({'a': [ 0 ] + random.sample(range(10**6), n)})
+		return pram, lambda: getattr(pram, name)(pram['a'], n)
+	for make, names, sizes in (
+			(replicate,   ('REPLICATE', 'REPLICATE_OPT'), (2**8, 2**16)),
+			(associative, ('ASSOCIATIVE_OP_PRAM', 'ASSOCIATIVE_OP_PRAM_OPT'), (2**8, 2**16)),
+			(scan,        ('SCAN_PRAM', 'SCAN_PRAM_OPT'), (2**8, 2**16)),
+			(tournament,  ('TOURNAMENT_SORT_EREW', 'TOURNAMENT_SORT_OPT'), (2**4, 2**8))):
+		for n in sizes:
+			for name in names:
+				pram, run = make(name, n)
+				t = time.time()
+				run()
+				t = time.time() - t
+				peak = max(procs for procs, steptime in pram.steptimes)
+				print ('%-24s n=2**%-3d  steps: %4d  peak processors: %8d  work: %9d  wall: %8.4f' % \
+					(name, int(math.log(n, 2)), pram.steps, peak, pram.work, t))
+
+
+def bench_sorts():
+	"""
+	The tournament sorts, on O(n^2) processors, against the merge sort, on
+	O(n/logn) processors: parallel steps, work and wall time.
+	"""
+	print ('\nSorts: steps, work and wall time (seconds)')
+	names = ('TOURNAMENT_SORT_CREW', 'TOURNAMENT_SORT_EREW', 'TOURNAMENT_SORT_OPT', 'MERGE_SORT_CREW')
+	for logn in (4, 6, 8, 10, 12, 16):
+		n = 2**logn
+		a = [ 0 ] + random.sample(range(10**6), n)
+		for name in names:
+			# The tournaments are too slow past 1024, the optimal one needs n/logn power of 2
+			if (name != 'MERGE_SORT_CREW' and logn > 10) or (name == 'TOURNAMENT_SORT_OPT' and logn not in (4, 8, 16)):
+				continue
+			pram = MyPRAM({'a': a})
+			t = time.time()
+			b = getattr(pram, name)(pram['a'], n)
+			t = time.time() - t
+			assert b[1:] == sorted(a[1:])
+			print ('%-21s n=2**%-3d  steps: %4d  work: %9d  wall: %8.4f' % (name, logn, pram.steps, pram.work, t))
+
+
+def bench_list_ranking():
+	"""
+	List ranking by pointer jumping, against the optimal random-mate one,
+	on random lists up to 10^6 nodes, with vectorized NumPy steps: parallel
+	steps, work and wall time. Up to 2^14 nodes the random-mate ranking is
+	pointer jumping; on longer lists it does less work (about 8% at 10^5
+	nodes, 22% at 10^6), but in 10-20 times as many steps, and its wall
+	time is about twice as long.
+	"""
+	print ('\nList ranking: steps, work and wall time (seconds)')
+	for n in (10**3, 10**4, 10**5, 10**6):
+		order = np.random.permutation(n) + 1
+		succ = np.zeros(n+1, dtype=int)
+		succ[order[:-1]] = order[1:]
+		work = []
+		for name in ('LIST_RANKING_PRAM', 'LIST_RANKING_PRAM_OPT'):
+			pram = MyPRAM({'succ': succ, 'rank': np.zeros(n+1, dtype=int)}, backend='numpy', vectorize=True)
+			t = time.time()
+			rank = getattr(pram, name)(pram['succ'], pram['rank'], n)
+			t = time.time() - t
+			assert rank.current[order[0]] == n-1 and rank.current[order[-1]] == 0
+			work.append(pram.work)
+			print ('%-21s n=%-8d  steps: %4d  work: %9d  wall: %8.4f' % (name, n, pram.steps, pram.work, t))
+		assert work[1] <= work[0], 'the random-mate ranking does more work than pointer jumping'
+
+
+def bench_components():
+	"""
+	Shiloach-Vishkin connected components of random graphs up to 10^6
+	edges, in CSR form, with vectorized NumPy steps: parallel steps, work,
+	slowest step and wall time.
+	"""
+	print ('\nConnected components: steps, work, slowest step and wall time (seconds)')
+	for n, k in ((10**3, 10**3), (10**4, 10**4), (10**5, 10**5), (2*10**5, 10**6)):
+		u = np.random.randint(1, n+1, size=k)
+		v = np.random.randint(1, n+1, size=k)
+		src = np.concatenate([ u, v ])
+		order = np.argsort(src, kind='stable')
+		adj = np.concatenate([ [ 0 ], np.concatenate([ v, u ])[order] ])
+		off = np.concatenate([ [ 0, 1 ], 1 + np.cumsum(np.bincount(src, minlength=n+1)[1:]) ])
+		pram = StepTimedPRAM({'off': off, 'adj': adj, 'D': np.zeros(n+1, dtype=int)}, backend='numpy', vectorize=True)
+		t = time.time()
+		D = pram.CONNECTED_COMPONENTS_CRCW(pram['off'], pram['adj'], n, 2*k, pram['D'])
+		t = time.time() - t
+		assert pram.unvectorizable == set()
+		print ('n=%-7d m=%-8d  components: %6d  steps: %4d  work: %9d  slowest step: %8.4f  wall: %8.4f' % \
+			(n, 2*k, len(np.unique(D.current[1:])), pram.steps, pram.work, max(t for procs, t in pram.steptimes), t))
+
+
+benchmarks = {
+	'components': bench_components,
+	'crcw_max': bench_crcw_max,
+	'detector': bench_detector,
+	'list_ranking': bench_list_ranking,
+	'optimal': bench_optimal,
+	'sorts': bench_sorts,
+	'sum_steps': bench_sum_steps,
+	'tournament': bench_tournament,
+	'vectorized': bench_vectorized,
+}
+
+if __name__ == '__main__':
+	names = sys.argv[1:] or sorted(benchmarks)
+	for name in names:
+		benchmarks[name]()
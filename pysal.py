@@ -18,7 +18,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 from __future__ import print_function
-import sys, os
+import sys, os, re
 
 class CommentExc(Exception): pass
 class SintaxError(Exception): pass
@@ -30,6 +30,67 @@ def add_line_sync(line, indents):
 	"""
 	return line.replace(';', '\n%sself.synchronize()' % (indents,))
 
+def split_range(elem, forloop):
+	"""
+	If the forall iterates 'elem' over a range() call, return that call and
+	what follows it in 'forloop', otherwise None.
+	"""
+	var, sep, rest = forloop.strip().partition(' in ')
+	rest = rest.strip()
+	if var.strip() != elem.strip() or not rest.startswith('range('):
+		return None
+	depth = 0
+	for pos, c in enumerate(rest):
+		if c == '(':
+			depth += 1
+		elif c == ')':
+			depth -= 1
+			if depth == 0:
+				break
+	return rest[:pos+1], rest[pos+1:].strip()
+
+def simple_range(elem, forloop):
+	"""
+	If the forall just iterates 'elem' over a range() call, without any further
+	condition, return that call: the runtime can then take the range as it is,
+	instead of a list built element by element.
+	"""
+	split = split_range(elem, forloop)
+	if split is None or split[1]:
+		return None
+	return split[0]
+
+def masked_range(elem, forloop):
+	"""
+	If the forall iterates 'elem' over a range() call with a single 'if'
+	condition, return a call of the runtime's where(): the condition can then
+	be computed as a mask over the whole range, in vectorized steps.
+	"""
+	split = split_range(elem, forloop)
+	if split is None or not split[1].startswith('if ') or ' for ' in split[1]:
+		return None
+	return 'self.where(%s, lambda %s: %s)' % (split[0], elem.strip(), split[1][len('if '):].strip())
+
+def slot_accesses(procname):
+	"""
+	Regular expression of the accesses of processor 'procname' to variables
+	with a constant name: procname['name'] and procname.getfrom('name', ...).
+	"""
+	return re.compile(r"""\b%s(\[\s*|\.getfrom\(\s*)(['"])([A-Za-z_]\w*)\2(?=\s*[\],)])""" % re.escape(procname))
+
+def assign_slots(body, procname, names):
+	"""
+	Replace the constant variable names used by processor 'procname' in the
+	lines of 'body' with their slots (see synchronous_unshared.slot()),
+	adding them to 'names'. Other accesses are left to the runtime.
+	"""
+	accesses = slot_accesses(procname)
+	def replace(match):
+		if match.group(3) not in names:
+			names.append(match.group(3))
+		return procname + match.group(1) + 'SLOT_' + match.group(3)
+	return [ accesses.sub(replace, line) for line in body ]
+
 if len(sys.argv) < 2:
 	print('Usage...', file=sys.stderr)
 	sys.exit(1)
@@ -50,11 +111,16 @@ BODYFUNC = 1
 procnum = 0
 l = -1
 state = FORALL
+classname = None
+slots = {}   # Class -> variable names of its processors, in order
 for line in filein:
 	
 	lines.append(line)
 	l += 1
 	
+	if line.startswith('class '):
+		classname = re.match(r'class\s+(\w+)', line).group(1)
+	
 	if state == BODYFUNC:
 		indents2 = 0
 		try:
@@ -88,6 +154,7 @@ for line in filein:
 						'usings': usings,
 						'indents': funcindents,
 						'body': body,
+						'class': classname,
 					})
 					procnum += 1
 					
@@ -159,6 +226,19 @@ for line in filein:
 print ('from __future__ import print_function', file=fileout)
 print ('#coding=utf-8', file=fileout)
 
+# Variables of processors (forall ... as P) named by constants get a slot
+for f in parallel_funcs:
+	if f['elem'] != f['elemname']:
+		f['body'] = assign_slots(f['body'], f['elemname'].strip(), slots.setdefault(f['class'], []))
+if slots:
+	print ('from synchronous_unshared import slot', file=fileout)
+	names = []
+	for classname in sorted(slots, key=str):
+		print ('# %s: %s' % (classname, ', '.join(slots[classname])), file=fileout)
+		names += [ var for var in slots[classname] if var not in names ]
+	for var in names:
+		print ('SLOT_%s = slot(%r)' % (var, var), file=fileout)
+
 for f in parallel_funcs:
 	funcname = f['funcname']
 	elem = f['elem']
@@ -183,7 +263,8 @@ for i in range(len(lines)):
 				forloop = f['forloop'].replace('where','for')
 				funcindents = f['indents']
 				usings = 'self,' + f['usings']
-				print ("%sself.forall_do_in_parallel([%s for %s], lambda %s%s:" % (funcindents, elem, forloop, elemname.replace('(','').replace(')',''), '' if elem==elemname else ','+elem.replace('(','').replace(')','')), file=fileout)
+				indices = simple_range(elem, forloop) or masked_range(elem, forloop) or '[%s for %s]' % (elem, forloop)
+				print ("%sself.forall_do_in_parallel(%s, lambda %s%s:" % (funcindents, indices, elemname.replace('(','').replace(')',''), '' if elem==elemname else ','+elem.replace('(','').replace(')','')), file=fileout)
 				print ("%s\t%s(%s%s%s)" % (funcindents, funcname, elemname.replace('(','').replace(')',''), '' if elem==elemname else ','+elem.replace('(','').replace(')',''), '' if usings=='' else ','+usings), file=fileout)
 				print ("%s)" % funcindents, file=fileout)
 				break
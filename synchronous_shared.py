@@ -17,49 +17,913 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 from copy import *
+from functools import reduce
+import os, numbers, operator
+import synchronous_workers
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+try:
+	range_type = xrange
+except NameError:
+	range_type = range
+
+class NotVectorizable(Exception): pass
+class AccessConflict(Exception): pass
+
+
+class Vectorized(object):
+	"""
+	Value taken by 'process' while a step (or a chunk of its processors)
+	runs vectorized: 'ids' are the indices (or ranks) of its processors.
+	"""
+	
+	def __init__(self, ids):
+		self.ids = ids
+	
+	def owners(self, cell):
+		"""
+		Return the arrays of cells and of the processors that accessed them:
+		the k-th processor accessed the k-th cell of an array of indices.
+		"""
+		cell = np.asarray(cell).ravel()
+		if len(cell) == 1 and len(self.ids) > 1:
+			cell = np.repeat(cell, len(self.ids))   # The same cell, for all processors
+		ids = self.ids[:len(cell)] if len(cell) <= len(self.ids) else np.arange(len(cell))
+		return cell, ids
+
+
+def magnitude(x):
+	"""
+	Largest absolute value in 'x' (a value, or an array of integers).
+	"""
+	x = np.asarray(x)
+	return max(-int(x.min()), int(x.max())) if x.size else 0
+
+
+if np is not None:
+	class Checked(np.ndarray):
+		"""
+		Integers read by a vectorized step. NumPy arithmetic on int64 wraps
+		silently: results that may not fit raise NotVectorizable instead, so
+		that the step runs one processor at a time, on Python integers.
+		"""
+		
+		bounded = {np.add: sum, np.subtract: sum, np.multiply: lambda m: reduce(operator.mul, m),
+		           np.negative: max, np.absolute: max}
+		overflowing = (np.power, np.left_shift)
+		
+		def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+			args = [ x.view(np.ndarray) if isinstance(x, Checked) else x for x in inputs ]
+			try:
+				result = getattr(ufunc, method)(*args, **kwargs)
+			except OverflowError:
+				raise NotVectorizable   # A Python integer out of the range of int64
+			if not isinstance(result, np.ndarray) or result.dtype.kind not in 'iu':
+				return result
+			if method == '__call__' and ufunc in Checked.bounded:
+				# Bound the result with the largest operands, without copies
+				if Checked.bounded[ufunc]([ magnitude(x) for x in args ]) >= 2**63:
+					raise NotVectorizable
+			elif ufunc in Checked.bounded or ufunc in Checked.overflowing:
+				exact = getattr(ufunc, method)(*[ np.asarray(x, dtype=float) for x in args ], **kwargs)
+				if not (np.abs(exact) < 2.0**62).all():
+					raise NotVectorizable
+			return result.view(Checked)
+
+
+class PRAMState(object):
+	"""
+	The execution state of a PRAM, shared by all its vectors. Every PRAM has
+	its own, so independent simulations can run concurrently (e.g. in
+	different threads).
+	"""
+	
+	def __init__(self):
+		self.parallel  = False
+		self.process   = None
+		self.toplevel  = None   # Processor of the outermost running step (for nested steps)
+
+# Concurrent accesses forbidden by each PRAM model: (reads, writes)
+models = {
+	'EREW': (True,  True),
+	'CREW': (False, True),
+	'CRCW': (False, False),
+}
+
+
+def concurrent_cells(accesses, nprocs):
+	"""
+	Return the cells accessed by more than one processor, out of the list of
+	(cell, processor) 'accesses' logged during a step of 'nprocs' processors.
+	"""
+	owner = {}
+	cells = set()
+	arrays = []
+	for cell, proc in accesses:
+		if isinstance(proc, Vectorized):
+			if isinstance(cell, (np.ndarray, int, np.integer)):
+				arrays.append(proc.owners(cell))
+			elif nprocs > 1:
+				cells.add(cell)     # The same cell, for all processors
+			continue
+		try:
+			if owner.setdefault(cell, proc) != proc:
+				cells.add(cell)
+		except TypeError:
+			pass    # Unhashable keys, like slices, are not checked
+	if arrays:
+		cells.update(concurrent_arrays(arrays))
+	return sorted(cells)
+
+
+def progression(cells):
+	"""
+	Return (first, step, last) if 'cells' is an increasing arithmetic
+	progression (as the cells of a[2*i+1]), else None.
+	"""
+	if len(cells) == 1:
+		return int(cells[0]), 1, int(cells[0])
+	step = cells[1] - cells[0]
+	if step <= 0 or (cells[-1] - cells[0]) != step * (len(cells) - 1) \
+			or not (cells[1:] - cells[:-1] == step).all():
+		return None
+	return int(cells[0]), int(step), int(cells[-1])
+
+
+def disjoint(prog1, prog2):
+	"""
+	Whether two progressions returned by progression() share no cell, if
+	this is easily decided.
+	"""
+	(first1, step1, last1), (first2, step2, last2) = prog1, prog2
+	if last1 < first2 or last2 < first1:
+		return True
+	return step1 == step2 and (first1 - first2) % step1 != 0
+
+
+def concurrent_arrays(arrays):
+	"""
+	Return the cells accessed by more than one processor, out of the list of
+	(cells, processors) arrays logged by vectorized steps. Accesses to
+	disjoint progressions of cells (as a[2*i] and a[2*i+1]) are recognized
+	without marking cells; otherwise cells are marked in an array as long as
+	the vector: each access costs a gather and a scatter, with no sorting.
+	"""
+	arrays = [ (cells, ids) for cells, ids in arrays if len(cells) ]
+	if sum(len(cells) for cells, ids in arrays) <= 64:
+		# Few cells: cheaper in Python than with the NumPy calls below
+		owner = {}
+		found = set()
+		for cells, ids in arrays:
+			for cell, proc in zip(cells.tolist(), np.asarray(ids).tolist()):
+				if owner.setdefault(cell, proc) != proc:
+					found.add(cell)
+		return sorted(found)
+	progs = [ progression(cells) for cells, ids in arrays ]
+	if None not in progs and all(disjoint(progs[i], progs[j])
+			for i in range_type(len(progs)) for j in range_type(i)):
+		return []
+	# Every cell keeps the last processor that accessed it
+	owner = np.zeros(max(int(cells.max()) for cells, ids in arrays) + 1, dtype=np.int64)   # Processor + 1, 0 if none yet
+	found = []
+	for cells, ids in arrays:
+		ids = np.asarray(ids, dtype=np.int64) + 1
+		prev = owner[cells]
+		found.append(cells[(prev != 0) & (prev != ids)])
+		owner[cells] = ids
+		found.append(cells[owner[cells] != ids])   # The same cell twice in this access
+	return np.unique(np.concatenate(found)).tolist()
+
+
+# CRCW write-resolution policies: the combining ones map to their function
+# and to the name of their NumPy ufunc
+policies = ('common', 'arbitrary', 'priority')
+combiners = {
+	'sum': (operator.add, 'add'),
+	'min': (min, 'minimum'),
+	'max': (max, 'maximum'),
+}
+
+
+def resolve_writes(contribs, policy, combine, name):
+	"""
+	Resolve the concurrent writes of a step into a dict cell -> value.
+	'contribs' lists the (cell, processor, value) writes in order of
+	execution: only the last write of each processor to a cell counts.
+	"""
+	cells = {}
+	for cell, proc, val in contribs:
+		cells.setdefault(cell, {})[proc] = val
+	result = {}
+	for cell, vals in cells.items():
+		procs = sorted(vals)
+		if policy == 'priority' or policy == 'arbitrary':
+			result[cell] = vals[procs[0]]
+		elif policy == 'common':
+			for proc in procs:
+				if vals[proc] != vals[procs[0]]:
+					raise AccessConflict('Processors %s and %s write different values in cell %s of vector %s, with policy common' % \
+						(procs[0], proc, cell, name))
+			result[cell] = vals[procs[0]]
+		else:
+			result[cell] = reduce(combine, [ vals[proc] for proc in procs ])
+	return result
 
-parallel = False
-process  = None
 
 class PRAMSyncVect(list):
 	"""
 	A vector to be used in synchronous parallelism, in PRAMs.
+	Between two parallel steps, tempvector always holds the same values of
+	the vector itself: during a step, written indices are logged in
+	'written', so that storing back data only touches the dirtied cells.
 	"""
 	
-	def __init__(self, l):
+	def __init__(self, l, state=None):
 		self.tempvector = copy(l)
 		super(PRAMSyncVect, self).__init__(l)
+		self.state = state or PRAMState()
 		self.writtenby = None
+		self.written = []
+		self.checkreads  = False    # Log accesses, to find conflicts
+		self.checkwrites = False
+		self.reads  = []
+		self.writes = []
+		self.name = None
+		self.policy = None          # CRCW write-resolution policy
+		self.contribs = []          # (cell, processor, value) of a step
 	
 	def __setitem__(self, i, val):
-		if parallel:
+		state = self.state
+		if state.parallel:
 			self.tempvector[i] = val
+			self.written.append(i)
+			if self.checkwrites:
+				self.writes.append((i, state.toplevel))
+			if self.policy is not None:
+				self.contribs.append((i, state.toplevel, val))
 		else:
+			# Outside of parallel steps keep tempvector aligned
 			super(PRAMSyncVect, self).__setitem__(i, val)
+			self.tempvector[i] = val
+		
+		self.writtenby = state.process
+	
+	def __getitem__(self, i):
+		state = self.state
+		if state.parallel:
+			if self.checkreads:
+				self.reads.append((i, state.toplevel))
+			if self.writtenby == state.process:
+				return self.tempvector[i]
+		# If self.writtenby != process means that this sync vector
+		# has been lastly overwritten by another parallel process.
+		# Since we are simulating sync parallelism, the current process
+		# should read old values from this vector, hence not read
+		# from tempvector (which holds new values).
+		return super(PRAMSyncVect, self).__getitem__(i)
+	
+	def isrow(self, i):
+		"""
+		True if cell 'i' holds a row (a list) rather than a value.
+		"""
+		return isinstance(super(PRAMSyncVect, self).__getitem__(i), (list, tuple))
+	
+	def commit(self):
+		"""
+		Store back the values written during a parallel step, in O(writes).
+		"""
+		if self.contribs:
+			self.resolve()
+		setitem = super(PRAMSyncVect, self).__setitem__
+		for i in self.written:
+			setitem(i, self.tempvector[i])
+		self.written = []
+
+
+	def set_policy(self, policy):
+		set_policy(self, policy)
+	
+	def resolve(self):
+		"""
+		Resolve concurrent writes according to the CRCW policy.
+		"""
+		contribs, self.contribs = self.contribs, []
+		for cell, val in resolve_writes(contribs, self.policy, self.combine, self.name).items():
+			self.tempvector[cell] = val
+
+
+def set_policy(vec, policy):
+	"""
+	Set the CRCW write-resolution policy of the PRAM vector 'vec'.
+	"""
+	vec.combine = vec.ufunc = None
+	if policy in combiners:
+		vec.combine, ufunc = combiners[policy]
+		if np is not None:
+			vec.ufunc = getattr(np, ufunc)
+	elif callable(policy):
+		vec.combine = policy
+		if np is not None and isinstance(policy, np.ufunc):
+			vec.ufunc = policy
+	elif policy is not None and policy not in policies:
+		raise Exception("Unknown CRCW policy '" + str(policy) + "'")
+	vec.policy = policy
+
+
+class PRAMSyncArray(object):
+	"""
+	A vector to be used in synchronous parallelism, in PRAMs, backed by a
+	pair of NumPy arrays: 'current' holds the values read during a parallel
+	step, 'next' receives the values written during it.
+	Both arrays hold the same values between two steps, and written indices
+	are logged in 'written', so storing back data after a step only copies
+	the dirtied cells (or the whole array in one bulk copy, if cheaper).
+	If 'shared' is set, the two arrays are kept in shared memory segments, so
+	that worker processes can read and write them (not for object arrays).
+	As in NetArrayStore, the arrays are widened (e.g. from int to float, or
+	to object) when a value written doesn't fit, and single cells are read
+	as Python values, so that results are those of the 'list' backend.
+	Vectorized steps compute on whole arrays, with NumPy arithmetic: integers
+	are read as Checked arrays, so that a step overflowing int64 runs serially.
+	"""
+	
+	def __init__(self, l, dtype=None, shared=False, state=None):
+		if np is None:
+			raise Exception("The 'numpy' PRAM backend requires NumPy")
+		self.state = state or PRAMState()
+		current = np.array(l, dtype=dtype)
+		self.blocks = []
+		if shared and current.dtype != object and current.nbytes > 0:
+			self.owner   = os.getpid()
+			self.current = self.sharedarray(current)
+			self.next    = self.sharedarray(current)
+		else:
+			self.current = current
+			self.next    = current.copy()
+		self.shared = bool(self.blocks)
+		self.writtenby = None
+		self.written = []
+		self.checkreads  = False    # Log accesses, to find conflicts
+		self.checkwrites = False
+		self.reads  = []
+		self.writes = []
+		self.name = None
+		self.policy = None          # CRCW write-resolution policy
+		self.contribs = []          # (cell, processor, value) of a step
+		self.vstep  = None          # Vectorized processors writing 'vcells'
+		self.vcells = []            # Cells written by the first statement, vectorized
+		self.vmask  = None          # Cells written by all statements, from the second one
+	
+	def __del__(self):
+		# Only the process that created the segments releases them
+		if not getattr(self, 'blocks', None) or os.getpid() != self.owner:
+			return
+		del self.current, self.next
+		for block in self.blocks:
+			try:
+				block.close()
+			except BufferError:
+				pass    # Some views of the arrays are still alive
+			block.unlink()
+	
+	def sharedarray(self, a):
+		block = synchronous_workers.shared_memory.SharedMemory(create=True, size=a.nbytes)
+		self.blocks.append(block)
+		s = np.ndarray(a.shape, dtype=a.dtype, buffer=block.buf)
+		s[...] = a
+		return s
+	
+	def __len__(self):
+		return len(self.current)
+	
+	def __iter__(self):
+		return iter(self.current)
+	
+	def __str__(self):
+		return str(self.current.tolist())
+	
+	__repr__ = __str__
+	
+	def fits(self, val, dtype=None):
+		"""
+		True if 'val' (a value, or an array) can be stored as it is (in an
+		array of 'dtype', by default that of the vector).
+		"""
+		dtype = self.next.dtype if dtype is None else dtype
+		kind = dtype.kind
+		if kind == 'O':
+			return True
+		if isinstance(val, np.ndarray):
+			return np.can_cast(val.dtype, dtype)
+		if isinstance(val, (bool, np.bool_)):
+			return kind == 'b' or kind == 'i'
+		if isinstance(val, numbers.Integral):
+			return (kind == 'i' and -2**63 <= val < 2**63) or (kind == 'f' and -2**53 <= val <= 2**53)
+		return kind == 'f' and isinstance(val, numbers.Real)
+	
+	def widen(self, val):
+		"""
+		Widen the arrays so that they can hold 'val'. Arrays widened are no
+		longer shared: later steps run in a single process.
+		"""
+		if self.shared and os.getpid() != self.owner:
+			raise Exception("Value " + repr(val) + " doesn't fit vector " + str(self.name) + " in a worker process: create it with a wider dtype")
+		dtype = np.asarray(val).dtype
+		dtype = np.result_type(self.next.dtype, dtype) if dtype.kind in 'biuf' else np.dtype(object)
+		if not self.fits(val, dtype):
+			dtype = np.dtype(object)
+		self.current = self.current.astype(dtype)
+		self.next    = self.next.astype(dtype)
+		self.shared = False
+	
+	def __setitem__(self, i, val):
+		if not self.fits(val):
+			self.widen(val)
+		state = self.state
+		if state.parallel:
+			if self.policy is not None:
+				self.contribs.append((i, state.toplevel, val))
+			if self.policy is not None and isinstance(state.process, Vectorized):
+				if self.combine is not None and self.ufunc is None:
+					raise NotVectorizable   # Combining needs a NumPy ufunc
+				# Values are stored by resolve(), at the end of the step
+			else:
+				if isinstance(state.process, Vectorized) and self.policy is None:
+					self.overlaps(i, state.process)
+				self.next[i] = val
+			self.written.append(i)
+			if self.checkwrites:
+				self.writes.append((i, state.toplevel))
+		else:
+			# Outside of parallel steps keep both buffers aligned
+			self.current[i] = val
+			self.next[i] = val
 		
-		self.writtenby = process
+		self.writtenby = state.process
+	
+	def overlaps(self, i, process):
+		"""
+		Raise NotVectorizable if the vectorized 'process' writes cells 'i'
+		that an earlier statement of its body wrote: the last statement would
+		win, instead of the last processor, as when run one by one.
+		"""
+		if self.vstep is not process:
+			self.vstep, self.vcells, self.vmask = process, [], None
+		cells = np.ravel(i) if isinstance(i, (int, np.integer, np.ndarray)) else None
+		if not self.vcells:
+			self.vcells.append(cells)
+			return
+		if cells is None or self.vcells[0] is None:
+			raise NotVectorizable
+		# Cells are marked in a mask as long as the vector, with no sorting
+		if self.vmask is None:
+			self.vmask = np.zeros(len(self.current), dtype=bool)
+			self.vmask[self.vcells[0]] = True
+		if self.vmask[cells].any():
+			raise NotVectorizable
+		self.vmask[cells] = True
 	
 	def __getitem__(self, i):
-		if parallel and self.writtenby == process:
-			return self.tempvector[i]
+		state = self.state
+		if state.parallel:
+			if self.checkreads:
+				self.reads.append((i, state.toplevel))
+			if self.writtenby == state.process:
+				if isinstance(state.process, Vectorized):
+					# Reading back values written in the same step depends on
+					# the order of processors: run this step one by one
+					raise NotVectorizable
+				val = self.next[i]
+			else:
+				val = self.current[i]
+			if isinstance(state.process, Vectorized) and isinstance(val, np.ndarray) and val.dtype.kind in 'iu':
+				return val.view(Checked)
+		else:
+			# See PRAMSyncVect.__getitem__
+			val = self.current[i]
+		return val.item() if isinstance(val, np.generic) else val
+	
+	def isrow(self, i):
+		"""
+		True if cell 'i' is a row (of a matrix) rather than a value.
+		"""
+		return self.current.ndim > 1 and not isinstance(i, tuple)
+	
+	def tolist(self):
+		return self.current.tolist()
+	
+	def commit(self):
+		"""
+		Store back the values written during a parallel step, in O(writes).
+		"""
+		self.writtenby = None
+		self.vstep, self.vcells, self.vmask = None, [], None
+		if self.contribs:
+			self.resolve()
+		if not self.written:
+			return
+		if len(self.written) >= len(self.current):
+			np.copyto(self.current, self.next)
 		else:
-			# If self.writtenby != process means that this sync vector
-			# has been lastly overwritten by another parallel process.
-			# Since we are simulating sync parallelism, the current process
-			# should read old values from this vector, hence not read
-			# from tempvector (which holds new values).
-			return super(PRAMSyncVect, self).__getitem__(i)
+			# Plain indices are copied with a single fancy-indexing assignment
+			idx = [ i for i in self.written if isinstance(i, (int, np.integer)) ]
+			if idx:
+				idx = np.array(idx, dtype=np.intp)
+				self.current[idx] = self.next[idx]
+			if len(idx) < len(self.written):
+				for i in self.written:
+					if not isinstance(i, (int, np.integer)):
+						self.current[i] = self.next[i]
+		self.written = []
+	
+	def rollback(self):
+		"""
+		Discard the values written during a parallel step.
+		"""
+		for i in self.written:
+			self.next[i] = self.current[i]
+		self.written = []
+		self.writtenby = None
+		self.vstep, self.vcells, self.vmask = None, [], None
+		self.reads  = []
+		self.writes = []
+		self.contribs = []
+	
+	def set_policy(self, policy):
+		set_policy(self, policy)
+	
+	def resolve(self):
+		"""
+		Resolve concurrent writes according to the CRCW policy. Writes of
+		vectorized steps are resolved with NumPy ('arbitrary' as 'priority'):
+		combining policies go through the ufunc.at() of their operation.
+		"""
+		contribs, self.contribs = self.contribs, []
+		if not any(isinstance(proc, Vectorized) for cell, proc, val in contribs):
+			for cell, val in resolve_writes(contribs, self.policy, self.combine, self.name).items():
+				self.next[cell] = val
+			return
+		# Flatten all writes into arrays of cells, processors and values;
+		# in a vectorized step the k-th processor wrote the k-th cell
+		flat = self.next.reshape(-1)
+		cells, ids, vals = [], [], []
+		for cell, proc, val in contribs:
+			if isinstance(cell, tuple):
+				cell = np.ravel_multi_index(np.broadcast_arrays(*cell), self.next.shape)
+			cell, procs = proc.owners(cell)
+			cells.append(cell)
+			ids.append(procs)
+			vals.append(np.broadcast_to(np.asarray(val, dtype=flat.dtype).ravel() if np.ndim(val) else val, cell.shape))
+		cells = np.concatenate(cells)
+		ids   = np.concatenate(ids)
+		vals  = np.concatenate(vals)
+
+		# 'min' and 'max' give the same result on any order and repetition
+		# of the writes: no need to sort them
+		if self.policy in ('min', 'max'):
+			flat[cells] = vals
+			self.ufunc.at(flat, cells, vals)
+			return
+
+		# Sort by cell and processor, keeping the last write of each processor
+		seq = np.arange(len(cells))
+		order = np.lexsort((-seq, ids, cells))
+		cells, ids, vals = cells[order], ids[order], vals[order]
+		keep = np.ones(len(cells), dtype=bool)
+		keep[1:] = (cells[1:] != cells[:-1]) | (ids[1:] != ids[:-1])
+		cells, ids, vals = cells[keep], ids[keep], vals[keep]
+		
+		# First write of each cell, i.e. by its lowest processor
+		first = np.ones(len(cells), dtype=bool)
+		first[1:] = cells[1:] != cells[:-1]
+		if self.policy == 'common':
+			start = np.maximum.accumulate(np.where(first, np.arange(len(cells)), 0))
+			wrong = vals != vals[start]
+			if np.any(wrong):
+				k = np.flatnonzero(wrong)[0]
+				raise AccessConflict('Processors %s and %s write different values in cell %s of vector %s, with policy common' % \
+					(ids[start[k]], ids[k], cells[k], self.name))
+		flat[cells[first]] = vals[first]
+		if self.combine is not None:
+			self.ufunc.at(flat, cells[~first], vals[~first])
+
+
+class PRAMSyncView(object):
+	"""
+	A row or a column of a PRAM matrix: its cells are read and written in
+	the matrix itself, nothing is copied.
+	"""
+	
+	def __init__(self, matrix, start, step, length):
+		self.matrix = matrix
+		self.start  = start
+		self.step   = step
+		self.length = length
+	
+	def __len__(self):
+		return self.length
+	
+	def __iter__(self):
+		for j in range(self.length):
+			yield self[j]
+	
+	def __getitem__(self, j):
+		if isinstance(j, slice):
+			start, stop, step = j.indices(self.length)
+			return PRAMSyncView(self.matrix, self.start + start*self.step, self.step*step, len(range(start, stop, step)))
+		return self.matrix.getcell(self.start + j*self.step)
+	
+	def __setitem__(self, j, val):
+		self.matrix.setcell(self.start + j*self.step, val)
+	
+	def tolist(self):
+		return list(self)
+	
+	def __str__(self):
+		return str(self.tolist())
+	
+	__repr__ = __str__
+
+
+def ismatrix(l):
+	"""
+	True if 'l' is a 2-D NumPy array, or a list of lists of the same length.
+	"""
+	if np is not None and isinstance(l, np.ndarray):
+		return l.ndim == 2
+	return isinstance(l, list) and len(l) > 0 and \
+		all(isinstance(row, list) and len(row) == len(l[0]) for row in l)
+
+
+class PRAMSyncMatrix(object):
+	"""
+	A matrix to be used in synchronous parallelism, in PRAMs, stored row by
+	row in one flat vector of the PRAM backend, so every cell is double
+	buffered as in any other vector. Cells are accessed as M[i][j] or
+	M[i,j]; M[i] (or M[i,:]) and M[:,j] are views of a row and of a column.
+	Accesses are logged (and conflicts reported) with the flat index
+	i*cols + j of the cell.
+	"""
+	
+	def __init__(self, l, **kwargs):
+		if np is not None and isinstance(l, np.ndarray):
+			self.rows, self.cols = l.shape
+			flat = l.ravel()
+		else:
+			self.rows, self.cols = len(l), len(l[0])
+			flat = [ x for row in l for x in row ]
+		super(PRAMSyncMatrix, self).__init__(flat, **kwargs)
+		# Cells are read and written by flat index i*cols + j
+		self.getcell = super(PRAMSyncMatrix, self).__getitem__
+		self.setcell = super(PRAMSyncMatrix, self).__setitem__
+	
+	def row(self, i):
+		return PRAMSyncView(self, i*self.cols, 1, self.cols)
+	
+	def col(self, j):
+		return PRAMSyncView(self, j, self.cols, self.rows)
+	
+	def __len__(self):
+		return self.rows
+	
+	def __iter__(self):
+		for i in range(self.rows):
+			yield self.row(i)
+	
+	def __getitem__(self, i):
+		if not isinstance(i, tuple):
+			return self.row(i)
+		i, j = i
+		if isinstance(i, slice) and i == slice(None):
+			return self.col(j)
+		if isinstance(j, slice) and j == slice(None):
+			return self.row(i)
+		return self.getcell(i*self.cols + j)
+	
+	def __setitem__(self, i, val):
+		if not isinstance(i, tuple):
+			# Write a whole row
+			row = self.row(i)
+			for j in range(self.cols):
+				row[j] = val[j]
+			return
+		i, j = i
+		self.setcell(i*self.cols + j, val)
+	
+	def tolist(self):
+		return [ row.tolist() for row in self ]
+	
+	def __str__(self):
+		return str(self.tolist())
+	
+	__repr__ = __str__
+
+
+class PRAMSyncVectMatrix(PRAMSyncMatrix, PRAMSyncVect): pass
+class PRAMSyncArrayMatrix(PRAMSyncMatrix, PRAMSyncArray): pass
+
+
+# Memory backends for PRAM vectors, and for PRAM matrices
+backends = {
+	'list':  PRAMSyncVect,
+	'numpy': PRAMSyncArray,
+}
+matrices = {
+	'list':  PRAMSyncVectMatrix,
+	'numpy': PRAMSyncArrayMatrix,
+}
 
 
 class PRAM:
+	"""
+	A PRAM, holding vectors in its shared memory.
+	The 'backend' selects how vectors are stored: 'list' (the default, plain
+	Python lists) or 'numpy' (double-buffered NumPy arrays, much faster on
+	big vectors). Lists of lists of the same length, and 2-D NumPy arrays,
+	are stored as matrices (see PRAMSyncMatrix).
+	With 'vectorize' set (only for the 'numpy' backend), every parallel step
+	is first tried as a single call of its body over the whole array of
+	indices, so that an elementwise body like a[i] = a[2*i] + a[2*i+1]
+	becomes one NumPy gather/compute/scatter. Bodies that can't work on
+	arrays (e.g. branching on their index) run one processor at a time.
+	With 'workers' greater than 1 (only for the 'numpy' backend), vectors
+	are kept in shared memory and the processors of each step are split
+	among that many forked worker processes, which write into the 'next'
+	buffers; the step ends when all workers are done. Steps run in a single
+	process when some vector can't be shared (e.g. it holds None values).
+	With 'model' set to 'EREW', 'CREW' or 'CRCW', every step logs the cells
+	read and written by each processor, and at its end the concurrent accesses
+	forbidden by the model are recorded in 'conflicts' (raised as
+	AccessConflict if 'strict' is set). Accesses made by nested steps count
+	as made by the processor of the outermost step.
+	Concurrent writes to a vector follow its CRCW policy, set with
+	set_policy(): see its documentation.
+	Every step is counted in 'steps', its processors in 'work' and its
+	simulated time in 'time': by Brent's theorem, a step of n processors
+	takes ceil(n/p) time units on a PRAM of p 'processors' (1 if it is
+	None, i.e. one physical processor for each virtual one). Vectorized
+	steps are run in chunks of p processors. Nested steps run within a
+	processor of the outer step, so they are not counted.
+	"""
 	
-	def __init__(self, vectors):
+	def __init__(self, vectors, backend='list', vectorize=False, workers=1, model=None, strict=False, processors=None):
+		if backend not in backends:
+			raise Exception("Unknown PRAM backend '" + str(backend) + "'")
+		if vectorize and backend != 'numpy':
+			raise Exception("Vectorized steps need the 'numpy' PRAM backend")
+		if workers > 1 and (backend != 'numpy' or synchronous_workers.shared_memory is None):
+			raise Exception("Worker processes need the 'numpy' PRAM backend and shared memory")
+		if model is not None and model not in models:
+			raise Exception("Unknown PRAM model '" + str(model) + "'")
+		self.state = PRAMState()
+		self.backend = backend
+		self.vectorize = vectorize
+		self.unvectorizable = set()   # Code of bodies that failed on arrays
+		self.workers = workers
+		self.inworker = False         # True inside worker processes
+		self.model = model
+		self.strict = strict
+		self.conflicts = []           # (forall, vector, 'read'/'write', cells)
+		self.processors = processors
+		self.steps = 0
+		self.work  = 0
+		self.time  = 0
 		self.vectors = {}
 		for v in vectors:
-			self.vectors[v] = PRAMSyncVect(vectors[v])
+			self[v] = vectors[v]
 	
 	def __setitem__(self, name, vector):
-		self.vectors[name] = PRAMSyncVect(vector)
+		kind = matrices if ismatrix(vector) else backends
+		if self.backend == 'numpy':
+			shared = self.workers > 1 and not self.inworker
+			self.vectors[name] = kind['numpy'](vector, shared=shared, state=self.state)
+		else:
+			self.vectors[name] = kind[self.backend](vector, state=self.state)
+		self.vectors[name].name = name
+		if self.model is not None:
+			self.vectors[name].checkreads, self.vectors[name].checkwrites = models[self.model]
+	
+	def set_policy(self, name, policy):
+		"""
+		Set how concurrent writes to the same cell of vector 'name' are
+		resolved, at the end of each step:
+		 - None:        the last processor to execute wins (the default)
+		 - 'arbitrary': any of the processors wins
+		 - 'priority':  the processor with the lowest index wins
+		 - 'common':    all processors must write the same value, otherwise
+		                AccessConflict is raised
+		 - 'sum', 'min', 'max', or any associative function: the written
+		   values are combined (in order of processor index).
+		Vectorized steps resolve combining policies with ufunc.at(), so they
+		need 'sum', 'min', 'max' or a NumPy ufunc.
+		"""
+		self.vectors[name].set_policy(policy)
+	
+	def where(self, indices, cond):
+		"""
+		The indices in the range 'indices' satisfying 'cond' (a forall with
+		an 'if'). With 'vectorize' set, 'cond' is first computed as a mask
+		over the whole array of indices.
+		"""
+		if self.vectorize:
+			idx = np.array(indices)
+			try:
+				mask = np.asarray(cond(idx), dtype=bool)
+				if mask.shape == idx.shape:
+					return idx[mask]
+			except Exception:
+				pass
+		return [ i for i in indices if cond(i) ]
+	
+	def segments_reader(self, segments):
+		"""
+		Return a function reading the k-th element of the s-th vector of
+		'segments'. Views of the same matrix are read straight from it, so
+		that the function works on arrays of indices too (vectorized steps).
+		"""
+		matrix = getattr(segments[0], 'matrix', None)
+		if not all(isinstance(v, PRAMSyncView) and v.matrix is matrix for v in segments):
+			return lambda s, k: segments[s][k]
+		starts = [ v.start for v in segments ]
+		steps  = [ v.step  for v in segments ]
+		if self.vectorize:
+			starts, steps = np.array(starts), np.array(steps)
+		getcell = matrix.getcell
+		return lambda s, k: getcell(starts[s] + k*steps[s])
+	
+	def segmented_reduce(self, segments, op=operator.add, identity=None):
+		"""
+		Reduce with the associative 'op' each of the vectors (or views) in
+		'segments', all of the same length m, at once: they become the
+		leaves of one heap each, kept as the rows of the single matrix
+		'segments', and each level of all heaps is computed in one step, for
+		O(log m) steps overall. If m is not a power of 2, the leaves are
+		padded with 'identity'. Return the view of the results.
+		"""
+		nseg, m = len(segments), len(segments[0])
+		size = 1
+		while size < m:
+			size *= 2
+		if size != m and identity is None:
+			raise Exception("Segments whose length is not a power of 2 need the identity of 'op'")
+		fill = identity if identity is not None else segments[0][0]
+		self['segments'] = [ [ fill ] * (2*size) for s in range(nseg) ]
+		H = self['segments']
+		getcell, setcell = H.getcell, H.setcell
+		read = self.segments_reader(segments)
+		
+		# Heap node i of segment s is cell s*2*size + i of the matrix
+		def leaf(s, k):
+			setcell(s*2*size + size+k, read(s, k))
+		self.forall_do_in_parallel([ (s, k) for s in range(nseg) for k in range(m) ], leaf)
+		
+		# Ascending from last node level (not the leaves) to the roots
+		d = size // 2
+		while d >= 1:
+			def node(s, i):
+				c = s*2*size
+				setcell(c + i, op(getcell(c + 2*i), getcell(c + 2*i+1)))
+			self.forall_do_in_parallel([ (s, i) for s in range(nseg) for i in range(d, 2*d) ], node)
+			d //= 2
+		
+		return H[:, 1]
+	
+	def segmented_scan(self, segments, op=operator.add, identity=None, inclusive=True):
+		"""
+		Scan with the associative 'op' each of the vectors (or views) in
+		'segments', all of the same length m, at once: they are copied in
+		the rows of the single matrix 'scans', and every doubling round of
+		all rows is computed in one step, for O(log m) steps overall.
+		Exclusive scans start from 'identity'. Return the matrix of scans.
+		"""
+		nseg, m = len(segments), len(segments[0])
+		if not inclusive and identity is None:
+			raise Exception("Exclusive scans need the identity of 'op'")
+		fill = identity if identity is not None else segments[0][0]
+		self['scans'] = [ [ fill ] * m for s in range(nseg) ]
+		X = self['scans']
+		getcell, setcell = X.getcell, X.setcell
+		read = self.segments_reader(segments)
+		
+		# An exclusive scan is the inclusive one of the segment shifted right
+		shift = 0 if inclusive else 1
+		def place(s, k):
+			setcell(s*m + k+shift, read(s, k))
+		self.forall_do_in_parallel([ (s, k) for s in range(nseg) for k in range(m - shift) ], place)
+		
+		d = 1
+		while d < m:
+			def double(s, k):
+				c = s*m + k
+				setcell(c, op(getcell(c-d), getcell(c)))
+			self.forall_do_in_parallel([ (s, k) for s in range(nseg) for k in range(d, m) ], double)
+			d *= 2
+		
+		return X
 	
 	def __getitem__(self, name):
 		return self.vectors[name]
@@ -73,32 +937,158 @@ class PRAM:
 		return s
 	
 	def forall_do_in_parallel(self, indices, func):
-		global parallel, process
-		was_already_parallel = parallel      # for nested parallel loops
+		state = self.state
+		if isinstance(state.process, Vectorized):
+			# Nested parallel loops are executed one processor at a time
+			raise NotVectorizable
+		was_already_parallel = state.parallel      # for nested parallel loops
+		outer = state.process
+		if not was_already_parallel:
+			if not isinstance(indices, (list, tuple, range_type)):
+				indices = list(indices)
+			self.steps += 1
+			self.work  += len(indices)
+			self.time  += -(-len(indices) // self.processors) if self.processors else 1
 		
-		#parallel = False
-		
-		# Copy data to temporal vectors
-		if not was_already_parallel:	# If nested parallel loop (esample when calling SUM inside loops), skip this
+		# No need to copy data to temporal vectors: they are kept aligned
+		# between steps, and only written cells are stored back.
+		# A nested step sees what its processor wrote before starting it
+		if was_already_parallel:
 			for name,vec in self.vectors.items():
-				for i in range(len(vec)):
-					vec.tempvector[i] = vec[i]
+				vec.commit()
+		
+		# Execute 'func' over all indices at once, if possible
+		done = False
+		if self.vectorize and not was_already_parallel and func.__code__ not in self.unvectorizable:
+			done = self.vectorized_step(indices, func)
+		
+		# Split processors among worker processes, if possible
+		if not done and self.workers > 1 and not was_already_parallel and synchronous_workers.available():
+			done = self.processes_step(list(indices), func)
 		
 		# Execute 'func' over each processor 'i' in 'indices'
-		parallel = True
-		for i in indices:
-			process = i
-			if isinstance(i, (tuple, list)):
-				func(*i)
-			else:
-				func(i)
-		parallel = False
+		if not done:
+			state.parallel = True
+			for i in indices:
+				state.process = i
+				if not was_already_parallel:
+					state.toplevel = i
+				if isinstance(i, (tuple, list)):
+					func(*i)
+				else:
+					func(i)
+			state.parallel = False
+		
+		# Look for concurrent accesses forbidden by the model
+		if self.model is not None and not was_already_parallel:
+			self.check_step(func, len(indices))
 		
-		# Store back data, after "parallel" execution
+		# Store back written data, after "parallel" execution
 		for name,vec in self.vectors.items():
-			for i in range(len(vec)):
-				vec[i] = vec.tempvector[i]
+			vec.commit()
 		
-		parallel = was_already_parallel
-		process  = None
+		state.parallel = was_already_parallel
+		state.process  = outer
 	
+	
+	def vectorized_step(self, indices, func):
+		"""
+		Execute 'func' once, passing it arrays of indices instead of single
+		indices. Reads get the old values, writes go to the new ones, as in
+		any parallel step. Return False if 'func' can't be run on arrays: in
+		that case all its writes are discarded.
+		"""
+		state = self.state
+		if not indices:
+			return True
+		if isinstance(indices, range_type) and hasattr(indices, 'step'):
+			idx = np.arange(indices.start, indices.stop, indices.step)
+		else:
+			idx = np.array(indices)
+		if idx.ndim == 1:
+			args = (idx, )
+			ids = idx
+		elif idx.ndim == 2:
+			args = tuple(idx.T)
+			# Rank processors by their (lexicographic) index
+			ids = np.empty(len(idx), dtype=np.intp)
+			ids[np.lexsort(idx.T[::-1])] = np.arange(len(idx))
+		else:
+			return False
+		
+		# With 'processors' set, each physical processor runs a chunk of
+		# virtual processors: chunks are run one after the other
+		size = self.processors or len(idx)
+		state.parallel = True
+		try:
+			for start in range(0, len(idx), size):
+				state.process = state.toplevel = Vectorized(ids[start:start+size])
+				func(*[ arg[start:start+size] for arg in args ])
+		except (NotVectorizable, ValueError, TypeError):
+			# Bodies branching on their index (as 'if i % 2 == 1') fail on
+			# arrays with the ValueError (or TypeError) of bool() of an array
+			for name,vec in self.vectors.items():
+				vec.rollback()
+			self.unvectorizable.add(func.__code__)
+			return False
+		finally:
+			state.parallel = False
+			state.process  = None
+		return True
+	
+	def processes_step(self, indices, func):
+		"""
+		Execute 'func' over the processors in 'indices', split among forked
+		worker processes. Workers write into the shared 'next' buffers and
+		send back the indices they wrote, so the step is then stored back as
+		usual. Return False if some vector is not in shared memory.
+		"""
+		vectors = dict(self.vectors)
+		if len(indices) < 2 or not all(vec.shared for vec in vectors.values()):
+			return False
+		
+		def run_chunk(chunk):
+			state = self.state
+			self.inworker = True
+			state.parallel = True
+			for i in chunk:
+				state.process = state.toplevel = i
+				if isinstance(i, (tuple, list)):
+					func(*i)
+				else:
+					func(i)
+			state.parallel = False
+			# Vectors created by the worker itself are local scratch space
+			return dict((name, (vec.written, vec.reads, vec.writes, vec.contribs)) for name,vec in vectors.items())
+		
+		for logs in synchronous_workers.fork_map(run_chunk, synchronous_workers.chunks(indices, self.workers)):
+			for name in logs:
+				written, reads, writes, contribs = logs[name]
+				vectors[name].written.extend(written)
+				vectors[name].reads.extend(reads)
+				vectors[name].writes.extend(writes)
+				vectors[name].contribs.extend(contribs)
+		return True
+	
+	def check_step(self, func, nprocs):
+		"""
+		Record (or raise) the concurrent accesses, forbidden by the model,
+		made during the step that executed 'func' over 'nprocs' processors.
+		"""
+		for name,vec in self.vectors.items():
+			for kind, accesses in (('read', vec.reads), ('write', vec.writes)):
+				if kind == 'write' and vec.policy is not None:
+					continue    # Concurrent writes are resolved by the policy
+				cells = [ c for c in concurrent_cells(accesses, nprocs) if not vec.isrow(c) ]
+				if not cells:
+					continue
+				code = func.__code__
+				bodies = [ f for f in code.co_names if f.startswith('par_proc_') ]
+				where = '%s (%s:%d)' % (bodies[0] if bodies else code.co_name,
+					os.path.basename(code.co_filename), code.co_firstlineno)
+				self.conflicts.append((where, name, kind, cells))
+				if self.strict:
+					raise AccessConflict('Concurrent %s of cells %s of vector %s in forall %s, forbidden by the %s model' % \
+						(kind, cells[:10], name, where, self.model))
+			vec.reads  = []
+			vec.writes = []
@@ -0,0 +1,426 @@
+"""
+PySAL - Python Synchronous Algorithms Library
+------------------------------------------------------------------------
+Copyright (C) 2012  Matteo Brucato  <mattfeel@gmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Sharded runs of networks (see SyncNet.run_sharded()) over TCP sockets:
+a Coordinator hands out the blocks of a network to worker processes,
+possibly on other hosts, which then exchange the messages of every
+superstep directly with each other, in a compact binary encoding.
+
+Start a worker with: python synchronous_sockets.py HOST PORT
+(HOST and PORT of the coordinator), with the key of the coordinator in
+hexadecimal in the environment variable PYSAL_AUTHKEY. Every frame is
+signed with an HMAC of that key, as the connections of multiprocessing
+with an authkey: frames can contain pickles, so only the processes
+knowing the key are trusted.
+"""
+from __future__ import print_function
+import os, sys, socket, struct, subprocess, threading, time, traceback, pickle, importlib, runpy
+import binascii, hashlib, hmac
+
+from synchronous_workers import GroupAborted, WorkerError
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+ABORT = 0xffffffff   # Sequence number of the frames aborting a group
+TIMEOUT = 60         # Seconds to wait for the workers and their setup frames
+
+# A frame is not signed with the key of the run
+class AuthenticationError(Exception): pass
+
+
+########################################################################
+## Binary encoding of messages
+########################################################################
+def pack(obj, out=None):
+	"""
+	Encode 'obj' (None, bools, ints, floats, strings, lists, tuples, dicts
+	and NumPy arrays, nested) as bytes: lists of ints and numeric arrays
+	are stored as raw machine words. Other objects are pickled.
+	"""
+	top = out is None
+	if top:
+		out = []
+	if obj is None:
+		out.append(b'N')
+	elif obj is True or obj is False:
+		out.append(b'T' if obj else b'F')
+	elif type(obj) is int and -2**63 <= obj < 2**63:
+		out.append(b'i' + struct.pack('<q', obj))
+	elif type(obj) is float:
+		out.append(b'd' + struct.pack('<d', obj))
+	elif type(obj) is str:
+		data = obj.encode('utf-8')
+		out.append(b's' + struct.pack('<I', len(data)) + data)
+	elif type(obj) is list and obj and all(type(x) is int and -2**63 <= x < 2**63 for x in obj):
+		out.append(b'q' + struct.pack('<I%dq' % len(obj), len(obj), *obj))
+	elif type(obj) in (list, tuple):
+		out.append((b'l' if type(obj) is list else b't') + struct.pack('<I', len(obj)))
+		for x in obj:
+			pack(x, out)
+	elif type(obj) is dict:
+		out.append(b'D' + struct.pack('<I', len(obj)))
+		for k, v in obj.items():
+			pack(k, out)
+			pack(v, out)
+	elif np is not None and isinstance(obj, (np.ndarray, np.generic)) and obj.dtype.kind in 'biuf':
+		obj = np.ascontiguousarray(obj)
+		dtype = obj.dtype.str.encode('ascii')
+		out.append(b'a' + struct.pack('<BB', len(dtype), obj.ndim) + dtype)
+		out.append(struct.pack('<%dQ' % obj.ndim, *obj.shape) + obj.tobytes())
+	else:
+		data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+		out.append(b'p' + struct.pack('<I', len(data)) + data)
+	if top:
+		return b''.join(out)
+
+
+def unpack(buf, pos=0, top=True):
+	"""
+	Decode the bytes 'buf' written by pack().
+	"""
+	tag = buf[pos:pos+1]
+	pos += 1
+	if tag == b'N':
+		obj = None
+	elif tag in (b'T', b'F'):
+		obj = tag == b'T'
+	elif tag == b'i':
+		obj, = struct.unpack_from('<q', buf, pos)
+		pos += 8
+	elif tag == b'd':
+		obj, = struct.unpack_from('<d', buf, pos)
+		pos += 8
+	elif tag == b's':
+		n, = struct.unpack_from('<I', buf, pos)
+		obj = buf[pos+4:pos+4+n].decode('utf-8')
+		pos += 4 + n
+	elif tag == b'q':
+		n, = struct.unpack_from('<I', buf, pos)
+		obj = list(struct.unpack_from('<%dq' % n, buf, pos+4))
+		pos += 4 + 8*n
+	elif tag in (b'l', b't'):
+		n, = struct.unpack_from('<I', buf, pos)
+		pos += 4
+		obj = []
+		for k in range(n):
+			x, pos = unpack(buf, pos, False)
+			obj.append(x)
+		if tag == b't':
+			obj = tuple(obj)
+	elif tag == b'D':
+		n, = struct.unpack_from('<I', buf, pos)
+		pos += 4
+		obj = {}
+		for k in range(n):
+			key, pos = unpack(buf, pos, False)
+			obj[key], pos = unpack(buf, pos, False)
+	elif tag == b'a':
+		n, ndim = struct.unpack_from('<BB', buf, pos)
+		dtype = np.dtype(buf[pos+2:pos+2+n].decode('ascii'))
+		pos += 2 + n
+		shape = struct.unpack_from('<%dQ' % ndim, buf, pos)
+		pos += 8*ndim
+		size = dtype.itemsize
+		for d in shape:
+			size *= d
+		obj = np.frombuffer(buf, dtype=dtype, count=size // dtype.itemsize, offset=pos).reshape(shape).copy()
+		if ndim == 0:
+			obj = obj[()]
+		pos += size
+	elif tag == b'p':
+		n, = struct.unpack_from('<I', buf, pos)
+		obj = pickle.loads(buf[pos+4:pos+4+n])
+		pos += 4 + n
+	else:
+		raise Exception('Unknown tag ' + repr(tag) + ' in message')
+	return obj if top else (obj, pos)
+
+
+########################################################################
+## Framing
+########################################################################
+def sign(key, header, data):
+	return hmac.new(key, header + data, hashlib.sha256).digest()
+
+
+def send_frame(sock, key, seq, data):
+	"""
+	Send 'data' with its sequence number 'seq': the header (sequence number
+	and length) is signed on its own, and then with the data.
+	"""
+	header = struct.pack('<II', seq, len(data))
+	sock.sendall(header + sign(key, header, b'') + data + sign(key, header, data))
+
+
+def recv_exactly(sock, n):
+	chunks = []
+	while n:
+		chunk = sock.recv(min(n, 1 << 20))
+		if not chunk:
+			raise GroupAborted('connection closed')
+		chunks.append(chunk)
+		n -= len(chunk)
+	return b''.join(chunks)
+
+
+def recv_frame(sock, key):
+	"""
+	Receive a frame sent by send_frame() with the same 'key': return its
+	sequence number and data, or raise AuthenticationError.
+	"""
+	header = recv_exactly(sock, 8)
+	# Check the length before buffering data: it could be up to 4 GB
+	if not hmac.compare_digest(recv_exactly(sock, 32), sign(key, header, b'')):
+		raise AuthenticationError('frame header not signed with the key of the run')
+	seq, n = struct.unpack('<II', header)
+	data = recv_exactly(sock, n)
+	if not hmac.compare_digest(recv_exactly(sock, 32), sign(key, header, data)):
+		raise AuthenticationError('frame not signed with the key of the run')
+	return seq, data
+
+
+def getkey():
+	"""
+	The key of the run, from the environment variable PYSAL_AUTHKEY.
+	"""
+	key = os.environ.get('PYSAL_AUTHKEY')
+	if not key:
+		raise AuthenticationError('PYSAL_AUTHKEY is not set')
+	return binascii.unhexlify(key)
+
+
+########################################################################
+## Groups of processes over TCP
+########################################################################
+class SocketGroup(object):
+	"""
+	The channels among the 'n' workers of a distributed run, as seen by
+	worker 'rank': a TCP connection to every other worker ('socks'),
+	whose frames are signed with 'key'. It has the same exchange() and
+	abort() of synchronous_workers.Group. The traffic of the last exchange
+	is in 'last': (bytes sent, bytes received, seconds).
+	"""
+
+	def __init__(self, rank, socks, key):
+		self.rank = rank
+		self.socks = socks
+		self.key = key
+		self.n = len(socks) + 1
+		self.seq = 0
+		self.last = None
+
+	def exchange(self, msgs):
+		seq = self.seq
+		self.seq += 1
+		t = time.time()
+		frames = dict((r, pack(msgs[r])) for r in self.socks)
+		# Send from other threads, so that big messages can't deadlock
+		errors = []
+		def send(r):
+			try:
+				send_frame(self.socks[r], self.key, seq, frames[r])
+			except Exception as e:
+				errors.append(e)
+		threads = [ threading.Thread(target=send, args=(r, )) for r in self.socks ]
+		for thread in threads:
+			thread.start()
+		got = [ None ] * self.n
+		got[self.rank] = msgs[self.rank]
+		received = 0
+		try:
+			for r in sorted(self.socks):
+				s, data = recv_frame(self.socks[r], self.key)
+				if s == ABORT:
+					raise GroupAborted('worker ' + str(r) + ' failed')
+				got[r] = unpack(data)
+				received += len(data) + 40
+		finally:
+			for thread in threads:
+				thread.join()
+		if errors:
+			raise GroupAborted(str(errors[0]))
+		self.last = (sum(len(f) + 40 for f in frames.values()), received, time.time() - t)
+		return got
+
+	def abort(self):
+		for sock in self.socks.values():
+			try:
+				send_frame(sock, self.key, ABORT, b'')
+			except Exception:
+				pass
+
+
+def load_module(name, path):
+	"""
+	Import the module 'name' defining the network class. The main script of
+	the coordinator is loaded from 'path' and its names are made visible as
+	names of __main__, as pickle expects: it runs again in every worker,
+	with __name__ set to '__pysal_worker__', so the code under
+	"if __name__ == '__main__':" (as the tests) doesn't run, but any other
+	code at the top level of the script does.
+	"""
+	sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+	if name != '__main__':
+		return importlib.import_module(name)
+	if not path.endswith('.py') or not os.path.isfile(path):
+		raise Exception("The network class is defined in '" + str(path) + "', not a script the workers can load")
+	main = sys.modules['__main__']
+	for k, v in runpy.run_path(path, run_name='__pysal_worker__').items():
+		if not k.startswith('__'):
+			setattr(main, k, v)
+	return main
+
+
+def worker(host, port, key, timeout=TIMEOUT):
+	"""
+	Run a worker: connect to the coordinator at 'host':'port', get a block
+	of a network, run it in a group with the other workers and send back
+	the result. All frames are signed with 'key'; the coordinator and the
+	other workers must answer within 'timeout' seconds during the setup.
+	"""
+	coord = socket.create_connection((host, port), timeout)
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	listener.bind((coord.getsockname()[0], 0))
+	listener.listen(64)
+	listener.settimeout(timeout)
+	send_frame(coord, key, 0, pack(list(listener.getsockname()[:2])))
+
+	seq, data = recv_frame(coord, key)
+	rank, peers, module, path = unpack(data)
+	load_module(module, path)
+
+	# Connect to the workers before this one, accept the others
+	socks = {}
+	for r in range(rank):
+		sock = socket.create_connection(tuple(peers[r]), timeout)
+		send_frame(sock, key, 0, struct.pack('<I', rank))
+		socks[r] = sock
+	for k in range(len(peers) - rank - 1):
+		sock, addr = listener.accept()
+		sock.settimeout(timeout)
+		seq, data = recv_frame(sock, key)
+		r, = struct.unpack('<I', data)
+		socks[r] = sock
+	listener.close()
+	for sock in socks.values():
+		sock.settimeout(None)   # Supersteps can take any time
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+	group = SocketGroup(rank, socks, key)
+
+	seq, data = recv_frame(coord, key)
+	coord.settimeout(None)
+	try:
+		net, method, args = pickle.loads(data)
+		res = (True, net.run_shard(rank, len(peers), group, getattr(net, method), args))
+	except GroupAborted as e:
+		res = (False, e)
+	except Exception as e:
+		group.abort()
+		res = (False, e)
+	try:
+		data = pickle.dumps(res, pickle.HIGHEST_PROTOCOL)
+	except Exception:
+		data = pickle.dumps((False, WorkerError(traceback.format_exc())), pickle.HIGHEST_PROTOCOL)
+	send_frame(coord, key, 0, data)
+	coord.close()
+	for sock in socks.values():
+		sock.close()
+
+
+class Coordinator(object):
+	"""
+	The coordinator of a distributed run, listening on 'host':'port' (any
+	free port if 0) for the workers. Frames are signed with 'key' (bytes):
+	by default the one in PYSAL_AUTHKEY, if set, or a random one. Workers
+	must connect and answer within 'timeout' seconds.
+	"""
+
+	def __init__(self, host='127.0.0.1', port=0, key=None, timeout=TIMEOUT):
+		if key is None:
+			key = getkey() if os.environ.get('PYSAL_AUTHKEY') else os.urandom(32)
+		self.key = key
+		self.timeout = timeout
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind((host, port))
+		self.listener.listen(64)
+		self.listener.settimeout(timeout)
+		self.host, self.port = self.listener.getsockname()[:2]
+
+	def spawn(self, n):
+		"""
+		Start 'n' local worker processes, given the key in PYSAL_AUTHKEY.
+		"""
+		env = dict(os.environ)
+		env['PYSAL_AUTHKEY'] = binascii.hexlify(self.key).decode('ascii')
+		return [
+			subprocess.Popen([ sys.executable, os.path.abspath(__file__), self.host, str(self.port) ], env=env)
+				for k in range(n)
+		]
+
+	def run(self, n, net, func, args):
+		"""
+		Wait for 'n' workers, give each a block of 'net' to run 'func' (a
+		method of 'net') with 'args' on, and return their results.
+		"""
+		key = self.key
+		conns, peers = [], []
+		for k in range(n):
+			try:
+				conn, addr = self.listener.accept()
+			except socket.timeout:
+				raise Exception('Only ' + str(k) + ' of ' + str(n) + ' workers connected in ' + str(self.timeout) + ' seconds')
+			conn.settimeout(self.timeout)
+			seq, data = recv_frame(conn, key)
+			conns.append(conn)
+			peers.append(unpack(data))
+		main = sys.modules['__main__']
+		module = type(net).__module__
+		path = getattr(sys.modules[module], '__file__', None) or getattr(main, '__file__', '')
+		for rank, conn in enumerate(conns):
+			send_frame(conn, key, 0, pack([ rank, peers, module, path ]))
+		job = pickle.dumps((net, func.__name__, args), pickle.HIGHEST_PROTOCOL)
+		for conn in conns:
+			send_frame(conn, key, 0, job)
+			conn.settimeout(None)   # The run can take any time
+		results = []
+		for conn in conns:
+			seq, data = recv_frame(conn, key)
+			results.append(pickle.loads(data))
+			conn.close()
+		errors = [ res for ok, res in results if not ok ]
+		for e in errors:
+			if not isinstance(e, GroupAborted):
+				raise e
+		if errors:
+			raise errors[0]
+		return [ res for ok, res in results ]
+
+	def close(self):
+		self.listener.close()
+
+
+if __name__ == '__main__':
+	if len(sys.argv) != 3:
+		print('Usage: python synchronous_sockets.py HOST PORT', file=sys.stderr)
+		sys.exit(1)
+	worker(sys.argv[1], int(sys.argv[2]), getkey())
@@ -16,63 +16,760 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
-import random
+import bisect, numbers, random, time
+import synchronous_workers, synchronous_sockets
 
-parallel = False
+try:
+	import numpy as np
+except ImportError:
+	np = None
 
-class Processor:
+try:
+	range_type = xrange
+except NameError:
+	range_type = range
+
+# A processor reads a value just written by a processor of another worker
+class NotParallelizable(Exception): pass
+# A step can't run over arrays of processors, only one processor at a time
+class NotVectorizable(Exception): pass
+
+
+class NetState(object):
 	"""
-	A processor to be included in a SyncNet.
+	The execution state of a SyncNet, shared by all its processors. Every
+	network has its own, so independent simulations can run concurrently
+	(e.g. in different threads).
 	"""
 	
-	def __init__(self, i, j=None):
-		self.i = i
-		self.j = j
+	def __init__(self):
+		self.parallel = False
+		self.chunk    = None   # Processors run by this worker process, if any
+
+
+class Unset(object):
+	"""
+	Value of the variables of a processor that have not been set yet.
+	"""
+	def __repr__(self):
+		return 'UNSET'
+	
+	def __reduce__(self):
+		# Sent to other processes as the one UNSET
+		return 'UNSET'
+
+UNSET = Unset()
+
+
+# Slots of the variables named by compiled algorithms, for all networks
+slotnames = []   # Slot -> variable
+slotids   = {}   # Variable -> slot
+
+def slot(var):
+	"""
+	The slot of variable 'var', assigned on the first request. Compiled
+	algorithms (see pysal.py) read and write the variables of processors by
+	slot, so that the vectors of the store are indexed directly, without
+	hashing their names.
+	"""
+	k = slotids.get(var)
+	if k is None:
+		k = slotids[var] = len(slotnames)
+		slotnames.append(var)
+	return k
+
+
+class NetStore(object):
+	"""
+	The state of all the processors of a SyncNet, as a struct of arrays:
+	one vector per variable, indexed by processor id. 'data' maps every
+	variable to the values of the last step, 'tdata' to the values being
+	written during a step. Vectors are Python lists, holding any value
+	(UNSET for the processors that didn't set the variable yet).
+	Between steps 'tdata' is equal to 'data'. The cells written during a
+	step are logged in 'written', and at the end of the step the two
+	generations of the written variables are swapped: only the cells
+	written are copied, to bring the new 'tdata' up to date.
+	The vectors of the variables with a slot (see slot()) are also in
+	'vdata' and 'vtdata', indexed by slot (None if not created yet).
+	"""
+	
+	slotted = True   # Vectors hold UNSET, and can be indexed by slot
+	columns = False  # Vectors are arrays indexed by slot, with 'visset'
+	
+	def __init__(self, size):
+		self.size  = size
 		self.data  = {}
 		self.tdata = {}
-		self.nb = []
+		self.written = {}   # Variable -> ids written in the current step
+		self.vdata  = [ None ] * len(slotnames)
+		self.vtdata = [ None ] * len(slotnames)
+	
+	def add(self, var, val):
+		"""
+		Create the vectors of variable 'var', able to hold 'val'.
+		"""
+		self.data[var]  = [ UNSET ] * self.size
+		self.tdata[var] = [ UNSET ] * self.size
+		self.bind(var)
+	
+	def bind(self, var):
+		"""
+		Index the vectors of variable 'var' by its slot, if it has one.
+		"""
+		k = slotids.get(var)
+		if k is None:
+			return
+		while len(self.vdata) <= k:
+			self.vdata.append(None)
+			self.vtdata.append(None)
+		self.vdata[k]  = self.data[var]
+		self.vtdata[k] = self.tdata[var]
+	
+	def getslot(self, k, p, new=False):
+		"""
+		As get(), for the variable with slot 'k': UNSET also if the vectors
+		of the variable are not indexed by slot.
+		"""
+		vec = (self.vtdata if new else self.vdata)[k] if k < len(self.vdata) else None
+		if vec is None:
+			return UNSET
+		try:
+			return vec[p]
+		except KeyError:
+			return UNSET    # Not set, in a NetSparseStore
+	
+	def get(self, var, p, new=False):
+		vec = (self.tdata if new else self.data).get(var)
+		if vec is None:
+			return UNSET
+		return vec[p]
+	
+	def set(self, var, p, val, new=False):
+		if var not in self.data:
+			self.add(var, val)
+		self.tdata[var][p] = val
+		if new:
+			self.written.setdefault(var, []).append(p)
+		else:
+			self.data[var][p] = val
+	
+	def fill(self, var, values):
+		"""
+		Set variable 'var' of all processors, outside of parallel steps.
+		"""
+		values = list(values)
+		if var not in self.data:
+			self.add(var, values[0])
+		for p, val in enumerate(values):
+			self.data[var][p] = self.tdata[var][p] = val
+	
+	def variables(self, p):
+		"""
+		Names of the variables set by processor 'p'.
+		"""
+		return sorted(var for var in self.data if self.get(var, p) is not UNSET)
+	
+	def commit(self):
+		"""
+		End a step: the values written in 'tdata' become the current ones.
+		"""
+		for var, cells in self.written.items():
+			data, tdata = self.tdata[var], self.data[var]
+			self.data[var], self.tdata[var] = data, tdata
+			self.bind(var)
+			for p in cells:
+				tdata[p] = data[p]
+		self.written = {}
+	
+	def extract(self):
+		"""
+		The values written in the current step (sent back by worker
+		processes), as variable -> (ids, values).
+		"""
+		return dict(
+			(var, (cells, [ self.get(var, p, True) for p in cells ]))
+				for var, cells in self.written.items()
+		)
+	
+	def load(self, values):
+		"""
+		Write the 'values' returned by extract() in the current step.
+		"""
+		for var, (cells, vals) in values.items():
+			for p, val in zip(cells, vals):
+				self.set(var, p, val, True)
+	
+	def rollback(self):
+		"""
+		Discard all the writes of the current step.
+		"""
+		for var, cells in self.written.items():
+			data, tdata = self.data[var], self.tdata[var]
+			for p in cells:
+				tdata[p] = data[p]
+		self.written = {}
+	
+	def take(self, var, cells):
+		"""
+		The processors among 'cells' that set variable 'var', and their
+		values, outside of steps.
+		"""
+		data = self.data[var]
+		cells = [ p for p in cells if data[p] is not UNSET ]
+		return cells, [ data[p] for p in cells ]
+	
+	def write(self, var, cells, values):
+		"""
+		Set variable 'var' of the processors 'cells' to 'values' (from
+		take()), outside of steps.
+		"""
+		for p, val in zip(cells, values):
+			self.set(var, p, val)
+	
+	def __getstate__(self):
+		# Slots are assigned by each process: bound again when loaded
+		state = dict(self.__dict__)
+		state['vdata']  = []
+		state['vtdata'] = []
+		if 'visset' in state:
+			state['visset'] = []
+		return state
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		for var in self.data:
+			self.bind(var)
+
+
+class NetArrayStore(NetStore):
+	"""
+	A NetStore whose vectors are typed NumPy arrays: the type of each
+	variable comes from its first value, and it is widened (e.g. from int
+	to float, or to object) when a value doesn't fit. The cells set so far
+	are marked in 'isset', one mask for both 'data' and 'tdata'. Cells not
+	set don't hold UNSET: the arrays of the variables with a slot are in
+	'vdata' and 'vtdata', and their masks in 'visset', all indexed by slot
+	(see ArrayStepProcessor).
+	"""
+	
+	slotted = False
+	columns = True
+	
+	def __init__(self, size):
+		if np is None:
+			raise Exception("The 'numpy' network backend requires NumPy")
+		NetStore.__init__(self, size)
+		self.isset = {}
+		self.visset = [ None ] * len(slotnames)
+		self.vwritten = {}   # Variable -> arrays of ids written by vectorized steps
+		self.undo = []       # (variable, ids, old 'isset') of vectorized writes
+	
+	def bind(self, var):
+		"""
+		Index the arrays and the mask of variable 'var' by its slot, if it
+		has one (again, whenever they are replaced).
+		"""
+		k = slotids.get(var)
+		if k is None:
+			return
+		while len(self.visset) <= k:
+			self.visset.append(None)
+		NetStore.bind(self, var)
+		self.visset[k] = self.isset[var]
+	
+	def getslot(self, k, p, new=False):
+		isset = self.visset[k] if k < len(self.visset) else None
+		if isset is None or not isset[p]:
+			return UNSET
+		return (self.vtdata if new else self.vdata)[k][p]
+	
+	def add(self, var, val):
+		dtype = np.asarray(val).dtype
+		if dtype.kind not in 'biuf':
+			dtype = object
+		self.data[var]  = np.zeros(self.size, dtype=dtype)
+		self.tdata[var] = np.zeros(self.size, dtype=dtype)
+		self.isset[var] = np.zeros(self.size, dtype=bool)
+		self.bind(var)
+	
+	def fits(self, var, val, vec=None):
+		"""
+		True if 'val' can be stored as it is in the vectors of variable
+		'var' (or in the array 'vec').
+		"""
+		kind = (self.data[var] if vec is None else vec).dtype.kind
+		if kind == 'O':
+			return True
+		if isinstance(val, (bool, np.bool_)):
+			return kind == 'b' or kind == 'i'
+		if isinstance(val, numbers.Integral):
+			return (kind == 'i' and -2**63 <= val < 2**63) or (kind == 'f' and -2**53 <= val <= 2**53)
+		return kind == 'f' and isinstance(val, numbers.Real)
+	
+	def widen(self, var, val):
+		dtype = np.asarray(val).dtype
+		dtype = np.result_type(self.data[var].dtype, dtype) if dtype.kind in 'biuf' else np.dtype(object)
+		self.data[var]  = self.data[var].astype(dtype)
+		self.tdata[var] = self.tdata[var].astype(dtype)
+		if not self.fits(var, val):
+			self.data[var]  = self.data[var].astype(object)
+			self.tdata[var] = self.tdata[var].astype(object)
+		self.bind(var)
+	
+	def get(self, var, p, new=False):
+		isset = self.isset.get(var)
+		if isset is None or not isset[p]:
+			return UNSET
+		return (self.tdata if new else self.data)[var][p]
+	
+	def set(self, var, p, val, new=False):
+		if var not in self.data:
+			self.add(var, val)
+		if not self.fits(var, val):
+			self.widen(var, val)
+		NetStore.set(self, var, p, val, new)
+		self.isset[var][p] = True
+	
+	def fill(self, var, values):
+		values = np.asarray(list(values))
+		if values.dtype.kind not in 'biuf':
+			values = values.astype(object)
+		self.data[var]  = values
+		self.tdata[var] = values.copy()
+		self.isset[var] = np.ones(self.size, dtype=bool)
+		self.bind(var)
+	
+	def coerce(self, var, vals):
+		"""
+		Return 'vals' as an array, creating (or widening) the vectors of
+		variable 'var' so that they can hold it.
+		"""
+		vals = np.asarray(vals)
+		if vals.dtype.kind not in 'biuf':
+			vals = vals.astype(object)
+		if var not in self.data:
+			self.add(var, vals)
+		dtype = np.result_type(self.data[var].dtype, vals.dtype)
+		if dtype != self.data[var].dtype:
+			self.data[var]  = self.data[var].astype(dtype)
+			self.tdata[var] = self.tdata[var].astype(dtype)
+			self.bind(var)
+		return vals
+	
+	def get_many(self, var, ids, new=False):
+		"""
+		The values of variable 'var' of the processors in the array 'ids'
+		(vectorized steps), or UNSET if some of them didn't set it yet.
+		"""
+		isset = self.isset.get(var)
+		if isset is None or not isset[ids].all():
+			return UNSET
+		return (self.tdata if new else self.data)[var][ids]
+	
+	def set_many(self, var, ids, vals):
+		"""
+		Write 'vals' (an array, or one value for all) as the new values of
+		variable 'var' of the processors in the array 'ids'.
+		"""
+		vals = self.coerce(var, vals)
+		self.undo.append((var, ids, self.isset[var][ids]))
+		self.tdata[var][ids] = vals
+		self.isset[var][ids] = True
+		self.vwritten.setdefault(var, []).append(ids)
+	
+	def cells(self, var):
+		"""
+		The array of the cells of 'var' written in the current step.
+		"""
+		cells = [ np.asarray(self.written.get(var, []), dtype=np.intp) ]
+		cells += [ np.ravel(ids) for ids in self.vwritten.get(var, []) ]
+		return np.concatenate(cells)
+	
+	def extract(self):
+		return dict(
+			(var, (self.cells(var), self.tdata[var][self.cells(var)]))
+				for var in set(self.written) | set(self.vwritten)
+		)
+	
+	def load(self, values):
+		for var, (cells, vals) in values.items():
+			if len(cells):
+				self.set_many(var, cells, vals)
+	
+	def take(self, var, cells):
+		cells = np.asarray(cells, dtype=np.intp)
+		cells = cells[self.isset[var][cells]]
+		return cells, self.data[var][cells]
+	
+	def write(self, var, cells, values):
+		if len(cells) == 0:
+			return
+		values = self.coerce(var, values)
+		self.data[var][cells]  = values
+		self.tdata[var][cells] = values
+		self.isset[var][cells] = True
+	
+	def commit(self):
+		for var in set(self.written) | set(self.vwritten):
+			cells = self.cells(var)
+			data, tdata = self.tdata[var], self.data[var]
+			self.data[var], self.tdata[var] = data, tdata
+			self.bind(var)
+			tdata[cells] = data[cells]
+		self.written  = {}
+		self.vwritten = {}
+		self.undo = []
+	
+	def rollback(self):
+		"""
+		Discard all the writes of the current step.
+		"""
+		for var, ids, isset in reversed(self.undo):
+			self.isset[var][ids] = isset
+		for var in set(self.written) | set(self.vwritten):
+			cells = self.cells(var)
+			self.tdata[var][cells] = self.data[var][cells]
+		self.written  = {}
+		self.vwritten = {}
+		self.undo = []
+
+
+class NetBatchStore(NetArrayStore):
+	"""
+	A NetArrayStore of 'batch' independent instances of the network: the
+	vectors have a row per processor and a column per instance, so that
+	each value of a processor is a NumPy array over the instances, and one
+	step runs all of them at once. All instances share which processors
+	set which variables.
+	"""
+	
+	columns = False   # Values are rows, read as copies
+	
+	def __init__(self, size, batch):
+		NetArrayStore.__init__(self, size)
+		self.batch = batch
+	
+	def bind(self, var):
+		pass
+	
+	def add(self, var, val):
+		dtype = np.asarray(val).dtype
+		if dtype.kind not in 'biuf':
+			dtype = object
+		self.data[var]  = np.zeros((self.size, self.batch), dtype=dtype)
+		self.tdata[var] = np.zeros((self.size, self.batch), dtype=dtype)
+		self.isset[var] = np.zeros(self.size, dtype=bool)
+	
+	def get(self, var, p, new=False):
+		val = NetArrayStore.get(self, var, p, new)
+		# A copy, not to see the writes that follow
+		return val if val is UNSET else val.copy()
+	
+	def set(self, var, p, val, new=False):
+		NetStore.set(self, var, p, self.coerce(var, val), new)
+		self.isset[var][p] = True
+	
+	def fill(self, var, values):
+		"""
+		Set variable 'var' of all processors: 'values' has a value per
+		processor, the same for all instances, or a row of values per
+		instance (batch x size).
+		"""
+		values = np.asarray(values)
+		if values.dtype.kind not in 'biuf':
+			values = values.astype(object)
+		if values.ndim == 1:
+			values = np.repeat(values[:, None], self.batch, axis=1)
+		else:
+			values = values.T.copy()
+		self.data[var]  = values
+		self.tdata[var] = values.copy()
+		self.isset[var] = np.ones(self.size, dtype=bool)
+
+
+class NetSparseStore(NetStore):
+	"""
+	A NetStore whose vectors are dicts, holding only the cells set so far:
+	processors that never set a variable take no memory at all, so huge
+	networks can run algorithms touching a few of their processors.
+	"""
+	
+	def add(self, var, val):
+		self.data[var]  = {}
+		self.tdata[var] = {}
+		self.bind(var)
+	
+	def get(self, var, p, new=False):
+		vec = (self.tdata if new else self.data).get(var)
+		if vec is None:
+			return UNSET
+		return vec.get(p, UNSET)
+	
+	def rollback(self):
+		for var, cells in self.written.items():
+			data, tdata = self.data[var], self.tdata[var]
+			for p in cells:
+				if p in data:
+					tdata[p] = data[p]
+				else:
+					tdata.pop(p, None)
+		self.written = {}
+	
+	def take(self, var, cells):
+		data = self.data[var]
+		cells = [ p for p in cells if p in data ]
+		return cells, [ data[p] for p in cells ]
+
+
+stores = {
+	'list':   NetStore,
+	'numpy':  NetArrayStore,
+	'sparse': NetSparseStore,
+}
+
+
+class Processor(object):
+	"""
+	A processor of a SyncNet, with indices 'i' (and 'j'): a view of the
+	state of processor 'id' in the store of the network 'net'. Views are
+	created on demand, and hold no data.
+	"""
+	
+	__slots__ = ('net', 'id', 'i', 'j')
+	
+	def __init__(self, net, id, i, j=None):
+		self.net = net
+		self.id = id
+		self.i = i
+		self.j = j
 	
 	def __str__(self):
 		s = 'Processor(' + str(self.i) + ',' + str(self.j) + ')'
 		return s
 	
-	def __deepcopy__(self, memo):
-		x = Processor(self.i, self.j)
-		memo[id(self)] = x
-		for n, v in self.__dict__.items():
-			setattr(x, n, copy.deepcopy(v, memo))
-		return x
+	def __setitem__(self, var, val):
+		if var.__class__ is int:
+			var = slotnames[var]
+		self.net.store.set(var, self.id, val, self.net.state.parallel)
+	
+	def __getitem__(self, var, getnew=True):
+		net = self.net
+		if var.__class__ is int:
+			var = slotnames[var]
+		if net.shard is not None and not net.state.parallel:
+			val = net.shard.read(var, self.id)
+		else:
+			val = net.store.get(var, self.id, net.state.parallel and getnew)
+		if val is UNSET:
+			raise Exception("Processor [" + str(self.i) + "," + str(self.j) + "] is asking for variable '"+str(var)+"' that has not been set yet")
+		return val
+	
+	def getfrom(self, var, i, j=None, getnew=False):
+		"""
+		Read from a neighbor that has 'i' (and eventually 'j') as provided.
+		If it exists, return the value of its variable 'var', otherwise raise
+		an exception. If 'getnew' is True, it will read from 'tdata',
+		otherwise from 'data'
+		"""
+		net = self.net
+		p = net.procid(i, j)
+		if p is None or not net.adjacent(self.id, p):
+			raise Exception('processor [' + str(self.i) + ',' + str(self.j) + ']' \
+			  ' wants to read from processor [' + str(i)      + ',' + str(j)      + ']')
+		chunk = net.state.chunk
+		if getnew and chunk is not None and p not in chunk:
+			raise NotParallelizable
+		if var.__class__ is int:
+			if net.state.parallel:
+				val = net.store.getslot(var, p, getnew)
+				if val is not UNSET:
+					return val
+			var = slotnames[var]
+		if net.shard is not None and not net.state.parallel:
+			val = net.shard.read(var, p)
+		else:
+			val = net.store.get(var, p, net.state.parallel and getnew)
+		if val is UNSET:
+			raise Exception("Processor [" + str(i) + "," + str(j) + "] is asking for variable '"+str(var)+"' that has not been set yet")
+		return val
+	
+	def variables(self):
+		return self.net.store.variables(self.id)
+	
+	def getindices(self):
+		if self.j is None:
+			return (self.i, )
+		else:
+			return (self.i, self.j)
+
+
+class StepProcessor(Processor):
+	"""
+	A Processor running the body of a step, on a store with vectors by slot
+	(see NetStore): the variables with a slot are read from and written to
+	the vectors of the step directly.
+	"""
+	
+	__slots__ = ('vtdata', 'written')
+	
+	def __init__(self, net, id, i, j=None):
+		Processor.__init__(self, net, id, i, j)
+		self.vtdata = net.store.vtdata
+		self.written = net.store.written
 	
 	def __setitem__(self, var, val):
-		if parallel:
-			self.tdata[var] = val
+		if var.__class__ is int:
+			try:
+				self.vtdata[var][self.id] = val
+			except (IndexError, TypeError):
+				# Not created yet
+				return Processor.__setitem__(self, var, val)
+			cells = self.written.get(slotnames[var])
+			if cells is None:
+				cells = self.written[slotnames[var]] = []
+			cells.append(self.id)
 		else:
-			self.data[var] = val
+			self.net.store.set(var, self.id, val, self.net.state.parallel)
 	
 	def __getitem__(self, var, getnew=True):
-		if parallel and getnew:
-			if var in self.tdata:
-				return self.tdata[var]
+		if var.__class__ is int:
+			if getnew:
+				try:
+					val = self.vtdata[var][self.id]
+				except (IndexError, KeyError, TypeError):
+					val = UNSET
+				if val is not UNSET:
+					return val
+			return Processor.__getitem__(self, var, getnew)
+		net = self.net
+		val = net.store.get(var, self.id, net.state.parallel and getnew)
+		if val is UNSET:
+			return Processor.__getitem__(self, var, getnew)
+		return val
+
+
+class ArrayStepProcessor(Processor):
+	"""
+	A Processor running the body of a step, on a NetArrayStore: the
+	variables with a slot are read from and written to the arrays of the
+	step directly, if they are set and the values fit.
+	"""
+	
+	__slots__ = ('store', )
+	
+	def __init__(self, net, id, i, j=None):
+		Processor.__init__(self, net, id, i, j)
+		self.store = net.store
+	
+	def __setitem__(self, var, val):
+		if var.__class__ is int:
+			store = self.store
+			vec = store.vtdata[var] if var < len(store.vtdata) else None
+			if vec is None or not store.fits(None, val, vec):
+				# Not created yet, or to be widened
+				return Processor.__setitem__(self, var, val)
+			vec[self.id] = val
+			store.visset[var][self.id] = True
+			cells = store.written.get(slotnames[var])
+			if cells is None:
+				cells = store.written[slotnames[var]] = []
+			cells.append(self.id)
 		else:
-			if var in self.data:
-				return self.data[var]
+			self.store.set(var, self.id, val, self.net.state.parallel)
+	
+	def __getitem__(self, var, getnew=True):
+		store = self.store
+		if var.__class__ is int:
+			if getnew:
+				isset = store.visset[var] if var < len(store.visset) else None
+				if isset is not None and isset[self.id]:
+					return store.vtdata[var][self.id]
+			return Processor.__getitem__(self, var, getnew)
+		val = store.get(var, self.id, self.net.state.parallel and getnew)
+		if val is UNSET:
+			return Processor.__getitem__(self, var, getnew)
+		return val
+
+
+class Processors(object):
+	"""
+	The sequence of 'length' processors of a network starting from id
+	'start': M[k] is a view of processor start+k, created on demand.
+	"""
+	
+	def __init__(self, net, start, length):
+		self.net = net
+		self.start = start
+		self.length = length
+	
+	def __len__(self):
+		return self.length
+	
+	def __getitem__(self, k):
+		if isinstance(k, slice):
+			return [ self[x] for x in range(*k.indices(self.length)) ]
+		if k < 0:
+			k += self.length
+		if not 0 <= k < self.length:
+			raise IndexError('processor index out of range')
+		return self.net.proc(self.start + k)
+	
+	def __iter__(self):
+		for k in range(self.length):
+			yield self.net.proc(self.start + k)
+
 
-		raise Exception("Processor [" + str(self.i) + "," + str(self.j) + "] is asking for variable '"+str(var)+"' that has not been set yet")
+class VectorProcessor(object):
+	"""
+	All the processors of a step run vectorized, as a single view: 'id' is
+	the array of their ids, 'i' (and 'j') the arrays of their indices.
+	Variables are read and written as arrays, one value per processor.
+	"""
+	
+	__slots__ = ('net', 'id', 'i', 'j')
+	
+	def __init__(self, net, id, i, j=None):
+		self.net = net
+		self.id = id
+		self.i = i
+		self.j = j
+	
+	def __setitem__(self, var, val):
+		if var.__class__ is int:
+			var = slotnames[var]
+		self.net.store.set_many(var, self.id, val)
+	
+	def __getitem__(self, var, getnew=True):
+		if var.__class__ is int:
+			var = slotnames[var]
+		val = self.net.store.get_many(var, self.id, getnew)
+		if val is UNSET:
+			raise Exception("Some processor is asking for variable '"+str(var)+"' that has not been set yet")
+		return val
 	
 	def getfrom(self, var, i, j=None, getnew=False):
 		"""
-		Read from a neighbor that has 'i' (and eventually 'j') as provided.
-		If it exists, return the neighbor processor, otherwise raise an exception.
-		If 'getnew' is True, it will read from 'tdata', otherwise from 'data'
-		"""
-		#~ print 'processor [%s:%s,%s] reads from processor [%s:%s,%s]' % \
-			#~ (self.i, bin(self.i)[2:].zfill(6), self.j, i, bin(i)[2:].zfill(6), j)
-		for P in self.nb:
-			if P.i == i and P.j == j:
-				return P.__getitem__(var, getnew)
-		
-		raise Exception('processor [' + str(self.i) + ',' + str(self.j) + ']' \
-		  ' wants to read from processor [' + str(i)      + ',' + str(j)      + ']')
+		As Processor.getfrom(), for all processors at once: 'i' (and 'j')
+		are arrays of indices, or single indices for all processors. Values
+		written in this step can't be read: the processors that write them
+		are not run before the ones reading them.
+		"""
+		net = self.net
+		if var.__class__ is int:
+			var = slotnames[var]
+		p = net.procids(i, j)
+		if net.batch is not None:
+			p = np.ravel(p)
+		if not np.all(net.adjacent(self.id, p)):
+			raise Exception('some processor wants to read from a processor that is not its neighbor')
+		store = net.store
+		if getnew and (var in store.written or var in store.vwritten or net.state.chunk is not None):
+			raise NotVectorizable
+		val = store.get_many(var, p, getnew)
+		if val is UNSET:
+			raise Exception("Some processor is asking for variable '"+str(var)+"' that has not been set yet")
+		return val
 	
 	def getindices(self):
 		if self.j is None:
@@ -81,88 +778,579 @@ class Processor:
 			return (self.i, self.j)
 
 
+class Shard(object):
+	"""
+	The block of processors of a network run by process 'rank' of a
+	sharded run (see SyncNet.run_sharded()): the processors with ids from
+	'lo' to 'hi' (excluded). Every process keeps a whole copy of the store,
+	but only the variables of its own processors, and of the processors
+	they read from (the "halo"), are kept up to date: at the end of every
+	step (superstep) each process sends the values just written by its
+	processors to the processes whose processors can read them.
+	A processor reading with getnew=True from a processor of another block
+	sees a value that depends on the order of the processors: then all
+	processes discard the step, gather the whole state and run the step
+	each on all processors, as the serial network. Outside of steps every
+	process runs the same code: the values read there are sent by the
+	process owning them.
+	"""
+	
+	def __init__(self, net, rank, shards, group):
+		self.net = net
+		self.rank = rank
+		self.shards = shards
+		self.group = group
+		self.bounds = [ r * net.size // shards for r in range(shards+1) ]
+		self.lo, self.hi = self.bounds[rank], self.bounds[rank+1]
+		self.stats = { 'supersteps': 0, 'halo': 0, 'gathers': 0, 'reads': 0, 'log': [] }
+		
+		# Send to each process the processors of this block its processors read from
+		needs = [ set() for r in range(shards) ]
+		for p in range(self.lo, self.hi):
+			for q in net.neighbors(p):
+				r = self.owner(q)
+				if r != rank:
+					needs[r].add(q)
+		needs = group.exchange([ sorted(cells) for cells in needs ])
+		self.halo = [ set(cells) for cells in needs ]
+		if np is not None and net.backend == 'numpy':
+			self.halomask = []
+			for cells in needs:
+				mask = np.zeros(net.size, dtype=bool)
+				mask[np.asarray(cells, dtype=np.intp)] = True
+				self.halomask.append(mask)
+	
+	def __contains__(self, p):
+		return self.lo <= p < self.hi
+	
+	def owner(self, p):
+		return bisect.bisect_right(self.bounds, p) - 1
+	
+	def own(self, indices):
+		"""
+		The indices, among 'indices', of the processors of this block.
+		"""
+		net = self.net
+		try:
+			idx = np.array(indices)
+			ids = net.procids(*((idx, ) if idx.ndim == 1 else tuple(idx.T)))
+			mine = idx[(self.lo <= ids) & (ids < self.hi)].tolist()
+			return mine if idx.ndim == 1 else [ tuple(ind) for ind in mine ]
+		except Exception:
+			procid = lambda ind: net.procid(*ind) if isinstance(ind, (list, tuple)) else net.procid(ind)
+			return [ ind for ind in indices if procid(ind) in self ]
+	
+	def step(self, indices, func):
+		"""
+		Run a step (a superstep) over the processors of this block among
+		'indices', and exchange the halo with the other processes.
+		"""
+		net = self.net
+		store = net.store
+		state = net.state
+		conflict, error = False, None
+		state.chunk = self
+		try:
+			net.run_step(self.own(indices), func)
+		except NotParallelizable:
+			conflict = True
+		except Exception as e:
+			error = e
+		finally:
+			state.chunk = None
+		
+		written = self.written() if not conflict and error is None else {}
+		msgs = [ (conflict, error is not None, self.select(written, r)) for r in range(self.shards) ]
+		t = time.time()
+		got = self.group.exchange(msgs)
+		t = time.time() - t
+		self.stats['supersteps'] += 1
+		if error is not None:
+			raise error
+		if any(failed for conflicting, failed, halo in got):
+			raise synchronous_workers.GroupAborted('a step failed in another process')
+		
+		if any(conflicting for conflicting, failed, halo in got):
+			# Run the step on all processors, in every process
+			store.rollback()
+			self.gather()
+			net.run_step(indices, func)
+			store.commit()
+			self.log(0, t)
+			return
+		
+		store.commit()
+		received = 0
+		for r, (conflicting, failed, halo) in enumerate(got):
+			if r != self.rank:
+				for var, (cells, vals) in halo.items():
+					store.write(var, cells, vals)
+					received += len(cells)
+		self.stats['halo'] += received
+		self.log(received, t)
+	
+	def log(self, received, seconds):
+		"""
+		Log a superstep: halo values received, bytes sent and received (if
+		known by the group) and seconds spent exchanging them.
+		"""
+		traffic = getattr(self.group, 'last', None) or (None, None)
+		self.stats['log'].append((received, traffic[0], traffic[1], seconds))
+	
+	def written(self):
+		"""
+		The cells written in the current step, for every variable: a set,
+		or an array with the 'numpy' backend.
+		"""
+		store = self.net.store
+		if isinstance(store, NetArrayStore):
+			return dict((var, store.cells(var)) for var in set(store.written) | set(store.vwritten))
+		return dict((var, set(cells)) for var, cells in store.written.items())
+	
+	def select(self, written, r):
+		"""
+		The new values of the cells in 'written' read by the processors of
+		process 'r'.
+		"""
+		if r == self.rank:
+			return {}
+		tdata = self.net.store.tdata
+		halo = {}
+		for var, cells in written.items():
+			if isinstance(cells, set):
+				sel = [ p for p in self.halo[r] if p in cells ]
+				if sel:
+					halo[var] = (sel, [ tdata[var][p] for p in sel ])
+			else:
+				sel = cells[self.halomask[r][cells]]
+				if len(sel):
+					halo[var] = (sel, tdata[var][sel])
+		return halo
+	
+	def gather(self):
+		"""
+		Bring the whole store of this process up to date, with the
+		variables of the processors of every other process.
+		"""
+		store = self.net.store
+		cells = range_type(self.lo, self.hi)
+		values = dict((var, store.take(var, cells)) for var in store.data)
+		got = self.group.exchange([ values ] * self.shards)
+		for r, values in enumerate(got):
+			if r != self.rank:
+				for var, (cells, vals) in values.items():
+					store.write(var, cells, vals)
+		self.stats['gathers'] += 1
+	
+	def read(self, var, p):
+		"""
+		The value of variable 'var' of processor 'p', sent by its process:
+		all processes must read it.
+		"""
+		owner = self.owner(p)
+		val = self.net.store.get(var, p) if owner == self.rank else None
+		got = self.group.exchange([ val ] * self.shards)
+		self.stats['reads'] += 1
+		return got[owner]
+
+
 class SyncNet(object):
 	"""
 	Every synchronous network must have the method forall_do_in_parallel().
+	The variables of all processors are kept in 'store' (see NetStore), one
+	vector per variable: with the 'backend' 'list' (the default) they are
+	Python lists, with 'numpy' typed NumPy arrays, far more compact on big
+	networks, with 'sparse' dicts of the processors that set the variable,
+	so that processors never used cost nothing. Processors (e.g. the items
+	of M) are views of the store, created when accessed.
+	Setting 'workers' greater than 1, the processors of each step are split
+	among that many forked worker processes, each sending back the new data
+	of its processors; the step ends when all workers are done. Steps whose
+	processors read new values (getnew=True) from processors of another
+	worker run in a single process.
+	Setting 'vectorize' (only for the 'numpy' backend), every step is first
+	tried as a single call of its body over the arrays of indices of all its
+	processors, with a VectorProcessor as P: an elementwise body like
+	P['a'] = P['a'] + P.getfrom('a', i ^ 1) becomes a NumPy gather and an
+	elementwise sum. Bodies that can't work on arrays (e.g. branching on
+	their index) run one processor at a time. Topologies read from arrays
+	of processors through procids().
+	With 'batch' set to B (only for the 'numpy' backend), the network runs
+	B independent instances in lockstep: every value of a processor is a
+	NumPy array of B values, one per instance, so bodies can compute on
+	values but can't branch on them. instances() returns the values of a
+	variable as a B x N array.
+	Every step is counted in 'steps', its processors in 'work' and its
+	simulated time in 'time': a step of n processors takes ceil(n/p) time
+	units when only p 'processors' are physically available (1 if it is
+	None, i.e. one physical processor for each node of the network). With
+	'processors' set, steps run in chunks of p processors, one chunk after
+	the other (each chunk at once, if vectorized).
 	"""
 	
+	def __init__(self, size, backend='list', batch=None, processors=None):
+		if backend not in stores:
+			raise Exception("Unknown network backend '" + str(backend) + "'")
+		if batch is not None and backend != 'numpy':
+			raise Exception("Batches of instances need the 'numpy' network backend")
+		self.state = NetState()
+		self.size = size
+		self.backend = backend
+		self.batch = batch
+		self.store = stores[backend](size) if batch is None else NetBatchStore(size, batch)
+		self.nb = None      # Ids of the neighbors of every processor, if linked by link()
+		self.links = None   # Index of the links, built by index()
+		self.workers = 1
+		self.serialbodies = set()   # Code of bodies that can't be split
+		self.vectorize = False
+		self.unvectorizable = set()   # Code of bodies that failed on arrays
+		self.shard = None   # Part of the network run by this process (see run_sharded())
+		self.processors = processors
+		self.steps = 0
+		self.work  = 0
+		self.time  = 0
+	
+	def link(self, p, q):
+		"""
+		Link processors 'p' and 'q' (ids), in both directions. Networks
+		linked this way keep a list of neighbors for every processor: the
+		topologies below define their links arithmetically, and override
+		adjacent() and neighbors() instead.
+		"""
+		if self.nb is None:
+			self.nb = [ [] for p in range(self.size) ]
+		self.nb[p].append(q)
+		self.nb[q].append(p)
+		self.links = None
+	
+	def index(self):
+		"""
+		Build the index of the links: 'links[p]' is the set of the ids of
+		the processors 'p' can read from.
+		"""
+		self.links = [ frozenset(nb) for nb in self.nb or [ () ] * self.size ]
+		return self.links
+	
+	def adjacent(self, p, q):
+		"""
+		True if processor 'p' can read from processor 'q' (ids), in constant time.
+		"""
+		return q in (self.links or self.index())[p]
+	
+	def neighbors(self, p):
+		"""
+		Ids of the processors 'p' (id) can read from.
+		"""
+		return self.nb[p] if self.nb is not None else []
+	
+	def proc(self, p, step=False):
+		"""
+		A view of processor 'p' (id): for the body of a step if 'step'.
+		"""
+		if step and self.store.slotted:
+			return StepProcessor(self, p, *self.indices(p))
+		if step and self.store.columns:
+			return ArrayStepProcessor(self, p, *self.indices(p))
+		return Processor(self, p, *self.indices(p))
+	
+	def procids(self, i, j=None):
+		"""
+		The array of the ids of the processors with indices 'i' (and 'j'),
+		arrays or single indices, -1 where there is no such processor.
+		Topologies that define it can run vectorized steps.
+		"""
+		raise NotVectorizable
+	
+	def where(self, indices, cond):
+		"""
+		The indices in the range 'indices' satisfying 'cond' (a forall with
+		an 'if'). With 'vectorize' set, 'cond' is first computed as a mask
+		over the whole array of indices.
+		"""
+		if self.vectorize:
+			idx = np.array(indices)
+			try:
+				mask = np.asarray(cond(idx), dtype=bool)
+				if mask.shape == idx.shape:
+					return idx[mask]
+			except Exception:
+				pass
+		return [ i for i in indices if cond(i) ]
+	
 	def forall_do_in_parallel(self, indices, func):
-		global parallel
-		#parallel = False		# Attualmente nested parallel loop non supportati
+		if not hasattr(indices, '__len__'):
+			indices = list(indices)
+		self.steps += 1
+		self.work  += len(indices)
+		self.time  += -(-len(indices) // self.processors) if self.processors else 1
+		
+		if self.shard is not None:
+			self.shard.step(indices, func)
+			return
+		
+		self.run_step(indices, func)
+		
+		# The new data become the current ones
+		self.store.commit()
+	
+	def run_step(self, indices, func):
+		"""
+		Execute 'func' over the processors with the given 'indices', leaving
+		their writes in 'tdata'.
+		"""
+		state = self.state
+		#state.parallel = False		# Attualmente nested parallel loop non supportati
 		
-		# Create list of processors 'procs' out of the indices
-		self.procs = [
-			self.getproc(*ind) if isinstance(ind, (list, tuple)) else 
-			self.getproc(ind)
+		# Execute 'func' over all processors at once, if possible
+		done = False
+		if self.vectorize and func.__code__ not in self.unvectorizable:
+			done = self.vectorized_step(indices, func)
+		
+		# Split processors among worker processes, if possible
+		if not done and self.workers > 1 and func.__code__ not in self.serialbodies and synchronous_workers.available():
+			self.setprocs(indices)
+			done = self.processes_step(func)
+		
+		# Execute 'func' over each processor, a chunk of 'processors' at a time
+		if not done:
+			size = self.processors or max(len(indices), 1)
+			state.parallel = True
+			try:
+				for start in range_type(0, len(indices), size):
+					for P in self.setprocs(indices[start:start+size]):
+						func(P, *P.getindices())
+			finally:
+				state.parallel = False
+	
+	def setprocs(self, indices):
+		"""
+		Create the processors 'procs' (and their 'ids') with the given
+		'indices', and return them.
+		"""
+		self.ids = [
+			self.procid(*ind) if isinstance(ind, (list, tuple)) else
+			self.procid(ind)
 				for ind in indices
 		]
+		self.procs = [ self.proc(p, True) for p in self.ids ]
+		return self.procs
+	
+	def vectorized_step(self, indices, func):
+		"""
+		Execute 'func' once, over a VectorProcessor of all the processors
+		with the given 'indices' (once per chunk of 'processors' of them, if
+		set). Return False if 'func' can't be run on arrays: in that case
+		all its writes are discarded.
+		"""
+		if self.backend != 'numpy':
+			raise Exception("Vectorized steps need the 'numpy' network backend")
+		if len(indices) == 0:
+			return True
+		idx = np.array(indices)
+		args = (idx, ) if idx.ndim == 1 else tuple(idx.T)
+		state = self.state
+		state.parallel = True
+		try:
+			ids = self.procids(*args)
+			if (ids < 0).any():
+				raise NotVectorizable
+			if self.batch is not None:
+				# Indices as columns, against the values of all instances
+				args = tuple(arg[:, None] for arg in args)
+			# Each physical processor runs a chunk of virtual processors:
+			# chunks are run one after the other
+			size = self.processors or len(ids)
+			for start in range_type(0, len(ids), size):
+				chunk = tuple(arg[start:start+size] for arg in args)
+				func(VectorProcessor(self, ids[start:start+size], *chunk), *chunk)
+		except (NotVectorizable, ValueError, TypeError):
+			# Bodies branching on the values (as 'if a < b') fail on arrays
+			# with the ValueError (or TypeError) of bool() of an array
+			return self.discard_step(func)
+		finally:
+			state.parallel = False
+		return True
+	
+	def discard_step(self, func):
+		"""
+		Discard the writes of a vectorized step of 'func', which from now on
+		runs one processor at a time. Return False.
+		"""
+		self.store.rollback()
+		self.unvectorizable.add(func.__code__)
+		return False
+	
+	def processes_step(self, func):
+		"""
+		Execute 'func' over the processors in 'procs', split among forked
+		worker processes, and collect the new data of every processor.
+		Return False if the step must run in a single process.
+		"""
+		if len(self.procs) < 2:
+			return False
 		
-		# Copy data to temp
-		#for P in self.iterprocs():
-		for P in self.procs:
-			for i in P.data:
-				P.tdata[i] = P.data[i]
-		
-		# Execute 'func' over each processor in 'procs'
-		parallel = True
-		for P in self.procs:
-			func(P, *P.getindices())
-		parallel = False
+		def run_chunk(procs):
+			state = self.state
+			state.chunk = set(P.id for P in procs)
+			state.parallel = True
+			for P in procs:
+				func(P, *P.getindices())
+			state.parallel = False
+			return self.store.extract()
 		
-		# Store back data
-		for P in self.procs:
-			for i in P.tdata:
-				P.data[i] = P.tdata[i]
+		chunks = synchronous_workers.chunks(self.procs, self.workers)
+		try:
+			results = synchronous_workers.fork_map(run_chunk, chunks)
+		except NotParallelizable:
+			self.serialbodies.add(func.__code__)
+			return False
+		for values in results:
+			self.store.load(values)
+		return True
 	
 	def synchronize(self):
 		"""
 		End instruction synchronization, forced with ';'
 		WARNING! THIS DOESN'T WORK, DON'T USE ';' IN PYSAL CODE
 		"""
-		# Store back data
-		parallel = False
-		for P in self.procs:
-			for i in P.tdata:
-				P.data[i] = P.tdata[i]
-		
-		# Copy data to temp
-		#~ for P in self.iterprocs():
-			#~ for i in P.data:
-				#~ P.tdata[i] = P.data[i]
-		parallel = True
+		# The new data become the current ones
+		self.state.parallel = False
+		self.store.commit()
+		self.state.parallel = True
+	
+	def run_sharded(self, shards, func, *args):
+		"""
+		Run 'func' (e.g. an algorithm of the network) with the given 'args'
+		in bulk-synchronous fashion, on 'shards' forked worker processes:
+		the processors are split in blocks of consecutive ids (blocks of
+		rows of a Mesh, subcubes on the high bits of a Hypercube), and each
+		process runs 'func' executing the steps of its own block only (see
+		Shard). At the end the variables of all blocks are gathered back,
+		and the result of 'func' is returned.
+		"""
+		if not synchronous_workers.available():
+			raise Exception("Sharded runs need forked worker processes")
+		results = synchronous_workers.fork_group(lambda rank, group: self.run_shard(rank, shards, group, func, args), shards)
+		return self.gather_shards(results)
+	
+	def run_distributed(self, shards, func, *args):
+		"""
+		As run_sharded(), but the blocks are run by 'shards' worker
+		processes connected by TCP sockets, started on this host (see
+		synchronous_sockets: workers can run on other hosts too). 'func'
+		must be a method of the network. The traffic of every superstep is
+		logged in 'shardstats'.
+		"""
+		coordinator = synchronous_sockets.Coordinator()
+		workers = []
+		try:
+			workers = coordinator.spawn(shards)
+			results = coordinator.run(shards, self, func, args)
+		except Exception:
+			for worker in workers:
+				worker.kill()
+			raise
+		finally:
+			coordinator.close()
+			for worker in workers:
+				worker.wait()
+		return self.gather_shards(results)
+	
+	def run_shard(self, rank, shards, group, func, args):
+		"""
+		Run 'func' over the block 'rank' of a sharded run, in the process
+		'rank' of 'group', and return what gather_shards() needs.
+		"""
+		self.shard = Shard(self, rank, shards, group)
+		self.workers = 1
+		result = func(*args)
+		cells = range_type(self.shard.lo, self.shard.hi)
+		values = dict((var, self.store.take(var, cells)) for var in self.store.data)
+		return result, values, (self.steps, self.work, self.time), self.shard.stats
+	
+	def gather_shards(self, results):
+		"""
+		Store the variables of all blocks, returned by run_shard(), and
+		return the result of the run.
+		"""
+		for result, values, counters, stats in results:
+			for var, (cells, vals) in values.items():
+				self.store.write(var, cells, vals)
+		self.steps, self.work, self.time = results[0][2]
+		self.shardstats = [ stats for result, values, counters, stats in results ]
+		return results[0][0]
+	
+	def __getstate__(self):
+		# Sent to the workers of distributed runs: code can't be pickled
+		state = dict(self.__dict__)
+		state['unvectorizable'] = set()
+		state['serialbodies'] = set()
+		state['state'] = NetState()
+		state['shard'] = None
+		state.pop('procs', None)
+		state.pop('ids', None)
+		return state
+	
+	def str_variable(self, d):
+		s = self.__class__.__name__.upper() + ':\n'
+		for P in self.iterprocs():
+			s += str(P[d]) + ','
+			s += '\t'
+		return s
+	
+	def variable(self, d):
+		l = []
+		for P in self.iterprocs():
+			l.append(P[d])
+		return l
+	
+	def instances(self, d):
+		"""
+		The values of variable 'd' of all processors, as a B x N array: one
+		row per instance (with 'batch' set).
+		"""
+		return self.store.data[d].T.copy()
+	
+	def randomfeed(self, a, b, vars=['a']):
+		for v in vars:
+			if self.batch is None:
+				self.store.fill(v, [ random.randint(a, b) for p in range(self.size) ])
+			else:
+				self.store.fill(v, np.random.randint(a, b+1, size=(self.batch, self.size)))
 
 
 class Mesh(SyncNet):
 	
-	def __init__(self, n, cyclic=False, toroidal=False):
+	def __init__(self, n, cyclic=False, toroidal=False, backend='list', batch=None, processors=None):
+		SyncNet.__init__(self, n*n, backend, batch, processors)
 		self.n = n
-		# Create processors and store them in a private matrix
-		self.M = [ Processor(i,j) for i in range(n) for j in range(n) ]
-		# Link processors in Mesh
-		for i in range(n-1):
-			for j in range(n):
-				# Horizontal
-				self.M[i+n*j].nb     .append( self.M[i+n*j+1] )
-				self.M[i+n*j+1].nb   .append( self.M[i+n*j]   )
-				# Vertical
-				self.M[n*i+j].nb     .append( self.M[n*(i+1)+j] )
-				self.M[n*(i+1)+j].nb .append( self.M[n*i+j] )
-		# Cyclic links
-		if cyclic:
-			for i in range(n):
-				# Horizontal cycles
-				self.M[n*i].nb       .append( self.M[n*(i+1)-1] )
-				self.M[n*(i+1)-1].nb .append( self.M[n*i] )
-				# Vertical cycles
-				self.M[i].nb         .append( self.M[i+n*(n-1)] )
-				self.M[i+n*(n-1)].nb .append( self.M[i] )
+		self.cyclic = cyclic
+		# Processors are stored in a private matrix, row by row
+		self.M = Processors(self, 0, n*n)
+		# Processors are linked to their horizontal and vertical neighbors,
+		# and with 'cyclic' the first and the last of each row and column
 		# Toroidal links (TODO)
 		if toroidal: pass
 	
+	def adjacent(self, p, q):
+		# Also on arrays of ids
+		n = self.n
+		di, dj = abs(p//n - q//n), abs(p%n - q%n)
+		near = lambda d: (d == 1) | (self.cyclic & (d == n-1))
+		return (0 <= q) & (q < n*n) & (((di == 0) & near(dj)) | ((dj == 0) & near(di)))
+	
+	def neighbors(self, p):
+		n = self.n
+		i, j = divmod(p, n)
+		near = [ (i, j-1), (i, j+1), (i-1, j), (i+1, j) ]
+		if self.cyclic:
+			near = [ (a % n, b % n) for a, b in near ]
+		return sorted(set(n*a + b for a, b in near if 0 <= a < n and 0 <= b < n and self.adjacent(p, n*a + b)))
+	
 	def __str__(self):
 		s = 'MESH:\n'
 		for i,P in enumerate(self.M):
-			for d in sorted(P.data):
+			for d in P.variables():
 				s += str(P[d]) + ','
 			s += '\t'
 			if i%self.n == self.n-1 and i < self.n*self.n -1: s += '\n\n'
@@ -172,47 +1360,47 @@ class Mesh(SyncNet):
 		for p in self.M:
 			yield p
 	
-	def getproc(self, i, j):
-		return self.M[self.n*i + j]
+	def procid(self, i, j=None):
+		if j is None or not (0 <= i < self.n and 0 <= j < self.n):
+			return None
+		return self.n*i + j
 	
-	def str_variable(self, d):
-		s = 'MESH:\n'
-		for i,P in enumerate(self.M):
-			s += str(P[d]) + ','
-			s += '\t'
-		return s
+	def procids(self, i, j=None):
+		if j is None:
+			raise NotVectorizable
+		n = self.n
+		i, j = np.broadcast_arrays(i, j)
+		return np.where((0 <= i) & (i < n) & (0 <= j) & (j < n), n*i + j, -1)
 	
-	def variable(self, d):
-		l = []
-		for i,P in enumerate(self.M):
-			l.append(P[d])
-		return l
+	def indices(self, p):
+		return divmod(p, self.n)
 	
-	def randomfeed(self, a, b, vars=['a']):
-		for i,p in enumerate(self.M):
-			for v in vars:
-				self.M[i].data[v] = random.randint(a, b)
+	def getproc(self, i, j):
+		return self.M[self.n*i + j]
 
 
 class Hypercube(SyncNet):
 	
-	def __init__(self, k):
+	def __init__(self, k, backend='list', batch=None, processors=None):
+		SyncNet.__init__(self, 2**k, backend, batch, processors)
 		self.k = k
-		# Create processors and store them in a private array
-		self.M = [ Processor(i) for i in range(2**k) ]
-		# Link processors in Hypercube
-		for i in range(2**k):
-			for h in range(k):
-				try:
-					self.M[i].nb        .append( self.M[i + 2**h] )
-					self.M[i + 2**h].nb .append( self.M[i] )
-				except: pass
+		# Processors are stored in a private array
+		self.M = Processors(self, 0, 2**k)
+		# Processors are linked when their ids differ in exactly one bit
+	
+	def adjacent(self, p, q):
+		# Also on arrays of ids
+		d = p ^ q
+		return (0 <= q) & (q < self.size) & (d != 0) & (d & (d-1) == 0)
+	
+	def neighbors(self, p):
+		return [ p ^ 2**h for h in range(self.k) ]
 	
 	def __str__(self):
 		s = 'HYPERCUBE:\n'
 		for i,P in enumerate(self.M):
 			s += str(P.i) + ':' + '('
-			for d in sorted(P.data):
+			for d in P.variables():
 				s += str(P[d]) + ','
 			s += ')\t'
 		return s
@@ -221,56 +1409,56 @@ class Hypercube(SyncNet):
 		for p in self.M:
 			yield p
 	
-	def getproc(self, i):
-		return self.M[i]
+	def procid(self, i, j=None):
+		if j is not None or not 0 <= i < self.size:
+			return None
+		return i
 	
-	def str_variable(self, d):
-		s = 'HYPERCUBE:\n'
-		for i,P in enumerate(self.M):
-			s += str(P[d]) + ','
-			s += '\t'
-		return s
-	
-	def variable(self, d):
-		l = []
-		for i,P in enumerate(self.M):
-			l.append(P[d])
-		return l
+	def procids(self, i, j=None):
+		if j is not None:
+			raise NotVectorizable
+		i = np.asarray(i)
+		return np.where((0 <= i) & (i < self.size), i, -1)
 	
-	#~ def feed(self, d, vals):
-		#~ raise Exception()
-		#~ for i,p in enumerate(self.M):
-			#~ self.M[i].data[d] = vals[i]
+	def indices(self, p):
+		return (p, )
 	
-	def randomfeed(self, a, b, vars=['a']):
-		for i,p in enumerate(self.M):
-			for v in vars:
-				self.M[i].data[v] = random.randint(a, b)
+	def getproc(self, i):
+		return self.M[i]
 
 
 class Shuffle(SyncNet):
 	
-	def __init__(self, p):
+	def __init__(self, p, backend='list', batch=None, processors=None):
+		SyncNet.__init__(self, 2**p, backend, batch, processors)
 		self.p = p
 		self.n = 2**p
-		# Create processors and store them in a private array
-		self.M = [ Processor(i) for i in range(self.n) ]
-		# Exchange links
-		for i in range(self.n):
-			if i%2==0 and (i+1)<self.n:	# For each 'i' even
-				self.M[i]  .nb.append( self.M[i+1] )
-				self.M[i+1].nb.append( self.M[i] )
-		# Shuffle links
-		for i in range(self.n -1):
-			self.M[2*i % (self.n-1)].nb.append( self.M[i] )
-		# Last shuffle link
-		self.M[self.n-1].nb.append( self.M[self.n-1] )
+		# Processors are stored in a private array
+		self.M = Processors(self, 0, self.n)
+		# Exchange links: between 'i' and 'i'+1, for each 'i' even.
+		# Shuffle links: processor 2*'i' mod n-1 reads from 'i', and the
+		# last one from itself
+	
+	def adjacent(self, p, q):
+		n = self.n
+		if not 0 <= q < n:
+			return False
+		if p ^ 1 == q:
+			return True
+		if q == n-1:
+			return p == n-1
+		return p == 2*q % (n-1)
+	
+	def neighbors(self, p):
+		n = self.n
+		# 'p' reads from the 'q' with 2*'q' = 'p' mod n-1 (n/2 is the inverse of 2)
+		return sorted(set([ p ^ 1, p if p == n-1 else p * (n//2) % (n-1) ]))
 	
 	def __str__(self):
 		s = 'SHUFFLE:\n'
 		for i,P in enumerate(self.M):
 			s += str(P.i) + ':' + '('
-			for d in sorted(P.data):
+			for d in P.variables():
 				s += str(P[d]) + ','
 			s += ')\t'
 		return s
@@ -279,51 +1467,55 @@ class Shuffle(SyncNet):
 		for p in self.M:
 			yield p
 	
-	def getproc(self, i):
-		return self.M[i]
-	
-	def str_variable(self, d):
-		s = 'SHUFFLE:\n'
-		for i,P in enumerate(self.M):
-			s += str(P[d]) + ','
-			s += '\t'
-		return s
+	def procid(self, i, j=None):
+		if j is not None or not 0 <= i < self.size:
+			return None
+		return i
 	
-	def variable(self, d):
-		l = []
-		for i,P in enumerate(self.M):
-			l.append(P[d])
-		return l
+	def indices(self, p):
+		return (p, )
 	
-	def randomfeed(self, a, b, vars=['a']):
-		for i,p in enumerate(self.M):
-			for v in vars:
-				self.M[i].data[v] = random.randint(a, b)
+	def getproc(self, i):
+		return self.M[i]
 
 
 class Butterfly(SyncNet):
 	
-	def __init__(self, k):
+	def __init__(self, k, backend='list', batch=None, processors=None):
+		SyncNet.__init__(self, (k+1) * 2**k, backend, batch, processors)
 		self.k = k
-		# Create processors and store them in a private matrix
-		self.M = [ [ Processor(i,j) for j in range(2**k) ] for i in range(k+1) ]
-		# Vertical links
-		for i in range(k):
-			for j in range(2**k):
-				self.M[i]  [j].nb .append( self.M[i+1][j] )
-				self.M[i+1][j].nb .append( self.M[i]  [j] )
-		# Diagonal links
-		for i in range(k):
-			for j in range(2**k):
-				self.M[i]  [j].nb                       .append( self.M[i+1][(j + 2**(k-1-i)) % 2**k] )
-				self.M[i+1][(j + 2**(k-1-i)) % 2**k].nb .append( self.M[i]  [j] )
+		# Processors are stored in a private matrix, one row per level
+		self.M = [ Processors(self, i * 2**k, 2**k) for i in range(k+1) ]
+		# Processor (i, j) is linked to (i+1, j) (vertical link) and to
+		# (i+1, (j + 2**(k-1-i)) % 2**k) (diagonal link)
+	
+	def adjacent(self, p, q):
+		if not 0 <= q < self.size:
+			return False
+		k = self.k
+		(i1, j1), (i2, j2) = divmod(p, 2**k), divmod(q, 2**k)
+		if i2 == i1 - 1:
+			(i1, j1), (i2, j2) = (i2, j2), (i1, j1)
+		elif i2 != i1 + 1:
+			return False
+		return j2 == j1 or j2 == (j1 + 2**(k-1-i1)) % 2**k
+	
+	def neighbors(self, p):
+		k = self.k
+		i, j = divmod(p, 2**k)
+		nb = []
+		if i > 0:
+			nb += [ self.procid(i-1, j), self.procid(i-1, (j - 2**(k-i)) % 2**k) ]
+		if i < k:
+			nb += [ self.procid(i+1, j), self.procid(i+1, (j + 2**(k-1-i)) % 2**k) ]
+		return nb
 	
 	def __str__(self):
 		s = 'BUTTERFLY:\n'
 		for row in self.M:
 			for P in row:
 				# Print all set variables of processor P
-				for d in sorted(P.data):
+				for d in P.variables():
 					s += str(P[d]) + ','
 				s += '\t'
 			if self.M.index(row) < len(self.M)-1: s += '\n'
@@ -337,23 +1529,18 @@ class Butterfly(SyncNet):
 			if self.M.index(row) < len(self.M)-1: s += '\n'
 		return s
 	
-	def variable(self, d):
-		v = []
-		for row in self.M:
-			for P in row:
-				v.append(P[d])
-		return v
-		
 	def iterprocs(self):
 		for prow in self.M:
 			for p in prow:
 				yield p
 	
+	def procid(self, i, j=None):
+		if j is None or not (0 <= i <= self.k and 0 <= j < 2**self.k):
+			return None
+		return i * 2**self.k + j
+	
+	def indices(self, p):
+		return divmod(p, 2**self.k)
+	
 	def getproc(self, i, j):
 		return self.M[i][j]
-	
-	def randomfeed(self, a, b, vars=['a']):
-		for i,row in enumerate(self.M):
-			for j,el in enumerate(row):
-				for v in vars:
-					self.M[i][j].data[v] = random.randint(a, b)
@@ -0,0 +1,166 @@
+"""
+PySAL - Python Synchronous Algorithms Library
+------------------------------------------------------------------------
+Copyright (C) 2012  Matteo Brucato  <mattfeel@gmail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import traceback
+
+try:
+	import multiprocessing
+	context = multiprocessing.get_context('fork')
+except (ImportError, AttributeError, ValueError):
+	# Workers are forked, so that they can run any function (even lambdas
+	# and closures, that can't be pickled) over the state of the parent
+	context = None
+
+try:
+	from multiprocessing import shared_memory
+except ImportError:
+	shared_memory = None
+
+class WorkerError(Exception): pass
+# Another process of the group failed
+class GroupAborted(Exception): pass
+
+
+def available():
+	"""
+	True if parallel steps can be split among worker processes.
+	"""
+	return context is not None
+
+
+def chunks(items, n):
+	"""
+	Split the list 'items' in (at most) 'n' contiguous chunks.
+	"""
+	size = (len(items) + n - 1) // n
+	return [ items[k:k+size] for k in range(0, len(items), size) ]
+
+
+def worker(func, chunk, conn):
+	try:
+		conn.send((True, func(chunk)))
+	except Exception as e:
+		try:
+			conn.send((False, e))
+		except Exception:
+			conn.send((False, WorkerError(traceback.format_exc())))
+	conn.close()
+
+
+def fork_map(func, chunks):
+	"""
+	Fork one worker process for each chunk, and return the list of results
+	of 'func' over each chunk. It is a barrier: it returns only when all
+	workers are done. If a worker raises an exception, it is raised again here.
+	"""
+	procs = []
+	conns = []
+	for chunk in chunks:
+		recv, send = context.Pipe(duplex=False)
+		p = context.Process(target=worker, args=(func, chunk, send))
+		p.start()
+		send.close()
+		procs.append(p)
+		conns.append(recv)
+	
+	# Receive before joining, so that workers never block on a full pipe
+	results = [ conn.recv() for conn in conns ]
+	for p in procs:
+		p.join()
+	
+	# Raise the error that made the other workers abort, if any
+	errors = [ res for ok, res in results if not ok ]
+	for e in errors:
+		if not isinstance(e, GroupAborted):
+			raise e
+	if errors:
+		raise errors[0]
+	return [ res for ok, res in results ]
+
+
+class Group(object):
+	"""
+	The channels among the 'n' processes forked by fork_group(), as seen by
+	the process 'rank': every process has an inbox queue, where the others
+	put their messages. Sending never blocks (queues have their own feeder
+	thread), so all processes can send before receiving.
+	"""
+	
+	def __init__(self, rank, inboxes):
+		self.rank = rank
+		self.inboxes = inboxes
+		self.n = len(inboxes)
+		self.seq = 0          # Number of exchanges done so far
+		self.pending = {}     # Exchange -> messages received ahead of time
+	
+	def exchange(self, msgs):
+		"""
+		Send msgs[r] to every other process r, and return the list of the
+		messages received from each process (msgs[rank] for this one). It
+		is a barrier: every process of the group must call it.
+		"""
+		seq = self.seq
+		self.seq += 1
+		for r in range(self.n):
+			if r != self.rank:
+				self.inboxes[r].put((seq, self.rank, msgs[r]))
+		got = [ None ] * self.n
+		got[self.rank] = msgs[self.rank]
+		missing = self.n - 1
+		for src, msg in self.pending.pop(seq, []):
+			got[src] = msg
+			missing -= 1
+		while missing:
+			s, src, msg = self.inboxes[self.rank].get()
+			if s is None:
+				raise GroupAborted('process ' + str(src) + ' of the group failed')
+			if s == seq:
+				got[src] = msg
+				missing -= 1
+			else:
+				self.pending.setdefault(s, []).append((src, msg))
+		return got
+	
+	def abort(self):
+		"""
+		Make the exchanges of all other processes fail.
+		"""
+		for r in range(self.n):
+			if r != self.rank:
+				self.inboxes[r].put((None, self.rank, None))
+
+
+def fork_group(func, n):
+	"""
+	Fork 'n' worker processes, each running func(rank, group) where 'group'
+	is its Group, and return the list of their results. If a worker raises
+	an exception, the others are aborted and it is raised again here.
+	"""
+	inboxes = [ context.Queue() for r in range(n) ]
+	
+	def run(rank):
+		group = Group(rank, inboxes)
+		try:
+			return func(rank, group)
+		except GroupAborted:
+			raise
+		except Exception:
+			group.abort()
+			raise
+	
+	return fork_map(run, list(range(n)))
@@ -169,6 +169,22 @@ def pram_tournament_erew(query):
 	print (b)
 	return json.dumps({'input': str(vector_to_sort[1:]), 'result': str(b[1:])})
 
+def pram_merge_sort(query):
+	try:
+		vector_to_sort = [None] + eval(query.get('a')[0])
+	except:
+		try:
+			nn = int(eval(query.get('a')[0][7: query.get('a')[0].find(')')]))
+			vector_to_sort = [None] + [ random.randint(-10000,10000) for i in range(nn) ]
+		except:
+			raise Exception('"a" must be a vector of integers, or the string "random(n)" with "n" positive integer')
+	n = len(vector_to_sort) - 1
+	pram = MyPRAM({'a': vector_to_sort})
+	print ('Executing MERGE_SORT_CREW on ' + str(n) + ' elements...')
+	b = pram.MERGE_SORT_CREW(pram['a'], n)
+	print (b)
+	return json.dumps({'input': str(vector_to_sort[1:]), 'result': str(b[1:])})
+
 def hyper_sum(query):
 	propagate = eval(query.get('propagate')[0])
 	a = eval(query.get('a')[0])
@@ -438,6 +454,9 @@ class Router:
 		if path == '/pram/tournament_erew':
 			return view_template('templates/pram/tournament_erew.html',
 				get_algorithm('algorithms/PRAM.pysal.py', 'TOURNAMENT_SORT_EREW'))
+		if path == '/pram/merge_sort':
+			return view_template('templates/pram/merge_sort.html',
+				get_algorithm('algorithms/PRAM.pysal.py', 'MERGE_SORT_CREW'))
 		
 		if path == '/hyper':
 			return view_template('templates/hyper/hyper.html')
@@ -484,6 +503,8 @@ class Router:
 			return execute_query(pram_tournament_crew, query)
 		if path == '/pram/tournament_erew/exec':
 			return execute_query(pram_tournament_erew, query)
+		if path == '/pram/merge_sort/exec':
+			return execute_query(pram_merge_sort, query)
 		if path == '/hyper/sum/exec':
 			return execute_query(hyper_sum, query)
 		if path == '/hyper/bitonic/exec':